@@ -0,0 +1,109 @@
+# agents/citation_graph.py
+import threading
+import time
+
+from agents.config import (
+    CITATION_GRAPH_PATH, CITATION_GRAPH_TTL, CITATION_GRAPH_EMPTY_TTL, CITATION_GRAPH_DEPTH, CITATION_GRAPH_MAX_NODES,
+)
+from agents.paper_titles import canonical_title
+from agents.sqlite_worker import SQLiteWorker
+
+
+def title_key(title):
+    """Index key for a paper title."""
+    return canonical_title(title)
+
+
+class CitationGraph:
+    """
+    Persistent store of papers and "cites" edges, indexed by normalized title.
+
+    A paper counts as expanded once its citing papers have been looked up; its
+    edges are then reused until they are older than ``ttl`` seconds, or
+    ``empty_ttl`` seconds when the lookup found no citing papers at all.
+    """
+
+    def __init__(self, path=CITATION_GRAPH_PATH, ttl=CITATION_GRAPH_TTL, empty_ttl=CITATION_GRAPH_EMPTY_TTL):
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        # Queries run on the store's own thread: awaited reads, queued writes
+        self._worker = SQLiteWorker(path, "citation-graph")
+        self._worker.call(_create_tables)
+
+    async def get_citing(self, title):
+        """Return stored citing titles for ``title``, or None if it was never (or too long ago) expanded."""
+        return await self._worker.run(self._select_citing, title_key(title))
+
+    def _select_citing(self, db, key):
+        row = db.execute("SELECT expanded_at FROM papers WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] is None or row[0] < time.time() - self.ttl:
+            return None
+        rows = db.execute(
+            "SELECT papers.title FROM cites JOIN papers ON papers.key = cites.citing "
+            "WHERE cites.cited = ? ORDER BY cites.rowid",
+            (key,),
+        ).fetchall()
+        if not rows and row[0] < time.time() - self.empty_ttl:
+            return None
+        return [title for (title,) in rows]
+
+    def add_citations(self, title, citing_titles):
+        """
+        Record that ``citing_titles`` cite ``title`` and mark ``title`` as expanded, even
+        with none. The write is queued; later reads see it.
+        """
+        self._worker.submit(_store_citations, title, list(citing_titles), time.time())
+
+    def flush(self):
+        """Block until queued writes are committed."""
+        self._worker.flush()
+
+    def stats(self):
+        """Paper and edge counts; blocks on the store, so async callers run it in a thread."""
+        return self._worker.call(_count_rows)
+
+
+def _create_tables(db):
+    db.execute("CREATE TABLE IF NOT EXISTS papers (key TEXT PRIMARY KEY, title TEXT NOT NULL, expanded_at REAL)")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS cites (cited TEXT NOT NULL, citing TEXT NOT NULL, PRIMARY KEY (cited, citing))"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS cites_citing ON cites (citing)")
+    db.commit()
+
+
+def _store_citations(db, title, citing_titles, now):
+    key = title_key(title)
+    db.execute(
+        "INSERT INTO papers (key, title, expanded_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET expanded_at = excluded.expanded_at",
+        (key, title, now),
+    )
+    # A fresh lookup replaces the old edge set
+    db.execute("DELETE FROM cites WHERE cited = ?", (key,))
+    for citing_title in citing_titles:
+        citing_key = title_key(citing_title)
+        if citing_key == key:
+            continue
+        db.execute("INSERT OR IGNORE INTO papers (key, title) VALUES (?, ?)", (citing_key, citing_title))
+        db.execute("INSERT OR IGNORE INTO cites (cited, citing) VALUES (?, ?)", (key, citing_key))
+
+
+def _count_rows(db):
+    papers = db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+    expanded = db.execute("SELECT COUNT(*) FROM papers WHERE expanded_at IS NOT NULL").fetchone()[0]
+    edges = db.execute("SELECT COUNT(*) FROM cites").fetchone()[0]
+    return {"papers": papers, "expanded_papers": expanded, "edges": edges}
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_citation_graph():
+    """Return the process-wide citation graph store."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = CitationGraph()
+        return _graph
@@ -1,110 +1,500 @@
 # agents/citation_propagator.py
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-
-# Load environment variables (ignore if .env file doesn't exist)
-try:
-    load_dotenv(override=True)
-except Exception:
-    pass  # Ignore errors loading .env file
-
-# Get API key from environment variable
-PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-if not PERPLEXITY_API_KEY:
-    raise ValueError("PERPLEXITY_API_KEY environment variable is not set. Please set it in your .env file.")
-
-def propagate_citations(contradicted_papers):
-    """For each contradicted paper, find recent papers or articles citing it using Perplexity web search."""
-    print(f"🔍 Citation Agent: Received {len(contradicted_papers) if contradicted_papers else 0} papers")
-    print(f"🔍 Citation Agent: Papers data: {contradicted_papers}")
-    
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from agents.config import CITATION_MAX_CONCURRENCY, CITATION_TIMEOUT, CITATION_BATCH_SIZE
+from agents.citation_graph import CITATION_GRAPH_DEPTH, CITATION_GRAPH_MAX_NODES, get_citation_graph
+from agents.llm_cache import get_cache, make_key
+from agents.paper_titles import TitleIndex, dedupe_titles, same_paper
+from agents.perplexity_client import run_sync
+from agents.structured_output import (
+    BATCH_CITATIONS_SCHEMA, CITATIONS_SCHEMA, completion_options, parse_json_array, record_parse,
+)
+from agents.upstream import UpstreamError, create_chat_completion
+from agents.singleflight import get_group
+from agents.telemetry import register_stats
+
+logger = logging.getLogger(__name__)
+
+# Craft a prompt to find papers/articles citing a specific work
+SYSTEM_PROMPT = (
+    "You are an expert scientific researcher. Find academic papers, articles, or publications that explicitly cite, reference, or build upon the following published work. Focus on papers that mention this work in their references, citations, or related work sections. Only include papers that actually cite or reference the target paper, not the target paper itself. Respond with JSON only, in exactly this shape: {\"citing_papers\": [\"Paper Title\", \"Paper Title\"]}"
+)
+
+
+# Batched variant: several works per request, answered under numbered headings
+BATCH_SYSTEM_PROMPT = (
+    "You are an expert scientific researcher. For each numbered published work below, find academic papers, articles, or publications that explicitly cite, reference, or build upon it. "
+    "Only include papers that actually cite or reference the numbered work, not the work itself. "
+    "Answer every work, using an empty list when you find none. Respond with JSON only, in exactly this shape:\n"
+    '{"works": [{"number": 1, "citing_papers": ["Paper Title", "Paper Title"]}, {"number": 2, "citing_papers": []}]}'
+)
+
+_BATCH_HEADING_RE = re.compile(r"^\W*PAPER\s+(\d+)\b", re.IGNORECASE | re.MULTILINE)
+
+
+class _CitationCallStats:
+    """Round trips, tokens and latency per lookup mode, for comparing batched against per-paper lookups."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {
+            mode: {"round_trips": 0, "papers": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+            for mode in ("single", "batch")
+        }
+        self.batch_answered = 0
+        self.batch_fallbacks = 0
+
+    def record(self, mode, papers, seconds, response):
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            counters = self._modes[mode]
+            counters["round_trips"] += 1
+            counters["papers"] += papers
+            counters["seconds"] += seconds
+            counters["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            counters["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def record_batch_outcome(self, answered, fallbacks):
+        with self._lock:
+            self.batch_answered += answered
+            self.batch_fallbacks += fallbacks
+
+    def snapshot(self):
+        with self._lock:
+            modes = {}
+            for mode, counters in self._modes.items():
+                papers = counters["papers"]
+                trips = counters["round_trips"]
+                tokens = counters["prompt_tokens"] + counters["completion_tokens"]
+                modes[mode] = dict(
+                    counters,
+                    seconds=round(counters["seconds"], 3),
+                    avg_latency=round(counters["seconds"] / trips, 3) if trips else 0.0,
+                    tokens_per_paper=round(tokens / papers, 1) if papers else 0.0,
+                    round_trips_per_paper=round(trips / papers, 3) if papers else 0.0,
+                )
+            return dict(
+                modes,
+                batch_size=CITATION_BATCH_SIZE,
+                batch_answered=self.batch_answered,
+                batch_fallbacks=self.batch_fallbacks,
+            )
+
+
+_call_stats = _CitationCallStats()
+
+
+def citation_stats():
+    """Report citation lookup round trips, tokens and latency for per-paper and batched mode."""
+    return _call_stats.snapshot()
+
+
+register_stats("citations", citation_stats)
+
+
+def _filter_citing_titles(titles, paper_title):
+    """Drop non-titles, the searched paper itself, and near-duplicate repeats."""
+    citing_papers = [
+        title.strip() for title in titles
+        if isinstance(title, str) and len(title.strip()) > 10 and not same_paper(title.strip(), paper_title)
+    ]
+    return dedupe_titles(citing_papers)
+
+
+def _parse_citing_papers(content, paper_title, stage="citations"):
+    """
+    Return the citing titles in a citation search response, minus the paper itself;
+    None when the response could not be parsed, as opposed to listing no papers.
+    """
+    items = parse_json_array(content, "citing_papers")
+    if items is not None:
+        record_parse(stage, "json")
+        return _filter_citing_titles(items, paper_title)
+
+    citing_papers = _parse_text_citing_papers(content, paper_title)
+    record_parse(stage, "text_fallback" if citing_papers else "failed")
+    return citing_papers or None
+
+
+def _parse_text_citing_papers(content, paper_title):
+    """Fallback parser: pull the **"Title"** entries out of a free-text response."""
+    titles = []
+    if content:
+        # Simple parsing - look for **"Title"** format
+        lines = content.strip().split("\n")
+        for line in lines:
+            line = line.strip()
+            if '**"' in line and '"**' in line:
+                start = line.find('**"') + 3
+                end = line.find('"**', start)
+                if start > 2 and end > start:
+                    titles.append(line[start:end])
+
+    # Drops the paper being searched for itself and near-duplicate repeats
+    return _filter_citing_titles(titles, paper_title)
+
+
+def _parse_batch_response(content, paper_titles):
+    """Split a batched answer into ``{paper_title: citing_titles}`` by work number."""
+    results = {}
+    works = parse_json_array(content, "works")
+    for work in works or []:
+        if not isinstance(work, dict) or not isinstance(work.get("number"), int):
+            continue
+        index = work["number"] - 1
+        if 0 <= index < len(paper_titles) and paper_titles[index] not in results:
+            citing_papers = _filter_citing_titles(work.get("citing_papers") or [], paper_titles[index])
+            if citing_papers:
+                results[paper_titles[index]] = citing_papers
+    if works is not None:
+        record_parse("citations_batch", "json")
+        return results
+
+    # Fallback: free text under numbered PAPER headings
+    matches = list(_BATCH_HEADING_RE.finditer(content or ""))
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        if not 0 <= index < len(paper_titles) or paper_titles[index] in results:
+            continue
+        section = content[match.end():next_match.start() if next_match else len(content)]
+        citing_papers = _parse_text_citing_papers(section, paper_titles[index])
+        if citing_papers:
+            results[paper_titles[index]] = citing_papers
+    record_parse("citations_batch", "text_fallback" if results else "failed")
+    return results
+
+
+def _single_cache_key(paper_title):
+    user_prompt = f"Find papers citing: {paper_title}"
+    return user_prompt, make_key("sonar", SYSTEM_PROMPT, 0.2, user_prompt)
+
+
+def _record_citations(paper_title, citing_papers):
+    """
+    Make a successful lookup reusable: cache it as a per-paper answer and store its edges.
+    An empty answer is only kept in the graph, which re-checks it after a shorter TTL.
+    """
+    if citing_papers:
+        get_cache().set("citations", _single_cache_key(paper_title)[1], citing_papers)
+    get_citation_graph().add_citations(paper_title, citing_papers)
+
+
+async def _lookup_stored(paper_title):
+    """Citing titles already known from the graph store or the response cache, or None."""
+    # Edges stored by earlier requests make the search unnecessary
+    stored = await get_citation_graph().get_citing(paper_title)
+    if stored is not None:
+        return stored
+    return await get_cache().get("citations", _single_cache_key(paper_title)[1])
+
+
+async def find_citing_papers_async(paper_title, timeout=None):
+    """Run one citation search for a single paper title and return the unique citing titles."""
+    stored = await _lookup_stored(paper_title)
+    if stored is not None:
+        return stored
+
+    timeout = timeout or CITATION_TIMEOUT
+    user_prompt, cache_key = _single_cache_key(paper_title)
+
+    # Concurrent requests for the same paper share one upstream search
+    return await get_group("citations").do(
+        cache_key, lambda: _search_citing_papers(paper_title, user_prompt, timeout)
+    )
+
+
+async def _search_citing_papers(paper_title, user_prompt, timeout):
+    try:
+        logger.info("🔍 Citation Agent: Searching citations for: %s", paper_title)
+        # Use same cheap model as agent 1
+        started_at = time.monotonic()
+        response = await asyncio.wait_for(
+            create_chat_completion(
+                stage="citations",
+                model="sonar",  # Use same model as contradiction detector
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.2,
+                **completion_options(CITATIONS_SCHEMA),
+            ),
+            timeout=timeout,
+        )
+        _call_stats.record("single", 1, time.monotonic() - started_at, response)
+
+        # Parse the results—these are actual web-search-derived citations
+        citing_papers = []
+        if response.choices and len(response.choices) > 0:
+            content = response.choices[0].message.content
+            logger.debug("🔍 Citation Agent: Response content for %s: %.300s", paper_title, content or "")
+            citing_papers = _parse_citing_papers(content, paper_title)
+
+            if citing_papers is None:
+                # Unparseable, not "none found": don't remember it, so the next request searches again
+                logger.warning("⚠️ Could not parse the citation search for: %s", paper_title)
+                citing_papers = []
+            elif citing_papers:
+                logger.info("✅ Found %d citing papers for %s", len(citing_papers), paper_title)
+                logger.debug("Citing papers for %s: %s", paper_title, citing_papers)
+                _record_citations(paper_title, citing_papers)
+            else:
+                logger.warning("⚠️ No citing papers found for: %s", paper_title)
+                _record_citations(paper_title, citing_papers)
+
+        return citing_papers
+
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ Citation search timed out after %ss for '%s'", timeout, paper_title)
+        return []
+    except UpstreamError:
+        raise
+    except Exception as e:
+        logger.error("⚠️ Error processing paper '%s': %r", paper_title, e)
+        return []
+
+
+async def _search_citing_papers_batch(paper_titles, timeout):
+    """One request for several papers; returns ``{paper_title: citing_titles}`` for the papers it answered."""
+    user_prompt = "Find papers citing each of these works:\n" + "\n".join(
+        f"PAPER {number}: {title}" for number, title in enumerate(paper_titles, 1)
+    )
+    try:
+        logger.info("🔍 Citation Agent: Searching citations for %d papers in one request", len(paper_titles))
+        started_at = time.monotonic()
+        response = await asyncio.wait_for(
+            create_chat_completion(
+                stage="citations_batch",
+                model="sonar",
+                messages=[
+                    {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.2,
+                **completion_options(BATCH_CITATIONS_SCHEMA),
+            ),
+            timeout=timeout,
+        )
+        _call_stats.record("batch", len(paper_titles), time.monotonic() - started_at, response)
+        if not response.choices:
+            return {}
+        results = _parse_batch_response(response.choices[0].message.content, paper_titles)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ Batched citation search timed out after %ss", timeout)
+        return {}
+    except UpstreamError:
+        raise
+    except Exception as e:
+        logger.error("⚠️ Error in batched citation search: %s", e)
+        return {}
+
+    for paper_title, citing_papers in results.items():
+        _record_citations(paper_title, citing_papers)
+    return results
+
+
+async def _iter_batched_citations(paper_titles, batch_size, semaphore, timeout):
+    """
+    Yield ``(paper_title, citing_papers)`` using batched requests of up to ``batch_size``
+    papers. Papers a batch answer leaves out are retried with a per-paper search.
+    """
+    pending = []
+    for paper_title in paper_titles:
+        stored = await _lookup_stored(paper_title)
+        if stored is not None:
+            yield paper_title, stored
+        else:
+            pending.append(paper_title)
+
+    async def single(paper_title):
+        async with semaphore:
+            return paper_title, await find_citing_papers_async(paper_title, timeout)
+
+    async def batch(chunk):
+        async with semaphore:
+            found = await _search_citing_papers_batch(chunk, timeout or CITATION_TIMEOUT)
+        missed = [title for title in chunk if title not in found]
+        _call_stats.record_batch_outcome(len(found), len(missed))
+        # The semaphore is released first so fallbacks can't deadlock against their own batch
+        fallbacks = await asyncio.gather(*(single(title) for title in missed))
+        return list(found.items()) + fallbacks
+
+    tasks = [
+        asyncio.ensure_future(batch(pending[start:start + batch_size]))
+        for start in range(0, len(pending), batch_size)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for pair in await next_done:
+                yield pair
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def collect_paper_titles(contradicted_papers):
+    """Return the paper titles to search, keeping input order and skipping near-duplicate repeats."""
+    paper_titles = []
+    index = TitleIndex()
+    for paper in contradicted_papers:
+        # Validate paper structure
+        if not isinstance(paper, dict) or "title" not in paper:
+            continue
+
+        paper_title = paper.get("title", "").strip()
+        if not paper_title or not index.add(paper_title)[1]:
+            continue
+
+        paper_titles.append(paper_title)
+    return paper_titles
+
+
+async def iter_citations_async(contradicted_papers, max_concurrency=None, timeout=None, batch_size=None):
+    """
+    Yield ``(paper_title, citing_papers)`` pairs in completion order, so callers can
+    show each paper's cascade as soon as its lookup resolves.
+
+    With ``batch_size`` (default CITATION_BATCH_SIZE) above 1, papers are looked up
+    several per request instead of one request each.
+    """
+    if not contradicted_papers or not isinstance(contradicted_papers, list):
+        return
+
+    async for pair in _iter_lookups(collect_paper_titles(contradicted_papers), max_concurrency, timeout, batch_size):
+        yield pair
+
+
+async def _iter_lookups(paper_titles, max_concurrency=None, timeout=None, batch_size=None):
+    """Look up citing papers for already deduplicated titles, yielding pairs in completion order."""
+    if not paper_titles:
+        return
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or CITATION_MAX_CONCURRENCY))
+    batch_size = CITATION_BATCH_SIZE if batch_size is None else batch_size
+    if batch_size > 1 and len(paper_titles) > 1:
+        async for pair in _iter_batched_citations(paper_titles, batch_size, semaphore, timeout):
+            yield pair
+        return
+
+    async def lookup(paper_title):
+        async with semaphore:
+            return paper_title, await find_citing_papers_async(paper_title, timeout)
+
+    tasks = [asyncio.ensure_future(lookup(title)) for title in paper_titles]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer may stop early; don't leave lookups running in the background
+        for task in tasks:
+            task.cancel()
+
+
+async def propagate_citations_async(contradicted_papers, max_concurrency=None, timeout=None, batch_size=None):
+    """
+    For each contradicted paper, find recent papers or articles citing it using Perplexity web search.
+
+    Lookups run concurrently (at most ``max_concurrency`` at a time, each bounded by
+    ``timeout`` seconds). The result keeps the input order of the papers, and a paper
+    whose lookup times out maps to an empty list. UpstreamError is raised if
+    Perplexity stays unavailable through retries.
+    """
+    logger.info("🔍 Citation Agent: Received %d papers", len(contradicted_papers) if contradicted_papers else 0)
+    # Lazy %-formatting: the payload is only rendered when DEBUG is on
+    logger.debug("🔍 Citation Agent: Papers data: %s", contradicted_papers)
+
     # Input validation
     if not contradicted_papers or not isinstance(contradicted_papers, list) or len(contradicted_papers) == 0:
-        print("🔍 Citation Agent: No valid papers received")
+        logger.info("🔍 Citation Agent: No valid papers received")
         return {}
     
-
     try:
-        client = OpenAI(api_key=PERPLEXITY_API_KEY, base_url="https://api.perplexity.ai")
-        citation_cascades = {}
-
-        for paper in contradicted_papers:
-            # Validate paper structure
-            if not isinstance(paper, dict) or "title" not in paper:
-                continue
-                
-            paper_title = paper.get("title", "").strip()
-            if not paper_title:
-                continue
-                
-            # Craft a prompt to find papers/articles citing this specific work
-            SYSTEM_PROMPT = (
-                "You are an expert scientific researcher. Find academic papers, articles, or publications that explicitly cite, reference, or build upon the following published work. Focus on papers that mention this work in their references, citations, or related work sections. For each citing paper, provide the title in this format: **\"Paper Title\"**. Only include papers that actually cite or reference the target paper, not the target paper itself."
-            )
+        results = {}
+        async for paper_title, citing_papers in iter_citations_async(
+            contradicted_papers, max_concurrency, timeout, batch_size
+        ):
+            results[paper_title] = citing_papers
 
-            try:
-                print(f"🔍 Citation Agent: Searching citations for: {paper_title}")
-                # Use same cheap model as agent 1
-                response = client.chat.completions.create(
-                    model="sonar",  # Use same model as contradiction detector
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": f"Find papers citing: {paper_title}"},
-                    ],
-                    temperature=0.2,
-                )
-                print(f"🔍 Citation Agent: Got response for {paper_title}")
+        # Restore input order
+        return {title: results[title] for title in collect_paper_titles(contradicted_papers) if title in results}
 
-                # Parse the results—these are actual web-search-derived citations
-                citing_papers = []
-                if response.choices and len(response.choices) > 0:
-                    content = response.choices[0].message.content
-                    print(f"🔍 Citation Agent: Response content for {paper_title}: {content[:300]}...")
-                    if content:
-                        # Simple parsing - look for **"Title"** format
-                        lines = content.strip().split("\n")
-                        for line in lines:
-                            line = line.strip()
-                            
-                            # Look for **"Title"** format but exclude the paper being searched for
-                            if '**"' in line and '"**' in line:
-                                start = line.find('**"') + 3
-                                end = line.find('"**', start)
-                                if start > 2 and end > start:
-                                    title = line[start:end].strip()
-                                    # Don't include the paper being searched for itself
-                                    if (title and len(title) > 10 and 
-                                        title.lower() not in paper_title.lower() and
-                                        paper_title.lower() not in title.lower()):
-                                        citing_papers.append(title)
-                    
-                    # Debug: show what papers were found
-                    if citing_papers:
-                        print(f"✅ Found {len(citing_papers)} citing papers for {paper_title}: {citing_papers[:3]}")
-                    else:
-                        print(f"⚠️ No citing papers found for: {paper_title}")
-
-                # Remove duplicates from citing papers
-                unique_citing_papers = []
-                seen_papers = set()
-                for paper in citing_papers:
-                    paper_lower = paper.lower().strip()
-                    if paper_lower not in seen_papers:
-                        seen_papers.add(paper_lower)
-                        unique_citing_papers.append(paper)
-                
-                citation_cascades[paper_title] = unique_citing_papers
-                
-            except Exception as e:
-                print(f"⚠️ Error processing paper '{paper_title}': {str(e)}")
-                print(f"⚠️ Error type: {type(e)}")
-                print(f"⚠️ Full error details: {repr(e)}")
-                citation_cascades[paper_title] = []
-
-        return citation_cascades
-        
+    except UpstreamError:
+        raise
     except Exception as e:
-        print(f"Error in propagate_citations: {str(e)}")
+        logger.error("Error in propagate_citations: %s", e)
         return {}
 
+
+async def expand_cascade_async(
+    root_titles, depth=None, max_nodes=None, max_concurrency=None, timeout=None, batch_size=None
+):
+    """
+    Build a multi-hop citation cascade by breadth-first search from ``root_titles``.
+
+    Each level's frontier is expanded concurrently (batched when ``batch_size`` is
+    above 1), every paper is visited at most once, and papers whose citing edges
+    are already stored cost no upstream call.
+    The cascade stops at ``depth`` hops or once it holds ``max_nodes`` papers.
+    """
+    depth = CITATION_GRAPH_DEPTH if depth is None else depth
+    max_nodes = max_nodes or CITATION_GRAPH_MAX_NODES
+    graph = get_citation_graph()
+
+    nodes = []
+    edges = []
+    visited = TitleIndex()
+    for title in root_titles:
+        if len(nodes) < max_nodes and title.strip() and visited.add(title)[1]:
+            nodes.append({"title": title, "depth": 0})
+    frontier = [node["title"] for node in nodes]
+    stored_hits = 0
+    lookups = 0
+
+    for level in range(1, depth + 1):
+        # Once the budget is spent, deeper lookups could only add edges to papers we drop
+        if not frontier or len(nodes) >= max_nodes:
+            break
+
+        expanded = {}
+        to_search = []
+        stored_citing = await asyncio.gather(*(graph.get_citing(title) for title in frontier))
+        for title, stored in zip(frontier, stored_citing):
+            if stored is not None:
+                expanded[title] = stored
+            else:
+                to_search.append(title)
+        stored_hits += len(expanded)
+        lookups += len(to_search)
+        async for title, citing_titles in _iter_lookups(to_search, max_concurrency, timeout, batch_size):
+            expanded[title] = citing_titles
+        results = [expanded.get(title, []) for title in frontier]
+
+        next_frontier = []
+        for cited_title, citing_titles in zip(frontier, results):
+            for citing_title in citing_titles:
+                known = visited.find(citing_title)
+                if known is None:
+                    if len(nodes) >= max_nodes:
+                        continue
+                    known = visited.add(citing_title)[0]
+                    nodes.append({"title": known, "depth": level})
+                    next_frontier.append(known)
+                # Edges point at the spelling the node was first seen under
+                edges.append({"citing": known, "cited": cited_title})
+        frontier = next_frontier
+
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "stored_expansions": stored_hits,
+        "searched_expansions": lookups,
+    }
+
+
+def propagate_citations(contradicted_papers, max_concurrency=None, timeout=None, batch_size=None):
+    """Blocking wrapper around propagate_citations_async for synchronous callers."""
+    return run_sync(propagate_citations_async(contradicted_papers, max_concurrency, timeout, batch_size))
@@ -0,0 +1,283 @@
+# agents/claim_index.py
+import collections
+import itertools
+import json
+import math
+import re
+import threading
+import time
+
+from agents.config import CLAIM_INDEX_ENABLED, CLAIM_INDEX_PATH, CLAIM_MATCH_THRESHOLD, CLAIM_INDEX_MAX_ENTRIES
+from agents.llm_cache import STAGE_TTLS, normalize_input
+from agents.sqlite_worker import SQLiteWorker
+from agents.telemetry import register_stats
+
+# Stored results age out on the same schedule as exact cache hits
+CLAIM_INDEX_TTL = STAGE_TTLS["contradictions"]
+
+# Past claims scored exactly per lookup, taken from those sharing the most terms
+MAX_CANDIDATES = 50
+LATENCY_SAMPLES = 1000
+# Claims assumed to share no terms with anything, added to the document count for IDF
+IDF_PRIOR_DOCUMENTS = 100
+
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_NEGATIONS = frozenset(["not", "no", "never", "none", "neither", "nor", "without", "cannot"])
+_STOPWORDS = frozenset(
+    "a an the and or of to in on at by for with from as is are was were be been being that this these those "
+    "it its than then into over under about between which while can could should would may might will shall "
+    "does did do has have had also such very".split()
+    # Hedges and units around a number; the number itself is compared separately
+    + "approximately approx roughly around nearly almost percent".split()
+)
+_SUFFIXES = ("ing", "ed", "es", "s", "ly")
+# Stems of verbs that only state a direction; "improves" and "increases" state the same one
+_DIRECTION_STEMS = {
+    **dict.fromkeys(["increas", "improv", "rais", "boost", "enhanc", "elevat", "amplif"], "increase"),
+    **dict.fromkeys(["decreas", "reduc", "lower", "diminish", "declin", "worsen"], "decrease"),
+}
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def _direction(stem):
+    return _DIRECTION_STEMS.get(stem[:-1] if stem.endswith("e") else stem)
+
+
+def _number(token):
+    # "20", "20.0" and "~20%" state the same number
+    return format(float(token), "g")
+
+
+def claim_terms(claim):
+    """
+    Return ``(term_counts, numbers, negated, directions)`` for a claim. Numbers,
+    negation and direction verbs are kept apart from the terms: "by 20%" vs "by 30%",
+    "improves" vs "does not improve" or "increases" vs "reduces" share almost every
+    term but are different claims. Directions are folded, so "increases Y by ~20%"
+    and "improves Y by 20%" match.
+    """
+    text = normalize_input(claim).replace("n't", " not")
+    terms = collections.Counter()
+    directions = []
+    negations = 0
+    for token in _TOKEN_RE.findall(text):
+        if token in _NEGATIONS:
+            negations += 1
+        elif token not in _STOPWORDS and not _NUMBER_RE.fullmatch(token):
+            stem = _stem(token)
+            direction = _direction(stem)
+            if direction:
+                directions.append(direction)
+            else:
+                terms[stem] += 1
+    numbers = tuple(sorted({_number(token) for token in _NUMBER_RE.findall(text)}))
+    return terms, numbers, negations % 2 == 1, tuple(directions)
+
+
+class ClaimIndex:
+    """
+    Similarity index over past claims and their detected contradictions.
+
+    Claims are compared by TF-IDF cosine similarity over stemmed terms, looked up
+    through an inverted index, so only past claims sharing terms with the new one
+    are scored. Lookups only touch memory; entries are written to SQLite on the
+    store's worker thread and reloaded at startup.
+    """
+
+    def __init__(self, path=CLAIM_INDEX_PATH, threshold=None, max_entries=CLAIM_INDEX_MAX_ENTRIES, ttl=CLAIM_INDEX_TTL):
+        self.threshold = CLAIM_MATCH_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # id -> entry, oldest first
+        self._by_key = {}  # normalized claim -> id
+        self._postings = collections.defaultdict(set)  # term -> ids
+        self._ids = itertools.count()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {"hits": 0, "misses": 0, "stored": 0}
+
+        self._worker = SQLiteWorker(path, "claim-index")
+        for key, claim, results, created_at in self._worker.call(self._load):
+            self._insert(key, claim, results, created_at)
+
+    def _load(self, db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, claim TEXT NOT NULL, "
+            "results TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        db.execute("DELETE FROM claims WHERE created_at <= ?", (time.time() - self.ttl,))
+        db.commit()
+        rows = db.execute(
+            "SELECT key, claim, results, created_at FROM claims ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        return rows[::-1]
+
+    def _insert(self, key, claim, raw_results, created_at):
+        # Caller holds the lock (or is the constructor)
+        old = self._by_key.pop(key, None)
+        if old is not None:
+            self._remove(old)
+        terms, numbers, negated, directions = claim_terms(claim)
+        entry_id = next(self._ids)
+        self._entries[entry_id] = {
+            "key": key,
+            "claim": claim,
+            "terms": terms,
+            "numbers": numbers,
+            "negated": negated,
+            "directions": directions,
+            "results": raw_results,
+            "created_at": created_at,
+        }
+        self._by_key[key] = entry_id
+        for term in terms:
+            self._postings[term].add(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for term in entry["terms"]:
+            ids = self._postings[term]
+            ids.discard(entry_id)
+            if not ids:
+                del self._postings[term]
+        if self._by_key.get(entry["key"]) == entry_id:
+            del self._by_key[entry["key"]]
+
+    def _weights(self, terms):
+        # Smoothed IDF; the pseudo-documents keep a young index from treating every term as rare
+        total = len(self._entries) + IDF_PRIOR_DOCUMENTS + 1
+        return {
+            term: count * (math.log(total / (len(self._postings.get(term, ())) + 1)) + 1)
+            for term, count in terms.items()
+        }
+
+    def lookup(self, claim):
+        """
+        Return ``(similar_claim, results, similarity)`` for the most similar stored
+        claim at or above the threshold, or None.
+        """
+        started = time.perf_counter()
+        terms, numbers, negated, directions = claim_terms(claim)
+        best = None
+        with self._lock:
+            shared = collections.Counter()
+            for term in terms:
+                for entry_id in self._postings.get(term, ()):
+                    shared[entry_id] += 1
+            if shared:
+                query = self._weights(terms)
+                query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+                expired_before = time.time() - self.ttl
+                best_score = self.threshold
+                for entry_id, _ in shared.most_common(MAX_CANDIDATES):
+                    entry = self._entries[entry_id]
+                    if (
+                        entry["numbers"] != numbers
+                        or entry["negated"] != negated
+                        or entry["directions"] != directions
+                        or entry["created_at"] <= expired_before
+                    ):
+                        continue
+                    weights = self._weights(entry["terms"])
+                    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+                    dot = sum(weight * weights.get(term, 0.0) for term, weight in query.items())
+                    score = dot / (query_norm * norm) if query_norm and norm else 0.0
+                    if score >= best_score:
+                        best, best_score = entry, score
+            self._counters["hits" if best else "misses"] += 1
+            self._latencies.append(time.perf_counter() - started)
+            if best is None:
+                return None
+            # Results are kept serialised so callers never share a mutable list
+            return best["claim"], json.loads(best["results"]), round(best_score, 3)
+
+    def add(self, claim, results):
+        """
+        Store ``claim`` with its contradictions, replacing an earlier entry for the same
+        claim. It is searchable at once; the disk write is queued.
+        """
+        key = normalize_input(claim)
+        if not key:
+            return
+        raw = json.dumps(results)
+        now = time.time()
+        with self._lock:
+            self._insert(key, claim, raw, now)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                evicted.append(self._entries[oldest]["key"])
+                self._remove(oldest)
+            self._counters["stored"] += 1
+            # Queued under the lock so the disk sees adds in the same order as memory
+            self._worker.submit(_store_claim, key, claim, raw, now, evicted)
+
+    def flush(self):
+        """Block until queued disk writes are committed."""
+        self._worker.flush()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return dict(
+            counters,
+            hit_rate=round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            entries=entries,
+            threshold=self.threshold,
+            lookup_ms_avg=round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            lookup_ms_p95=round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0,
+        )
+
+
+def _store_claim(db, key, claim, raw_results, created_at, evicted_keys):
+    db.execute(
+        "INSERT OR REPLACE INTO claims (key, claim, results, created_at) VALUES (?, ?, ?, ?)",
+        (key, claim, raw_results, created_at),
+    )
+    db.executemany("DELETE FROM claims WHERE key = ?", [(evicted,) for evicted in evicted_keys])
+
+
+class _NullClaimIndex:
+    """Stand-in used when CLAIM_INDEX_ENABLED=0."""
+
+    def lookup(self, claim):
+        return None
+
+    def add(self, claim, results):
+        pass
+
+    def flush(self):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_claim_index():
+    """Return the process-wide claim index, loading stored claims on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ClaimIndex() if CLAIM_INDEX_ENABLED else _NullClaimIndex()
+        return _index
+
+
+def claim_index_stats():
+    return get_claim_index().stats()
+
+
+register_stats("claim_index", claim_index_stats)
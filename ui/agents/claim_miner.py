@@ -0,0 +1,131 @@
+# agents/claim_miner.py
+import math
+import re
+from collections import Counter
+
+from agents.config import CLAIM_MINING_MIN_CHARS, CLAIM_MINING_TOP_K
+
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 400
+
+# Phrases that usually introduce a finding rather than background or method
+CLAIM_CUES = (
+    "we show", "we find", "we found", "we demonstrate", "we report", "we observe", "we propose",
+    "our results", "results show", "results indicate", "results suggest", "findings", "this study shows",
+    "significantly", "outperform", "improve", "increase", "decrease", "reduce", "associated with",
+    "leads to", "led to", "causes", "predicts", "correlat", "effective", "evidence that", "suggest that",
+    "conclude", "in contrast to", "higher than", "lower than",
+)
+HEDGES = ("may ", "might ", "could ", "possibly", "future work", "we thank", "acknowledg")
+
+SECTION_WEIGHTS = {
+    "abstract": 1.5,
+    "conclusion": 1.4,
+    "conclusions": 1.4,
+    "results": 1.3,
+    "discussion": 1.2,
+    "summary": 1.3,
+    "introduction": 0.8,
+    "background": 0.6,
+    "related work": 0.4,
+    "methods": 0.5,
+    "materials and methods": 0.5,
+    "methodology": 0.5,
+}
+# Nothing after these headings is worth mining
+STOP_SECTIONS = ("references", "bibliography", "acknowledgements", "acknowledgments", "appendix")
+
+_HEADING_RE = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?\s+|[IVX]+\.\s+)?([A-Za-z][A-Za-z &]{2,40})\s*:?\s*$")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z(\"'])")
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9\-]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:%|percent|fold|x\b)|p\s*[<=]\s*0?\.\d+")
+_CITATION_RE = re.compile(r"\[\d+(?:[,\-–]\s*\d+)*\]|\([A-Z][a-z]+ et al\.,? \d{4}\)")
+
+STOPWORDS = frozenset(
+    "the a an and or of to in on for with by from as at is are was were be been this that these those "
+    "it its we our their there which who whom than then also not no but into over under between such "
+    "can has have had using used use based".split()
+)
+
+
+def is_long_text(text):
+    return bool(text) and len(text) > CLAIM_MINING_MIN_CHARS
+
+
+def split_sections(text):
+    """Split extracted paper text into ``(section_name, body)`` pairs using heading-like lines."""
+    sections = []
+    name, lines = "body", []
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line)
+        heading = match.group(1).strip().lower() if match else None
+        if heading and (heading in SECTION_WEIGHTS or heading in STOP_SECTIONS):
+            if lines:
+                sections.append((name, " ".join(lines)))
+            if heading in STOP_SECTIONS:
+                return sections
+            name, lines = heading, []
+            continue
+        if line.strip():
+            lines.append(line.strip())
+    if lines:
+        sections.append((name, " ".join(lines)))
+    return sections
+
+
+def _tokens(sentence):
+    return [token for token in _TOKEN_RE.findall(sentence.lower()) if token not in STOPWORDS]
+
+
+def _score(sentence, tokens, idf, section_weight):
+    lowered = sentence.lower()
+    score = sum(1.0 for cue in CLAIM_CUES if cue in lowered)
+    score += 1.5 * len(_NUMBER_RE.findall(lowered))
+    score -= sum(0.75 for hedge in HEDGES if hedge in lowered)
+    score -= 0.5 * len(_CITATION_RE.findall(sentence))
+    # Reward sentences built from terms that are distinctive for this document
+    if tokens:
+        score += sum(idf.get(token, 0.0) for token in set(tokens)) / math.sqrt(len(tokens))
+    return score * section_weight
+
+
+def mine_claims(text, top_k=None):
+    """
+    Return up to ``top_k`` candidate claim sentences from ``text``, best first.
+
+    Sentences are scored locally (claim cue phrases, quantitative results, section,
+    distinctive vocabulary) and near-duplicates are skipped, so no model calls are made.
+    """
+    top_k = top_k or CLAIM_MINING_TOP_K
+    candidates = []
+    for section, body in split_sections(text or ""):
+        weight = SECTION_WEIGHTS.get(section, 1.0)
+        for sentence in _SENTENCE_SPLIT_RE.split(body):
+            sentence = sentence.strip()
+            if MIN_SENTENCE_CHARS <= len(sentence) <= MAX_SENTENCE_CHARS:
+                candidates.append((sentence, _tokens(sentence), weight))
+    if not candidates:
+        return []
+
+    # Sentence-level document frequency gives a cheap IDF
+    document_frequency = Counter(token for _, tokens, _ in candidates for token in set(tokens))
+    total = len(candidates)
+    idf = {token: math.log(total / count) for token, count in document_frequency.items()}
+
+    ranked = sorted(
+        candidates,
+        key=lambda candidate: _score(candidate[0], candidate[1], idf, candidate[2]),
+        reverse=True,
+    )
+
+    chosen, chosen_tokens = [], []
+    for sentence, tokens, _ in ranked:
+        token_set = set(tokens)
+        if any(len(token_set & other) / max(1, len(token_set | other)) > 0.6 for other in chosen_tokens):
+            continue
+        chosen.append(sentence)
+        chosen_tokens.append(token_set)
+        if len(chosen) >= top_k:
+            break
+    return chosen
+
@@ -0,0 +1,148 @@
+# agents/config.py
+"""
+Every setting the agents and backends read from the environment, in one place.
+
+The project's ``.env`` is loaded once, when this module is first imported, and
+variables already set in the environment take precedence over it. Modules import
+their settings from here rather than reading ``os.environ`` or loading ``.env``
+themselves. Keep this module cheap to import: no SDKs, no I/O beyond ``.env``.
+"""
+import os
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+ENV_FILE = os.getenv("CASCADE_ENV_FILE", str(PROJECT_ROOT / ".env"))
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None  # python-dotenv is optional when the environment is set some other way
+if load_dotenv is not None and os.path.exists(ENV_FILE):
+    load_dotenv(ENV_FILE, override=False)
+
+# --- Perplexity API -----------------------------------------------------------------
+
+# Checked when the first request is made, not at import, so tools and tests run without it
+PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY") or None
+# Point at a local stand-in (see bench/mock_perplexity.py) to run without the real API
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+
+# Connection pool tuning; size these against the number of concurrent upstream calls
+POOL_MAX_CONNECTIONS = int(os.getenv("PERPLEXITY_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("PERPLEXITY_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("PERPLEXITY_POOL_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 is used when this is on and the optional `h2` package is installed
+HTTP2_REQUESTED = os.getenv("PERPLEXITY_HTTP2", "1") != "0"
+
+# Request pacing: sustained requests per second and how many may be sent back to back
+UPSTREAM_RATE_LIMIT = float(os.getenv("PERPLEXITY_RATE_LIMIT", "5"))
+UPSTREAM_BURST = int(os.getenv("PERPLEXITY_BURST", "10"))
+# Retries after the first attempt, with full-jitter exponential backoff between them
+UPSTREAM_MAX_RETRIES = int(os.getenv("PERPLEXITY_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("PERPLEXITY_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("PERPLEXITY_BACKOFF_MAX", "20"))
+# Adaptive concurrency window bounds
+UPSTREAM_CONCURRENCY_MIN = int(os.getenv("PERPLEXITY_CONCURRENCY_MIN", "1"))
+UPSTREAM_CONCURRENCY_MAX = int(os.getenv("PERPLEXITY_CONCURRENCY_MAX", str(POOL_MAX_CONNECTIONS)))
+UPSTREAM_CONCURRENCY_INITIAL = int(os.getenv("PERPLEXITY_CONCURRENCY_INITIAL", "8"))
+# Consecutive failed calls that open the circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("PERPLEXITY_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("PERPLEXITY_BREAKER_COOLDOWN", "30"))
+
+# Ask Perplexity for schema-constrained JSON; the prompts still describe the format,
+# so turning this off only drops the response_format parameter
+STRUCTURED_OUTPUT_ENABLED = os.getenv("PERPLEXITY_STRUCTURED_OUTPUT", "1") != "0"
+
+# --- Caches and indexes -------------------------------------------------------------
+
+# Where the on-disk tier lives and how big each tier may grow
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(CACHE_DIR / "llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "20000"))
+# Per-stage time-to-live in seconds; citations change far more slowly than search results
+LLM_CACHE_TTL_CONTRADICTIONS = float(os.getenv("LLM_CACHE_TTL_CONTRADICTIONS", str(6 * 3600)))
+LLM_CACHE_TTL_CITATIONS = float(os.getenv("LLM_CACHE_TTL_CITATIONS", str(7 * 24 * 3600)))
+LLM_CACHE_TTL_SYNTHESIS = float(os.getenv("LLM_CACHE_TTL_SYNTHESIS", str(24 * 3600)))
+
+CLAIM_INDEX_ENABLED = os.getenv("CLAIM_INDEX_ENABLED", "1") != "0"
+CLAIM_INDEX_PATH = os.getenv("CLAIM_INDEX_PATH", str(CACHE_DIR / "claim_index.sqlite3"))
+# Minimum TF-IDF cosine similarity for a past claim's contradictions to be reused
+CLAIM_MATCH_THRESHOLD = float(os.getenv("CLAIM_MATCH_THRESHOLD", "0.8"))
+CLAIM_INDEX_MAX_ENTRIES = int(os.getenv("CLAIM_INDEX_MAX_ENTRIES", "5000"))
+
+CITATION_GRAPH_PATH = os.getenv("CITATION_GRAPH_PATH", str(CACHE_DIR / "citation_graph.sqlite3"))
+# How long a paper's stored citing edges are trusted before it is searched again
+CITATION_GRAPH_TTL = float(os.getenv("CITATION_GRAPH_TTL", str(30 * 24 * 3600)))
+# A paper found to have no citing papers is searched again sooner; new citations may appear
+CITATION_GRAPH_EMPTY_TTL = float(os.getenv("CITATION_GRAPH_EMPTY_TTL", str(24 * 3600)))
+CITATION_GRAPH_DEPTH = int(os.getenv("CITATION_GRAPH_DEPTH", "2"))
+CITATION_GRAPH_MAX_NODES = int(os.getenv("CITATION_GRAPH_MAX_NODES", "25"))
+
+PDF_TEXT_CACHE_DIR = os.getenv("PDF_TEXT_CACHE_DIR", str(CACHE_DIR / "pdf_text"))
+PDF_TEXT_CACHE_MAX_BYTES = int(os.getenv("PDF_TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# --- Analysis -----------------------------------------------------------------------
+
+# Inputs longer than this are treated as a paper rather than a single claim
+CLAIM_MINING_MIN_CHARS = int(os.getenv("CLAIM_MINING_MIN_CHARS", "1500"))
+CLAIM_MINING_TOP_K = int(os.getenv("CLAIM_MINING_TOP_K", "5"))
+
+# Minimum character-trigram Jaccard similarity for two titles to count as the same paper
+TITLE_MATCH_THRESHOLD = float(os.getenv("TITLE_MATCH_THRESHOLD", "0.8"))
+# MinHash signature layout: BANDS * ROWS hash functions, split into LSH bands
+TITLE_MINHASH_BANDS = int(os.getenv("TITLE_MINHASH_BANDS", "8"))
+TITLE_MINHASH_ROWS = int(os.getenv("TITLE_MINHASH_ROWS", "4"))
+
+# How many contradictions get a citation lookup per claim (0 = no limit)
+TRIAGE_TOP_K = int(os.getenv("TRIAGE_TOP_K", "5"))
+# Contradictions scoring below this are not worth a citation lookup at all
+TRIAGE_MIN_SCORE = float(os.getenv("TRIAGE_MIN_SCORE", "0.2"))
+
+# How many citation searches may be in flight at once, and how long each may take
+CITATION_MAX_CONCURRENCY = int(os.getenv("CITATION_MAX_CONCURRENCY", "5"))
+CITATION_TIMEOUT = float(os.getenv("CITATION_TIMEOUT", "30"))
+# Papers per batched citation request; 0 or 1 keeps one request per paper
+CITATION_BATCH_SIZE = int(os.getenv("CITATION_BATCH_SIZE", "0"))
+
+# Default time budget for an analysis when the caller doesn't send one (0 = no deadline)
+ANALYSIS_DEADLINE_MS = int(os.getenv("ANALYSIS_DEADLINE_MS", "0"))
+# Under a deadline, at most this many contradictions get a citation lookup
+DEADLINE_MAX_CITATION_PAPERS = int(os.getenv("DEADLINE_MAX_CITATION_PAPERS", "3"))
+# Time kept back for synthesis; citation lookups still running past this point are cancelled
+DEADLINE_SYNTHESIS_RESERVE = float(os.getenv("DEADLINE_SYNTHESIS_RESERVE", "4"))
+# Below this much remaining time a model synthesis isn't attempted at all
+DEADLINE_MIN_SYNTHESIS = float(os.getenv("DEADLINE_MIN_SYNTHESIS", "1"))
+
+# --- PDF extraction -----------------------------------------------------------------
+
+# Upload and parsing limits
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+# Worker processes for page extraction, and how many pages each task handles
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Documents this short are parsed in-process; a pool round trip would cost more
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+
+# --- Background jobs ----------------------------------------------------------------
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", str(CACHE_DIR / "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+
+# --- Logging and tracing ------------------------------------------------------------
+
+# INFO logs one line per notable event; DEBUG adds full prompts, responses and payloads
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of analyses traced without being asked; an X-Trace: 1 header traces one on demand
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Finished traces kept for GET /traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "100"))
+
+# --- Backends -----------------------------------------------------------------------
+
+BACKEND_PORT = int(os.getenv("BACKEND_PORT", "8501"))
+# Flask's reloader and debugger; off for load tests and production
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "1") != "0"
@@ -1,20 +1,110 @@
 # agents/contradiction_detector.py
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+import logging
 
-# Load environment variables (ignore if .env file doesn't exist)
-try:
-    load_dotenv(override=True)
-except Exception:
-    pass  # Ignore errors loading .env file
+from agents.claim_index import get_claim_index
+from agents.claim_miner import is_long_text, mine_claims
+from agents.llm_cache import get_cache, make_key
+from agents.paper_titles import TitleIndex, dedupe_papers
+from agents.perplexity_client import run_sync
+from agents.structured_output import (
+    CONTRADICTIONS_SCHEMA, JSONArrayStreamParser, completion_options, parse_json_array, record_parse,
+)
+from agents.upstream import UpstreamError, create_chat_completion
+from agents.singleflight import get_group
+from agents.telemetry import record_token_usage
 
-# Get API key from environment variable
-PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-if not PERPLEXITY_API_KEY:
-    raise ValueError("PERPLEXITY_API_KEY environment variable is not set. Please set it in your .env file.")
+logger = logging.getLogger(__name__)
 
-def detect_contradictions(claim: str) -> list:
+# Craft a prompt to find scientific papers that contradict your claim.
+# Perplexity will do live web search and extract sources.
+SYSTEM_PROMPT = (
+    "Find academic papers that contradict this research claim. "
+    "Find at least 2-3 papers that challenge this claim. "
+    "Respond with JSON only, in exactly this shape:\n"
+    '{"papers": [{"title": "paper title", "excerpt": "contradiction excerpt"}]}'
+)
+
+
+def _papers_from_json(items):
+    papers = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("title"), str) or not item["title"].strip():
+            continue
+        excerpt = item.get("excerpt")
+        papers.append({
+            "title": item["title"].strip(),
+            "excerpt": excerpt.strip() if isinstance(excerpt, str) and excerpt.strip() else "Contradictory evidence found",
+        })
+    return papers
+
+
+def _parse_contradictions(content):
+    """
+    Parse a detection response into unique paper dicts: the JSON ``papers`` array
+    when the model followed the schema, otherwise the older text format.
+    """
+    items = parse_json_array(content, "papers")
+    if items is not None:
+        record_parse("contradictions", "json")
+        return dedupe_papers(_papers_from_json(items))
+
+    papers = _parse_text_contradictions(content)
+    record_parse("contradictions", "text_fallback" if papers else "failed")
+    return papers
+
+
+def _parse_text_contradictions(content):
+    """Fallback parser for the PAPER n / Title / Excerpt text format."""
+    # Parse the results with simpler logic
+    results = []
+    if content:
+        # Split by PAPER sections
+        papers = content.split("PAPER")
+        for paper_section in papers:
+            if "Title:" in paper_section and "Excerpt:" in paper_section:
+                lines = paper_section.strip().split("\n")
+                title = ""
+                excerpt = ""
+                
+                for line in lines:
+                    if line.startswith("Title:"):
+                        title = line.replace("Title:", "").strip()
+                    elif line.startswith("Excerpt:"):
+                        excerpt = line.replace("Excerpt:", "").strip()
+                
+                if title and excerpt:
+                    results.append({"title": title, "excerpt": excerpt})
+        
+        # If still no results, try basic parsing
+        if not results and "Title:" in content:
+            lines = content.split("\n")
+            for line in lines:
+                if line.startswith("Title:") or "Title:" in line:
+                    # Simple extraction
+                    title = line.split("Title:")[-1].strip()
+                    if title:
+                        results.append({"title": title, "excerpt": "Contradictory evidence found"})
+        
+        if not results:
+            logger.warning("⚠️ Could not parse contradictions from a %d-character response", len(content))
+            logger.debug("Unparsed contradiction response: %.500s", content)
+
+    # Remove duplicates based on title, including near-duplicate spellings
+    return dedupe_papers(results)
+
+
+def _similar_claim_results(claim):
+    """Contradictions found earlier for a paraphrase of ``claim``, or None."""
+    match = get_claim_index().lookup(claim)
+    if match is None:
+        return None
+    similar_claim, results, similarity = match
+    logger.info("♻️ Reusing contradictions of a similar claim (%s): %.80s", similarity, similar_claim)
+    return results
+
+
+async def detect_contradictions_async(claim: str) -> list:
     """
     Search the web for research papers or content that appears to
     contradict the given claim, using Perplexity API for real-time
@@ -23,81 +113,158 @@ def detect_contradictions(claim: str) -> list:
     # Input validation
     if not claim or not claim.strip():
         return []
-    
-    try:
-        client = OpenAI(api_key=PERPLEXITY_API_KEY, base_url="https://api.perplexity.ai")
-
-        # Craft a prompt to find scientific papers that contradict your claim.
-        # Perplexity will do live web search and extract sources.
-        SYSTEM_PROMPT = (
-            "Find academic papers that contradict this research claim. "
-            "For each paper, respond with exactly this format:\n"
-            "PAPER 1:\n"
-            "Title: [paper title]\n"
-            "Excerpt: [contradiction excerpt]\n\n"
-            "PAPER 2:\n"
-            "Title: [paper title]\n"
-            "Excerpt: [contradiction excerpt]\n\n"
-            "Find at least 2-3 papers that challenge this claim."
-        )
 
-        response = client.chat.completions.create(
+    # Whole papers are mined for their key claims instead of being sent as one prompt
+    if is_long_text(claim):
+        return await _detect_for_long_text(claim)
+    return await _detect_for_claim(claim)
+
+
+async def _detect_for_claim(claim):
+    """Detection for one claim of any length: cache, similar claims, then a shared upstream search."""
+    cache = get_cache()
+    cache_key = make_key("sonar", SYSTEM_PROMPT, 0.2, claim)
+    cached = await cache.get("contradictions", cache_key)
+    if cached is not None:
+        return cached
+    similar = _similar_claim_results(claim)
+    if similar is not None:
+        return similar
+
+    # Identical claims arriving together share one upstream search
+    return await get_group("contradictions").do(cache_key, lambda: _search_contradictions(claim, cache, cache_key))
+
+
+async def _search_contradictions(claim, cache, cache_key):
+    try:
+        response = await create_chat_completion(
+            stage="contradictions",
             model="sonar",  # Use fastest, cheapest model
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": claim},
             ],
             temperature=0.2,
+            **completion_options(CONTRADICTIONS_SCHEMA),
         )
 
-        # Parse the results with simpler logic
-        results = []
-        if response.choices and len(response.choices) > 0:
-            content = response.choices[0].message.content
-            print(f"🔍 Contradiction response: {content[:300]}...")
-            
-            if content:
-                # Split by PAPER sections
-                papers = content.split("PAPER")
-                for paper_section in papers:
-                    if "Title:" in paper_section and "Excerpt:" in paper_section:
-                        lines = paper_section.strip().split("\n")
-                        title = ""
-                        excerpt = ""
-                        
-                        for line in lines:
-                            if line.startswith("Title:"):
-                                title = line.replace("Title:", "").strip()
-                            elif line.startswith("Excerpt:"):
-                                excerpt = line.replace("Excerpt:", "").strip()
-                        
-                        if title and excerpt:
-                            results.append({"title": title, "excerpt": excerpt})
-            
-            # If still no results, try basic parsing
-            if not results and "Title:" in content:
-                lines = content.split("\n")
-                for line in lines:
-                    if line.startswith("Title:") or "Title:" in line:
-                        # Simple extraction
-                        title = line.split("Title:")[-1].strip()
-                        if title:
-                            results.append({"title": title, "excerpt": "Contradictory evidence found"})
-            
-            if not results:
-                print(f"⚠️ Could not parse contradictions from response: {content[:500]}...")
-
-        # Remove duplicates based on title
-        unique_results = []
-        seen_titles = set()
-        for paper in results:
-            title_lower = paper['title'].lower().strip()
-            if title_lower not in seen_titles:
-                seen_titles.add(title_lower)
-                unique_results.append(paper)
-        
-        return unique_results
-        
+        if not response.choices or len(response.choices) == 0:
+            return []
+
+        content = response.choices[0].message.content
+        logger.debug("🔍 Contradiction response: %.300s", content or "")
+        results = _parse_contradictions(content)
+        # Only cache useful answers so an unparseable response gets retried next time
+        if results:
+            cache.set("contradictions", cache_key, results)
+            get_claim_index().add(claim, results)
+        return results
+
+    except UpstreamError:
+        # An unreachable API must not look like "no contradictions found"
+        raise
     except Exception as e:
-        print(f"Error in detect_contradictions: {str(e)}")
+        logger.error("Error in detect_contradictions: %s", e)
         return []
+
+
+async def iter_contradictions_async(claim: str):
+    """
+    Yield contradicting papers one at a time while the model is still writing its answer.
+
+    Papers are taken from the JSON ``papers`` array as each element closes. If the
+    model answered in the old text format instead, the text heuristics run once
+    the response is complete.
+    """
+    if not claim or not claim.strip():
+        return
+
+    if is_long_text(claim):
+        for paper in await _detect_for_long_text(claim):
+            yield paper
+        return
+
+    cache = get_cache()
+    cache_key = make_key("sonar", SYSTEM_PROMPT, 0.2, claim)
+    cached = await cache.get("contradictions", cache_key)
+    if cached is None:
+        cached = _similar_claim_results(claim)
+    if cached is not None:
+        for paper in cached:
+            yield paper
+        return
+
+    parser = JSONArrayStreamParser("papers")
+    seen_titles = TitleIndex()
+    results = []
+    parts = []
+    stream = await create_chat_completion(
+        stage="contradictions",
+        model="sonar",
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": claim},
+        ],
+        temperature=0.2,
+        stream=True,
+        **completion_options(CONTRADICTIONS_SCHEMA),
+    )
+    usage = None
+    try:
+        async for chunk in stream:
+            # Usage is cumulative, so only the last chunk's counts are recorded
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            delta = chunk.choices[0].delta.content
+            parts.append(delta)
+            for paper in _papers_from_json(parser.feed(delta)):
+                if seen_titles.add(paper["title"])[1]:
+                    results.append(paper)
+                    yield paper
+    except Exception as e:
+        # Keep what already streamed, but don't cache a truncated answer
+        logger.error("Error in streaming detect_contradictions: %s", e)
+        return
+    finally:
+        record_token_usage("contradictions", usage)
+
+    content = "".join(parts)
+    logger.debug("🔍 Contradiction response: %.300s", content)
+    if parser.found:
+        record_parse("contradictions", "json")
+    else:
+        for paper in _parse_text_contradictions(content):
+            results.append(paper)
+            yield paper
+        record_parse("contradictions", "text_fallback" if results else "failed")
+    if results:
+        cache.set("contradictions", cache_key, results)
+        get_claim_index().add(claim, results)
+
+
+async def _detect_for_long_text(text, top_k=None):
+    """Run detection on the top mined claims in parallel and merge the results."""
+    claims = mine_claims(text, top_k)
+    if not claims:
+        # Nothing sentence-like to mine; fall back to a bounded prefix
+        claims = [text[:2000]]
+    logger.info("🔍 Contradiction Agent: Mined %d claims from %d characters", len(claims), len(text))
+
+    # Not detect_contradictions_async: the prefix is itself long text and would be mined again, forever
+    per_claim = await asyncio.gather(*(_detect_for_claim(claim) for claim in claims))
+
+    # Interleave so every claim's strongest contradiction comes before any claim's second one
+    merged = []
+    seen_titles = TitleIndex()
+    for rank in range(max((len(papers) for papers in per_claim), default=0)):
+        for claim, papers in zip(claims, per_claim):
+            if rank >= len(papers) or not seen_titles.add(papers[rank]["title"])[1]:
+                continue
+            merged.append(dict(papers[rank], claim=claim))
+    return merged
+
+
+def detect_contradictions(claim: str) -> list:
+    """Blocking wrapper around detect_contradictions_async for synchronous callers."""
+    return run_sync(detect_contradictions_async(claim))
@@ -0,0 +1,271 @@
+# agents/job_queue.py
+import concurrent.futures
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+from agents.config import JOB_STORE_PATH, JOB_WORKERS, JOB_QUEUE_SIZE
+from agents.pipeline import detect_and_propagate_async
+from agents.severity_assessor import generate_synthesis_async
+from agents.telemetry import record_timings, register_stats
+from agents.perplexity_client import submit_coroutine
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _timing_summary(samples):
+    samples = list(samples)
+    return {
+        "count": len(samples),
+        "avg": round(sum(samples) / len(samples), 3) if samples else 0.0,
+        "p50": round(_percentile(samples, 0.50), 3),
+        "p95": round(_percentile(samples, 0.95), 3),
+        "max": round(max(samples), 3) if samples else 0.0,
+    }
+
+
+class JobQueue:
+    """
+    Runs analyses in the background on a fixed pool of worker threads.
+
+    Jobs wait in a bounded priority queue (higher ``priority`` runs first, FIFO
+    within a priority), run detect → propagate → synthesize through the shared
+    client loop, and have their status and result persisted to SQLite.
+    """
+
+    def __init__(self, store_path=JOB_STORE_PATH, workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = {}  # job_id -> future of the stage currently executing
+        self._cancelled = set()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+        if store_path != ":memory:":
+            Path(store_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(store_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, claim TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+            "stage TEXT, error TEXT, result TEXT, "
+            "submitted_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        # Anything still pending belonged to a process that is gone
+        self._db.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+            (FAILED, "Interrupted by server restart", time.time(), QUEUED, RUNNING),
+        )
+        self._db.commit()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self):
+        self._stopping.set()
+        with self._lock:
+            for future in self._running.values():
+                future.cancel()
+
+    def submit(self, claim, priority=0):
+        """Queue an analysis and return its job record; raises QueueFullError when at capacity."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            try:
+                self._queue.put_nowait((-priority, next(self._sequence), job_id))
+            except queue.Full:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+            self._db.execute(
+                "INSERT INTO jobs (id, claim, priority, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, claim, priority, QUEUED, now),
+            )
+            self._db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Return the job's status record (without the result payload), or None if unknown."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, claim, priority, status, stage, error, submitted_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "claim", "priority", "status", "stage", "error", "submitted_at", "started_at", "finished_at")
+        return dict(zip(keys, row))
+
+    def result(self, job_id):
+        """Return the stored analysis result, or None if the job has not succeeded."""
+        with self._lock:
+            row = self._db.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns False if it is unknown or already finished."""
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return False
+        with self._lock:
+            self._cancelled.add(job_id)
+            future = self._running.get(job_id)
+        if future is not None:
+            future.cancel()
+        if job["status"] == QUEUED:
+            # The worker that eventually dequeues it will skip it
+            self._update(job_id, status=CANCELLED, finished_at=time.time())
+        return True
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            running = len(self._running)
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+        return {
+            "workers": self.workers,
+            "queue_capacity": self.max_queue,
+            "queue_depth": self._queue.qsize(),
+            "running": running,
+            "jobs_by_status": counts,
+            "wait_time_seconds": _timing_summary(wait_times),
+            "run_time_seconds": _timing_summary(run_times),
+        }
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def _run_stage(self, job_id, stage, coro):
+        # Run one agent on the shared loop, keeping its future so cancel() can interrupt it
+        self._update(job_id, stage=stage)
+        future = submit_coroutine(coro)
+        with self._lock:
+            if job_id in self._cancelled:
+                future.cancel()
+            self._running[job_id] = future
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise JobCancelled()
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                _, _, job_id = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                with self._lock:
+                    skip = job_id in self._cancelled
+                job = self.get(job_id)
+                if skip or job is None:
+                    continue
+
+                started_at = time.time()
+                self._wait_times.append(started_at - job["submitted_at"])
+                self._update(job_id, status=RUNNING, started_at=started_at)
+
+                try:
+                    claim = job["claim"]
+                    timings = {}
+                    stages_started = time.perf_counter()
+                    # Citation lookups start while detection is still streaming, so they share a stage
+                    contradictions, citation_cascades, _, triage = self._run_stage(
+                        job_id, "contradictions_and_citations", detect_and_propagate_async(claim, timings=timings)
+                    )
+                    synthesis_started = time.perf_counter()
+                    synthesis = self._run_stage(
+                        job_id, "synthesis", generate_synthesis_async(claim, contradictions, citation_cascades)
+                    )
+                    timings["synthesis"] = round((time.perf_counter() - synthesis_started) * 1000, 1)
+                    timings["total"] = round((time.perf_counter() - stages_started) * 1000, 1)
+                    record_timings(timings, stages_started)
+                    result = {
+                        "claim": claim,
+                        "contradictions": contradictions,
+                        "citation_cascades": citation_cascades,
+                        "synthesis": synthesis,
+                        "triage": triage,
+                    }
+                    self._update(job_id, status=SUCCEEDED, stage=None, result=json.dumps(result), finished_at=time.time())
+                except JobCancelled:
+                    self._update(job_id, status=CANCELLED, finished_at=time.time())
+                except Exception as e:
+                    logger.error("❌ Job %s failed: %s", job_id, e)
+                    self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+                finally:
+                    self._run_times.append(time.time() - started_at)
+            finally:
+                with self._lock:
+                    self._running.pop(job_id, None)
+                    self._cancelled.discard(job_id)
+                self._queue.task_done()
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, starting its workers on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+            _job_queue.start()
+        return _job_queue
+
+
+def shutdown_job_queue():
+    """Stop the process-wide job queue's workers, if it was ever started."""
+    with _job_queue_lock:
+        job_queue = _job_queue
+    if job_queue is not None:
+        job_queue.shutdown()
+
+
+# Reported only once the queue exists; scraping /metrics must not start workers
+register_stats("jobs", lambda: _job_queue.stats() if _job_queue is not None else {})
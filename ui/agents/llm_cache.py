@@ -0,0 +1,226 @@
+# agents/llm_cache.py
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from agents.config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_DISK_ENTRIES,
+    LLM_CACHE_TTL_CONTRADICTIONS, LLM_CACHE_TTL_CITATIONS, LLM_CACHE_TTL_SYNTHESIS,
+)
+from agents.sqlite_worker import SQLiteWorker
+from agents.telemetry import register_stats
+
+# Per-stage time-to-live in seconds; citations change far more slowly than search results
+STAGE_TTLS = {
+    "contradictions": LLM_CACHE_TTL_CONTRADICTIONS,
+    "citations": LLM_CACHE_TTL_CITATIONS,
+    "synthesis": LLM_CACHE_TTL_SYNTHESIS,
+}
+DEFAULT_TTL = 3600.0
+
+
+def normalize_input(text):
+    """Fold case, Unicode forms, whitespace and trailing punctuation so trivially reformatted inputs match."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" .!?;:")
+
+
+def make_key(model, system_prompt, temperature, user_input):
+    """Build a stable cache key from everything that determines the completion."""
+    payload = json.dumps([model, system_prompt, temperature, normalize_input(user_input)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier (in-memory LRU + SQLite) cache of parsed agent results with per-stage TTLs.
+
+    Memory hits are served on the caller's thread. Disk reads are awaited on the
+    store's SQLite worker and disk writes are queued to it, so a lookup or store
+    never blocks the event loop on the disk.
+    """
+
+    def __init__(self, path, memory_entries=LLM_CACHE_MEMORY_ENTRIES, disk_entries=LLM_CACHE_DISK_ENTRIES, ttls=None):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttls = dict(STAGE_TTLS, **(ttls or {}))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+        self._worker = SQLiteWorker(path, "llm-cache")
+        self._disk_count = self._worker.call(self._create)
+
+    @staticmethod
+    def _create(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        db.commit()
+        return db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    async def get(self, stage, key):
+        """Return the cached value for ``key`` or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, raw = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    # Entries are kept serialised so callers never share a mutable result
+                    return json.loads(raw)
+                del self._memory[key]
+
+        row = await self._worker.run(_select_entry, key)
+        with self._lock:
+            if row is None or row[1] <= now:
+                self._counters["misses"] += 1
+                if row is not None:
+                    self._worker.submit(self._delete_expired, key, now)
+                return None
+            raw, expires_at = row
+            # A set() that landed while the disk was read holds the newer value
+            if key not in self._memory:
+                self._remember(key, expires_at, raw)
+            self._counters["disk_hits"] += 1
+            self._worker.submit(_touch_entry, key, now)
+        return json.loads(raw)
+
+    def set(self, stage, key, value):
+        """Store a JSON-serialisable ``value`` under ``key`` using the stage's TTL; the disk write is queued."""
+        now = time.time()
+        expires_at = now + self.ttls.get(stage, DEFAULT_TTL)
+        raw = json.dumps(value)
+        with self._lock:
+            self._remember(key, expires_at, raw)
+            self._counters["sets"] += 1
+            self._worker.submit(self._store, key, stage, raw, expires_at, now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._worker.submit(self._clear)
+
+    def flush(self):
+        """Block until queued disk writes are committed."""
+        self._worker.flush()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            memory_size = len(self._memory)
+            disk_size = self._disk_count
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return dict(
+            counters,
+            hit_rate=round(hits / lookups, 3) if lookups else 0.0,
+            memory_entries=memory_size,
+            disk_entries=disk_size,
+            ttls=self.ttls,
+        )
+
+    def _remember(self, key, expires_at, raw):
+        # Caller holds the lock
+        self._memory[key] = (expires_at, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # The methods below run on the SQLite worker; only it changes the disk count
+
+    def _store(self, db, key, stage, raw, expires_at, now):
+        existed = db.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, stage, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, stage, raw, expires_at, now),
+        )
+        if not existed:
+            with self._lock:
+                self._disk_count += 1
+        self._evict_disk(db)
+
+    def _delete_expired(self, db, key, now):
+        deleted = db.execute("DELETE FROM llm_cache WHERE key = ? AND expires_at <= ?", (key, now)).rowcount
+        with self._lock:
+            self._disk_count -= deleted
+            self._counters["expired"] += deleted
+
+    def _clear(self, db):
+        db.execute("DELETE FROM llm_cache")
+        with self._lock:
+            self._disk_count = 0
+
+    def _evict_disk(self, db):
+        # Drop expired rows first, then least recently used ones
+        if self._disk_count <= self.disk_entries:
+            return
+        expired = db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        overflow = self._disk_count - expired - self.disk_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        with self._lock:
+            self._disk_count -= expired + evicted
+            self._counters["expired"] += expired
+            self._counters["evictions"] += evicted
+
+
+def _select_entry(db, key):
+    return db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+
+
+def _touch_entry(db, key, now):
+    db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+
+
+class _NullCache:
+    """Stand-in used when LLM_CACHE_ENABLED=0."""
+
+    async def get(self, stage, key):
+        return None
+
+    def set(self, stage, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, opening the SQLite file on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(LLM_CACHE_PATH) if LLM_CACHE_ENABLED else _NullCache()
+        return _cache
+
+
+def cache_stats():
+    return get_cache().stats()
+
+
+register_stats("llm_cache", cache_stats)
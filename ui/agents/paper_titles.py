@@ -0,0 +1,207 @@
+# agents/paper_titles.py
+import random
+import re
+import unicodedata
+import zlib
+
+from agents.config import TITLE_MATCH_THRESHOLD, TITLE_MINHASH_BANDS, TITLE_MINHASH_ROWS
+
+SHINGLE_SIZE = 3
+# A main title shorter than this is too generic to identify a paper on its own
+MIN_MAIN_TITLE_WORDS = 3
+
+_PUNCTUATION_MAP = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"',
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": "-", "−": "-",
+})
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SUBTITLE_RE = re.compile(r"\s*(?::|\s-\s|\s--\s|\?\s|\.\s)")
+_LEADING_ARTICLE_RE = re.compile(r"^(?:the|a|an)\s+")
+_NUMBER_RE = re.compile(r"\d+")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def canonical_title(title):
+    """
+    Normalize a paper title for comparison: Unicode compatibility forms, casefolding,
+    straightened quotes and dashes, no punctuation, single spaces, no leading article.
+    """
+    text = unicodedata.normalize("NFKC", title or "").translate(_PUNCTUATION_MAP).casefold()
+    text = _NON_WORD_RE.sub(" ", text)
+    text = " ".join(text.split())
+    return _LEADING_ARTICLE_RE.sub("", text)
+
+
+def _split_title(title):
+    """Return ``(main_title, has_subtitle)``; the main title is None if it is too short to identify a paper."""
+    parts = _SUBTITLE_RE.split(unicodedata.normalize("NFKC", title or "").translate(_PUNCTUATION_MAP), 1)
+    head = canonical_title(parts[0])
+    has_subtitle = len(parts) > 1 and bool(canonical_title(parts[1]))
+    return (head if len(head.split()) >= MIN_MAIN_TITLE_WORDS else None), has_subtitle
+
+
+def main_title(title):
+    """Return the canonical title with any subtitle removed, or None if what remains is too short."""
+    return _split_title(title)[0]
+
+
+def _shingles(canonical):
+    padded = f" {canonical} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def _numbers(canonical):
+    # "Part 1" and "Part 2" share nearly every trigram but are different papers
+    return tuple(_NUMBER_RE.findall(canonical))
+
+
+def _jaccard(a, b):
+    return len(a & b) / max(1, len(a | b))
+
+
+class TitleIndex:
+    """
+    Near-duplicate index over paper titles.
+
+    Titles are matched first by canonical form, then by main title when only one of
+    the two has a subtitle ("Title" and "Title: A Survey"; "Title: A Survey" and
+    "Title: Risks in Practice" are different papers), then through MinHash locality-sensitive hashing over character trigrams; apart
+    from exact matches, titles must also contain the same numbers. LSH only
+    proposes candidates from shared buckets, so a lookup touches a handful of titles
+    rather than the whole index; candidates are confirmed with the exact Jaccard score.
+    """
+
+    _hash_params = None
+
+    def __init__(self, threshold=None, bands=None, rows=None):
+        self.threshold = TITLE_MATCH_THRESHOLD if threshold is None else threshold
+        self.bands = bands or TITLE_MINHASH_BANDS
+        self.rows = rows or TITLE_MINHASH_ROWS
+        self._titles = []  # representative title per entry
+        self._shingle_sets = []
+        self._numbers = []
+        self._exact = {}  # canonical title -> entry
+        # main title -> entry, kept apart for titles without and with a subtitle
+        self._main_bare = {}
+        self._main_subtitled = {}
+        self._buckets = [{} for _ in range(self.bands)]  # band signature -> [entries]
+        self._params = self._get_hash_params(self.bands * self.rows)
+
+    @classmethod
+    def _get_hash_params(cls, count):
+        # Fixed seed so signatures are stable across processes
+        if cls._hash_params is None or len(cls._hash_params) < count:
+            rng = random.Random(0x7171E)
+            cls._hash_params = [
+                (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(count)
+            ]
+        return cls._hash_params[:count]
+
+    def _signature(self, shingles):
+        hashed = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        return [min((a * value + b) % _MERSENNE_PRIME for value in hashed) for a, b in self._params]
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def _match(self, canonical, main, has_subtitle, shingles, signature):
+        entry = self._exact.get(canonical)
+        if entry is not None:
+            return entry
+        numbers = _numbers(canonical)
+        if main:
+            # Two different subtitles under one main title are usually two different papers
+            entry = (self._main_bare if has_subtitle else self._main_subtitled).get(main)
+            if entry is not None and self._numbers[entry] == numbers:
+                return entry
+
+        best, best_score = None, self.threshold
+        seen = set()
+        for band, key in self._bands(signature):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if self._numbers[candidate] != numbers:
+                    continue
+                score = _jaccard(shingles, self._shingle_sets[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return best
+
+    def find(self, title):
+        """Return the already indexed title that ``title`` duplicates, or None."""
+        canonical = canonical_title(title)
+        if not canonical:
+            return None
+        shingles = _shingles(canonical)
+        entry = self._match(canonical, *_split_title(title), shingles, self._signature(shingles))
+        return None if entry is None else self._titles[entry]
+
+    def add(self, title):
+        """
+        Index ``title`` unless it duplicates an indexed title.
+
+        Returns ``(representative_title, is_new)``.
+        """
+        canonical = canonical_title(title)
+        if not canonical:
+            return title, False
+        main, has_subtitle = _split_title(title)
+        shingles = _shingles(canonical)
+        signature = self._signature(shingles)
+        entry = self._match(canonical, main, has_subtitle, shingles, signature)
+        if entry is not None:
+            # Remember this spelling too so the next identical lookup is a dict hit
+            self._exact.setdefault(canonical, entry)
+            return self._titles[entry], False
+
+        entry = len(self._titles)
+        self._titles.append(title)
+        self._shingle_sets.append(shingles)
+        self._numbers.append(_numbers(canonical))
+        self._exact[canonical] = entry
+        if main:
+            (self._main_subtitled if has_subtitle else self._main_bare).setdefault(main, entry)
+        for band, key in self._bands(signature):
+            self._buckets[band].setdefault(key, []).append(entry)
+        return title, True
+
+    def __contains__(self, title):
+        return self.find(title) is not None
+
+    def __len__(self):
+        return len(self._titles)
+
+
+def same_paper(title, other):
+    """True when two titles name the same work, or one title contains the other."""
+    a, b = canonical_title(title), canonical_title(other)
+    if not a or not b:
+        return False
+    if a in b or b in a:
+        return True
+    if _numbers(a) != _numbers(b):
+        return False
+    main, has_subtitle = _split_title(title)
+    other_main, other_has_subtitle = _split_title(other)
+    if main and main == other_main and not (has_subtitle and other_has_subtitle):
+        return True
+    return _jaccard(_shingles(a), _shingles(b)) >= TITLE_MATCH_THRESHOLD
+
+
+def dedupe_titles(titles):
+    """Drop near-duplicate titles, keeping the first spelling of each paper."""
+    index = TitleIndex()
+    return [title for title in titles if index.add(title)[1]]
+
+
+def dedupe_papers(papers, field="title"):
+    """Drop paper dicts whose ``field`` duplicates an earlier paper's, keeping input order."""
+    index = TitleIndex()
+    return [paper for paper in papers if index.add(paper.get(field, ""))[1]]
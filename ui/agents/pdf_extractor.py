@@ -0,0 +1,148 @@
+# agents/pdf_extractor.py
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from agents.config import PDF_MAX_BYTES, PDF_MAX_PAGES, PDF_WORKERS, PDF_PAGES_PER_TASK, PDF_PARALLEL_MIN_PAGES
+from agents.pdf_text_cache import get_pdf_text_cache, pages_to_text
+from agents.telemetry import observe_stage, record_span
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class PDFLimitError(Exception):
+    """Raised when an upload exceeds the configured byte or page limits."""
+
+
+def spool_upload(fileobj, max_bytes=None):
+    """
+    Copy an uploaded file object to a temporary file in fixed-size chunks,
+    hashing it on the way through.
+
+    Returns ``(path, sha256_hex)``; the caller is responsible for deleting the file
+    (see discard_upload).
+    Raises PDFLimitError once more than ``max_bytes`` have been read.
+    """
+    max_bytes = max_bytes or PDF_MAX_BYTES
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="cascade-upload-")
+    digest = hashlib.sha256()
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = fileobj.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes:
+                    raise PDFLimitError(f"PDF exceeds the {max_bytes} byte upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def discard_upload(path):
+    """Delete a spooled upload; safe to call more than once for the same path."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _check_page_count(path, max_pages):
+    # Imported on first use: only uploads need PyPDF2, and every other start would pay for it
+    from PyPDF2 import PdfReader
+
+    page_count = len(PdfReader(path).pages)
+    if page_count > max_pages:
+        raise PDFLimitError(f"PDF has {page_count} pages; the limit is {max_pages}")
+    return page_count
+
+
+def _extract_page_range(path, start, stop):
+    """Extract pages [start, stop) from the PDF at ``path``; runs inside a worker process."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, stop):
+        page_text = reader.pages[index].extract_text()
+        pages.append(page_text or "")
+    return pages
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS))
+        return _executor
+
+
+def _page_ranges(page_count, pages_per_task):
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def iter_pdf_pages(path, max_pages=None):
+    """
+    Yield ``(page_number, text)`` for each page in order, extracting page ranges in
+    the process pool for long documents. Pages without text are skipped.
+    """
+    started = time.perf_counter()
+    max_pages = max_pages or PDF_MAX_PAGES
+    page_count = _check_page_count(path, max_pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+        ranges = [_extract_page_range(path, 0, page_count)]
+    else:
+        executor = _get_executor()
+        # map() hands results back in range order as they become available
+        ranges = executor.map(
+            _extract_page_range,
+            *zip(*[(path, start, stop) for start, stop in _page_ranges(page_count, PDF_PAGES_PER_TASK)]),
+        )
+
+    page_number = 0
+    for pages in ranges:
+        for page_text in pages:
+            page_number += 1
+            if page_text:
+                yield page_number, page_text
+    observe_stage("pdf_extraction", time.perf_counter() - started)
+    record_span("stage.pdf_extraction", started, pages=page_count)
+
+
+def extract_pdf_text(path, max_pages=None):
+    """Extract the text of every page, joined with newlines."""
+    return pages_to_text(iter_pdf_pages(path, max_pages))
+
+
+def iter_pdf_pages_cached(path, digest, max_pages=None):
+    """Like iter_pdf_pages, but served from the content-addressed cache when the PDF was seen before."""
+    cache = get_pdf_text_cache()
+    pages = cache.get_pages(digest)
+    if pages is not None:
+        yield from pages
+        return
+
+    pages = []
+    for page in iter_pdf_pages(path, max_pages):
+        pages.append(page)
+        yield page
+    # Only reached when extraction ran to completion
+    cache.put(digest, pages)
+
+
+def extract_pdf_text_cached(path, digest, max_pages=None):
+    """Extract (or look up) the text of the PDF whose bytes hash to ``digest``."""
+    return pages_to_text(iter_pdf_pages_cached(path, digest, max_pages))
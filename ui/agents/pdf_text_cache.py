@@ -0,0 +1,117 @@
+# agents/pdf_text_cache.py
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+from agents.config import PDF_TEXT_CACHE_DIR, PDF_TEXT_CACHE_MAX_BYTES
+from agents.telemetry import register_stats
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_valid_digest(digest):
+    return bool(digest) and bool(_DIGEST_RE.match(digest))
+
+
+def pages_to_text(pages):
+    """Join extracted ``(page_number, text)`` pairs the same way a fresh extraction does."""
+    return "\n".join(text for _, text in pages).strip()
+
+
+class PDFTextCache:
+    """
+    Extracted PDF pages stored on disk under the SHA-256 of the PDF bytes.
+
+    Reads refresh a file's mtime, and writes evict the least recently used files
+    once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory=PDF_TEXT_CACHE_DIR, max_bytes=PDF_TEXT_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = sum(path.stat().st_size for path in self.directory.glob("*.json"))
+
+    def _path(self, digest):
+        if not is_valid_digest(digest):
+            raise ValueError("Expected a lowercase hex SHA-256 digest")
+        return self.directory / f"{digest}.json"
+
+    def get_pages(self, digest):
+        """Return the cached ``[(page_number, text), ...]`` for ``digest``, or None."""
+        path = self._path(digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pages = [tuple(page) for page in json.load(f)["pages"]]
+            os.utime(path)
+        except (FileNotFoundError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pages
+
+    def get_text(self, digest):
+        pages = self.get_pages(digest)
+        return None if pages is None else pages_to_text(pages)
+
+    def put(self, digest, pages):
+        """Store the extracted pages for ``digest``, evicting old entries if over budget."""
+        path = self._path(digest)
+        payload = json.dumps({"pages": [list(page) for page in pages]}).encode("utf-8")
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        with self._lock:
+            previous = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += len(payload) - previous
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        if self._total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for entry in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            entry.unlink()
+            self._total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_text_cache():
+    """Return the process-wide extracted-text cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PDFTextCache()
+        return _cache
+
+
+register_stats("pdf_text_cache", lambda: get_pdf_text_cache().stats())
@@ -0,0 +1,182 @@
+# agents/perplexity_client.py
+import asyncio
+import importlib.util
+import threading
+import weakref
+
+from agents.config import (
+    HTTP2_REQUESTED, PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, POOL_KEEPALIVE_EXPIRY, POOL_MAX_CONNECTIONS,
+    POOL_MAX_KEEPALIVE,
+)
+from agents.telemetry import register_stats
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]"); checked without importing it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+HTTP2_ENABLED = HTTP2_AVAILABLE and HTTP2_REQUESTED
+
+
+class _PoolCounters:
+    """Process-wide request/connection counters shared by every pooled client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            return self.requests, self.new_connections
+
+
+_counters = _PoolCounters()
+
+# One client per event loop: httpx connections cannot be shared across loops
+_clients = weakref.WeakKeyDictionary()
+_transports = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+async def _trace(event_name, info):
+    # httpcore reports every fresh TCP connection; anything else is a reused one
+    if event_name == "connection.connect_tcp.complete":
+        _counters.record_connection()
+
+
+async def _on_request(request):
+    _counters.record_request()
+    request.extensions["trace"] = _trace
+
+
+def get_async_client():
+    """Return the shared, pooled Perplexity client for the running event loop, building it on first use."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            # The SDK and httpx are most of the package's import time; only pay for them once a call is made
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            http_client = DefaultAsyncHttpxClient(
+                http2=HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"request": [_on_request]},
+            )
+            client = AsyncOpenAI(
+                api_key=PERPLEXITY_API_KEY,
+                base_url=PERPLEXITY_BASE_URL,
+                http_client=http_client,
+                # Retries are handled by agents.upstream, which paces and backs off across all callers
+                max_retries=0,
+            )
+            _clients[loop] = client
+            _transports[loop] = http_client._transport
+        return client
+
+
+def _import_client_libraries():
+    import httpx  # noqa: F401
+    import openai  # noqa: F401
+
+
+def warm_up():
+    """
+    Import the SDK on a background thread, so a long-running server's first request
+    doesn't pay for it; short-lived tools simply never call this.
+    """
+    threading.Thread(target=_import_client_libraries, name="perplexity-client-warm-up", daemon=True).start()
+
+
+async def aclose_client():
+    """Close the pooled client bound to the running event loop, if any."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+        _transports.pop(loop, None)
+    if client is not None:
+        await client.close()
+
+
+def pool_stats() -> dict:
+    """Report open/idle connections and the connection reuse ratio across all pooled clients."""
+    open_connections = 0
+    idle_connections = 0
+    with _clients_lock:
+        transports = list(_transports.values())
+    for transport in transports:
+        # httpx does not expose the pool publicly, so read it defensively
+        pool = getattr(transport, "_pool", None)
+        for connection in getattr(pool, "connections", []):
+            if connection.is_closed():
+                continue
+            open_connections += 1
+            if connection.is_idle():
+                idle_connections += 1
+
+    requests, new_connections = _counters.snapshot()
+    reused = max(0, requests - new_connections)
+    return {
+        "clients": len(transports),
+        "open_connections": open_connections,
+        "idle_connections": idle_connections,
+        "requests": requests,
+        "new_connections": new_connections,
+        "reuse_ratio": round(reused / requests, 3) if requests else 0.0,
+        "max_connections": POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": POOL_MAX_KEEPALIVE,
+        "keepalive_expiry": POOL_KEEPALIVE_EXPIRY,
+        "http2": HTTP2_ENABLED,
+    }
+
+
+register_stats("pool", pool_stats)
+
+
+# Synchronous callers share one long-lived background loop, and with it one pool
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_loop():
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_sync_loop.run_forever, name="perplexity-client", daemon=True)
+            thread.start()
+        return _sync_loop
+
+
+def submit_coroutine(coro):
+    """Schedule a coroutine on the shared background loop and return its concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_sync_loop())
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared background loop and block until it finishes."""
+    return submit_coroutine(coro).result()
+
+
+def iter_sync(agen):
+    """Drive an async generator on the shared background loop from synchronous code."""
+    loop = _get_sync_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
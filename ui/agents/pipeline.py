@@ -0,0 +1,372 @@
+# agents/pipeline.py
+import asyncio
+import json
+import logging
+import time
+
+from agents.config import (
+    ANALYSIS_DEADLINE_MS, DEADLINE_MAX_CITATION_PAPERS, DEADLINE_SYNTHESIS_RESERVE, DEADLINE_MIN_SYNTHESIS,
+)
+from agents.contradiction_detector import iter_contradictions_async
+from agents.citation_propagator import CITATION_MAX_CONCURRENCY, collect_paper_titles, find_citing_papers_async
+from agents.severity_assessor import generate_synthesis_async, stream_synthesis_async, template_synthesis
+from agents.llm_cache import normalize_input
+from agents.triage_agent import TriageSelector
+from agents.perplexity_client import run_sync
+from agents.singleflight import get_group
+from agents.telemetry import record_timings
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """A point in time an analysis must finish by, with a share reserved for synthesis."""
+
+    def __init__(self, budget_ms):
+        self.budget = budget_ms / 1000
+        self.expires_at = time.monotonic() + self.budget
+        # Never reserve more than half the budget, or short deadlines would skip citations entirely
+        self.synthesis_reserve = min(DEADLINE_SYNTHESIS_RESERVE, self.budget / 2)
+
+    @classmethod
+    def from_ms(cls, budget_ms):
+        """Deadline for ``budget_ms`` (falling back to ANALYSIS_DEADLINE_MS), or None for no deadline."""
+        budget_ms = budget_ms if budget_ms is not None else ANALYSIS_DEADLINE_MS
+        return cls(budget_ms) if budget_ms and budget_ms > 0 else None
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_for_search(self):
+        """Time left for detection and citation lookups."""
+        return max(0.0, self.remaining() - self.synthesis_reserve)
+
+
+def parse_deadline_ms(value):
+    """
+    Validate a requested time budget (an int, or a string from a header) and return it
+    as milliseconds, or None when absent. Raises ValueError with a message fit for the client.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    raise ValueError(f"deadline_ms must be a whole number of milliseconds (0 for none), got {value!r}")
+
+
+def _time_left(deadline, for_search=False):
+    if deadline is None:
+        return None
+    return deadline.remaining_for_search() if for_search else deadline.remaining()
+
+
+def format_sse(event, data):
+    """Encode one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def format_server_timing(timings):
+    """Encode stage durations (milliseconds) as a Server-Timing header value."""
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in (timings or {}).items())
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def _detect_and_propagate_events(
+    claim, max_concurrency=None, deadline=None, max_citation_papers=None, top_k=None, min_score=None
+):
+    """
+    Yield ``(event, data)`` pairs for the detection and citation stages, overlapped.
+
+    Each contradicting paper is reported ("contradiction") as soon as the detector
+    has streamed it, and triaged: if it scores among the ``top_k`` best so far (and
+    at least ``min_score``), its citation lookup starts right away, while the rest
+    of the detection response is still arriving. A lookup pushed out of the top-K
+    by a better paper is cancelled unless it has already finished. "contradictions"
+    follows once detection is complete, then "triage" with every paper's score;
+    "citations" events arrive in completion order, possibly before both.
+
+    ``max_citation_papers`` caps the selection further. With a ``deadline``,
+    whatever is still running when the search share of the budget runs out is
+    cancelled, and a final "partial" event says which stages were cut short.
+    """
+    events = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or CITATION_MAX_CONCURRENCY))
+    selector = TriageSelector(claim, top_k, min_score)
+    cap = None if max_citation_papers is None else max(0, max_citation_papers)
+    # The cap only matters when it is tighter than the triage's own top-K
+    cap_binding = cap is not None and (selector.top_k <= 0 or cap < selector.top_k)
+    if cap_binding and cap > 0:
+        selector.top_k = cap
+    tasks = []
+    lookups = {}  # selected title -> lookup task
+    contradictions = []
+    state = {"detected": False, "evicted": 0}
+
+    async def lookup(paper_title):
+        async with semaphore:
+            citing_papers = await find_citing_papers_async(paper_title)
+        await events.put(("citations", {"title": paper_title, "citing_papers": citing_papers}))
+
+    async def detect():
+        async for paper in iter_contradictions_async(claim):
+            contradictions.append(paper)
+            await events.put(("contradiction", paper))
+            selected, evicted = selector.offer(paper)
+            if cap == 0:
+                continue
+            if evicted is not None:
+                task = lookups.pop(evicted)
+                # A finished lookup has already been paid for, so its result is kept
+                if not task.done():
+                    task.cancel()
+                    state["evicted"] += 1
+            if selected:
+                paper_title = paper.get("title", "").strip()
+                lookups[paper_title] = asyncio.ensure_future(run(lookup(paper_title)))
+                tasks.append(lookups[paper_title])
+        state["detected"] = True
+        await events.put(("contradictions", {"claim": claim, "contradictions": list(contradictions)}))
+        await events.put(("triage", {"scores": dict(selector.scores), "selected": selector.selected()}))
+
+    async def run(coro):
+        # Every producer reports exactly once when it finishes, successfully or not
+        try:
+            await coro
+        except Exception as e:
+            await events.put((None, e))
+        else:
+            await events.put((None, None))
+
+    tasks.append(asyncio.ensure_future(run(detect())))
+    finished = 0
+    try:
+        # Evicted lookups are cancelled before they can report
+        while finished < len(tasks) - state["evicted"]:
+            try:
+                event, data = await asyncio.wait_for(events.get(), _time_left(deadline, for_search=True))
+            except asyncio.TimeoutError:
+                # Out of search time: report what we have and leave the rest unfinished
+                outstanding = sum(not task.done() for task in lookups.values())
+                logger.warning("⏱️ Deadline reached with %d citation lookups outstanding", outstanding)
+                if not state["detected"]:
+                    yield "contradictions", {"claim": claim, "contradictions": list(contradictions)}
+                    yield "triage", {"scores": dict(selector.scores), "selected": selector.selected()}
+                yield "partial", {
+                    "contradictions": not state["detected"],
+                    "citation_cascades": True,
+                }
+                return
+            if event is None:
+                finished += 1
+                if data is not None:
+                    raise data
+                continue
+            yield event, data
+        if cap_binding and selector.eligible > cap:
+            # The triage would have searched more papers than the cap allowed
+            yield "partial", {"contradictions": False, "citation_cascades": True}
+    finally:
+        # The consumer may stop early, a stage may fail, or time ran out; don't leave work running
+        for task in tasks:
+            task.cancel()
+
+
+def _citation_limit(deadline, max_citation_papers):
+    if max_citation_papers is not None:
+        return max_citation_papers
+    return DEADLINE_MAX_CITATION_PAPERS if deadline is not None else None
+
+
+def _no_partial():
+    return {"contradictions": False, "citation_cascades": False, "synthesis": False}
+
+
+async def analyze_claim_events(claim, deadline_ms=None, max_citation_papers=None, top_k=None, min_score=None):
+    """
+    Run detect → propagate → synthesize and yield ``(event, data)`` pairs as each
+    piece finishes: each contradicting paper as it is detected, the full list of
+    contradictions, one event per paper's citation cascade (in completion order,
+    overlapping detection), the triage scores, the synthesis as it is generated
+    (``synthesis_delta``) and in full, and finally the assembled result.
+
+    With a deadline, stages are cut short as described in analyze_claim_async and
+    the "done" result's ``partial`` field says which parts are incomplete; its
+    ``timings`` field holds each stage's duration in milliseconds.
+    """
+    started = time.perf_counter()
+    deadline = Deadline.from_ms(deadline_ms)
+    partial = _no_partial()
+    timings = {}
+    contradictions = []
+    triage = None
+    resolved = {}
+    async for event, data in _detect_and_propagate_events(
+        claim,
+        deadline=deadline,
+        max_citation_papers=_citation_limit(deadline, max_citation_papers),
+        top_k=top_k,
+        min_score=min_score,
+    ):
+        if event == "partial":
+            partial.update(data)
+            continue
+        if event == "contradictions":
+            contradictions = data["contradictions"]
+            timings["detection"] = _elapsed_ms(started)
+        elif event == "triage":
+            triage = data
+        elif event == "citations":
+            resolved[data["title"]] = data["citing_papers"]
+        yield event, data
+    timings["citations"] = _elapsed_ms(started)
+
+    # Present cascades in the same order as the contradictions
+    citation_cascades = {title: resolved[title] for title in collect_paper_titles(contradictions) if title in resolved}
+
+    parts = []
+    synthesis_started = time.perf_counter()
+    if deadline is not None and deadline.remaining() < DEADLINE_MIN_SYNTHESIS:
+        partial["synthesis"] = True
+        parts.append(template_synthesis(claim, contradictions, citation_cascades))
+        yield "synthesis_delta", {"text": parts[0]}
+    else:
+        chunks = stream_synthesis_async(claim, contradictions, citation_cascades)
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(chunks.__anext__(), _time_left(deadline))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    partial["synthesis"] = True
+                    if not parts:
+                        # Nothing streamed yet, so the local briefing can stand in whole
+                        parts.append(template_synthesis(claim, contradictions, citation_cascades))
+                        yield "synthesis_delta", {"text": parts[0]}
+                    break
+                parts.append(text)
+                yield "synthesis_delta", {"text": text}
+        finally:
+            await chunks.aclose()
+    synthesis = "".join(parts).strip()
+    timings["synthesis"] = _elapsed_ms(synthesis_started)
+    timings["total"] = _elapsed_ms(started)
+    record_timings(timings, started)
+    yield "synthesis", {"synthesis": synthesis}
+
+    yield "done", {
+        "claim": claim,
+        "contradictions": contradictions,
+        "citation_cascades": citation_cascades,
+        "synthesis": synthesis,
+        "partial": partial,
+        "triage": triage,
+        "timings": timings,
+    }
+
+
+async def detect_and_propagate_async(
+    claim, deadline=None, max_citation_papers=None, top_k=None, min_score=None, timings=None
+):
+    """
+    Return ``(contradictions, citation_cascades, partial, triage)``, with citation
+    lookups overlapping detection and limited to the papers the triage selects.
+    ``partial`` marks stages cut short by the deadline or cap, and ``triage`` holds
+    every paper's score and the selected titles.
+
+    A ``timings`` dict, if given, receives "detection" and "citations": milliseconds
+    from the start until the contradiction list and the last citation lookup were done.
+    """
+    started = time.perf_counter()
+    timings = {} if timings is None else timings
+    partial = {"contradictions": False, "citation_cascades": False}
+    contradictions = []
+    triage = None
+    resolved = {}
+    async for event, data in _detect_and_propagate_events(
+        claim, deadline=deadline, max_citation_papers=max_citation_papers, top_k=top_k, min_score=min_score
+    ):
+        if event == "contradictions":
+            contradictions = data["contradictions"]
+            timings["detection"] = _elapsed_ms(started)
+        elif event == "triage":
+            triage = data
+        elif event == "citations":
+            resolved[data["title"]] = data["citing_papers"]
+        elif event == "partial":
+            partial.update(data)
+    timings["citations"] = _elapsed_ms(started)
+    citation_cascades = {title: resolved[title] for title in collect_paper_titles(contradictions) if title in resolved}
+    return contradictions, citation_cascades, partial, triage
+
+
+async def _run_analysis(claim, deadline=None, max_citation_papers=None, top_k=None, min_score=None):
+    started = time.perf_counter()
+    timings = {}
+    contradictions, citation_cascades, partial, triage = await detect_and_propagate_async(
+        claim, deadline, _citation_limit(deadline, max_citation_papers), top_k, min_score, timings
+    )
+    partial["synthesis"] = False
+    synthesis_started = time.perf_counter()
+
+    if deadline is not None and deadline.remaining() < DEADLINE_MIN_SYNTHESIS:
+        synthesis = None
+    else:
+        try:
+            synthesis = await asyncio.wait_for(
+                generate_synthesis_async(claim, contradictions, citation_cascades), _time_left(deadline)
+            )
+        except asyncio.TimeoutError:
+            synthesis = None
+    if synthesis is None:
+        logger.warning("⏱️ Deadline reached before synthesis; using the templated briefing")
+        partial["synthesis"] = True
+        synthesis = template_synthesis(claim, contradictions, citation_cascades)
+    timings["synthesis"] = _elapsed_ms(synthesis_started)
+    timings["total"] = _elapsed_ms(started)
+    record_timings(timings, started)
+
+    return {
+        "claim": claim,
+        "contradictions": contradictions,
+        "citation_cascades": citation_cascades,
+        "synthesis": synthesis,
+        "partial": partial,
+        "triage": triage,
+        "timings": timings,
+    }
+
+
+async def analyze_claim_async(claim, deadline_ms=None, max_citation_papers=None, top_k=None, min_score=None):
+    """
+    Run the full pipeline and return the assembled result dict.
+
+    Only contradictions the triage ranks in the ``top_k`` (TRIAGE_TOP_K by default)
+    and scoring at least ``min_score`` get a citation lookup; the result's
+    ``triage`` field holds the scores. With a deadline (``deadline_ms``, or ANALYSIS_DEADLINE_MS by default), that
+    selection is capped further, lookups still running once the
+    synthesis reserve is reached are cancelled, and a local templated briefing
+    replaces the model synthesis if time runs out. The result's ``partial`` field
+    marks each part that is incomplete, and ``timings`` holds stage durations in
+    milliseconds (detection and citations overlap, so both count from the start).
+
+    Concurrent analyses of the same normalized claim share one execution, unless
+    they carry their own time budget, citation cap or triage settings.
+    """
+    deadline = Deadline.from_ms(deadline_ms)
+    if deadline is None and max_citation_papers is None and top_k is None and min_score is None:
+        result = await get_group("analyses").do(normalize_input(claim), lambda: _run_analysis(claim))
+    else:
+        result = await _run_analysis(claim, deadline, max_citation_papers, top_k, min_score)
+    # Echo back the caller's own wording of the claim
+    return dict(result, claim=claim)
+
+
+def analyze_claim(claim, deadline_ms=None, max_citation_papers=None, top_k=None, min_score=None):
+    """Blocking wrapper around analyze_claim_async for synchronous callers."""
+    return run_sync(analyze_claim_async(claim, deadline_ms, max_citation_papers, top_k, min_score))
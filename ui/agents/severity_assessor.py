@@ -1,84 +1,147 @@
 # agents/synthesis_agent.py
-import os
+import logging
 import re
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Load environment variables (ignore if .env file doesn't exist)
-try:
-    load_dotenv(override=True)
-except Exception:
-    pass  # Ignore errors loading .env file
+from agents.claim_miner import is_long_text, mine_claims
+from agents.llm_cache import get_cache, make_key
+from agents.perplexity_client import run_sync
+from agents.upstream import UpstreamError, create_chat_completion
+from agents.telemetry import record_token_usage
 
-# Get API key from environment variable
-PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-if not PERPLEXITY_API_KEY:
-    raise ValueError("PERPLEXITY_API_KEY environment variable is not set. Please set it in your .env file.")
+logger = logging.getLogger(__name__)
 
-def generate_synthesis(claim, contradicted_papers, citation_cascades):
+SYSTEM_PROMPT = (
+    "You are a strategic research advisor helping researchers navigate conflicting findings and identify high-impact opportunities. "
+    "Based on the contradictory papers and their citation cascades, provide a compelling final verdict with actionable next steps. "
+    "Structure your response as:\n\n"
+    "🚨 **FINAL VERDICT: [Brief assessment of the research landscape]**\n\n"
+    "🎯 **TOPICS TO EXPLORE TODAY:**\n"
+    "- [Specific research direction 1]\n"
+    "- [Specific research direction 2]\n"
+    "- [Specific research direction 3]\n\n"
+    "⚡ **STRATEGIC INSIGHT:** [One key takeaway about the field]\n\n"
+    "Make it exciting, actionable, and emphasize the urgency of these opportunities!"
+)
+
+NO_CLAIM_MESSAGE = "No research claim provided. Please enter a valid research claim to analyze."
+FAILURE_MESSAGE = "Unable to generate research strategy. Please try again."
+
+
+def _build_user_prompt(claim, contradicted_papers, citation_cascades):
+    """Summarise the findings into the user message sent to the synthesis model."""
+    # Add citation context if available
+    citation_context = ""
+    if citation_cascades and isinstance(citation_cascades, dict) and len(citation_cascades) > 0:
+        citation_context = "\nCitation cascades found:\n"
+        for paper_title, citing_papers in citation_cascades.items():
+            if citing_papers and len(citing_papers) > 0:
+                citation_context += f"- {paper_title} is cited by {len(citing_papers)} other works\n"
+            else:
+                citation_context += f"- {paper_title} has limited citation impact\n"
+    else:
+        citation_context = "\nNo significant citation cascades found."
+
+    # Extract just the titles for simpler analysis
+    paper_titles = []
+    if contradicted_papers and isinstance(contradicted_papers, list):
+        for paper in contradicted_papers:
+            if isinstance(paper, dict) and "title" in paper:
+                paper_titles.append(paper["title"])
+    
+    titles_text = "\n".join([f"- {title}" for title in paper_titles]) if paper_titles else "No contradictory papers found"
+
+    if is_long_text(claim):
+        # For a whole paper, summarise with its key claims rather than its first 200 characters
+        key_claims = "\n".join(f"- {sentence}" for sentence in mine_claims(claim)) or f"- {claim[:200]}..."
+        claim_text = f"Key claims from the uploaded paper:\n{key_claims}"
+    else:
+        claim_text = f"Research claim: {claim[:200]}..."
+
+    return (
+        f"{claim_text}\n\n"
+        f"Contradictory papers found:\n{titles_text}\n\n"
+        f"Citation cascades:\n{citation_context}\n\n"
+        f"Provide a strategic research briefing with actionable next steps."
+    )
+
+
+def _trim_preamble(output):
+    # If the output still starts with thinking indicators, extract just the advice part
+    if "based on" in output.lower():
+        # Find the start of the actual advice
+        advice_start = output.lower().find("based on")
+        if advice_start > 0:
+            output = output[advice_start:]
+    return output.strip()
+
+
+class ThinkTagStripper:
+    """
+    Incrementally removes ``<think>...</think>`` blocks from streamed text.
+
+    Tags may be split across chunks, so any tail that could still turn into a tag
+    is held back until the next chunk (or ``flush``) decides it.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self._pending = ""
+
+    def feed(self, chunk):
+        """Consume a chunk and return the text that is safe to emit."""
+        text = self._pending + chunk
+        self._pending = ""
+        output = []
+        while text:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            index = text.lower().find(tag)
+            if index >= 0:
+                if not self.in_think:
+                    output.append(text[:index])
+                text = text[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+
+            # No full tag; hold back the longest suffix that is a prefix of the tag
+            hold = 0
+            for size in range(min(len(tag) - 1, len(text)), 0, -1):
+                if tag.startswith(text[-size:].lower()):
+                    hold = size
+                    break
+            if not self.in_think:
+                output.append(text[:len(text) - hold])
+            self._pending = text[len(text) - hold:]
+            break
+        return "".join(output)
+
+    def flush(self):
+        """Return whatever was held back once the stream has ended."""
+        pending, self._pending = self._pending, ""
+        return "" if self.in_think else pending
+
+
+async def generate_synthesis_async(claim, contradicted_papers, citation_cascades):
     """
     Generates a direct, practical research briefing for researchers.
     """
     # Input validation
     if not claim or not claim.strip():
-        return "No research claim provided. Please enter a valid research claim to analyze."
+        return NO_CLAIM_MESSAGE
     
     try:
-        client = OpenAI(api_key=PERPLEXITY_API_KEY, base_url="https://api.perplexity.ai")
-
-        # Build context from findings
-        papers_context = ""
-        if contradicted_papers and isinstance(contradicted_papers, list) and len(contradicted_papers) > 0:
-            for paper in contradicted_papers:
-                if isinstance(paper, dict):
-                    title = paper.get("title", "Unknown")
-                    excerpt = paper.get("excerpt", "N/A")
-                    papers_context += f"- {title}: {excerpt}\n"
-        else:
-            papers_context = "No contradictory papers found in the literature search."
-
-        # Add citation context if available
-        citation_context = ""
-        if citation_cascades and isinstance(citation_cascades, dict) and len(citation_cascades) > 0:
-            citation_context = "\nCitation cascades found:\n"
-            for paper_title, citing_papers in citation_cascades.items():
-                if citing_papers and len(citing_papers) > 0:
-                    citation_context += f"- {paper_title} is cited by {len(citing_papers)} other works\n"
-                else:
-                    citation_context += f"- {paper_title} has limited citation impact\n"
-        else:
-            citation_context = "\nNo significant citation cascades found."
-
-        SYSTEM_PROMPT = (
-            "You are a strategic research advisor helping researchers navigate conflicting findings and identify high-impact opportunities. "
-            "Based on the contradictory papers and their citation cascades, provide a compelling final verdict with actionable next steps. "
-            "Structure your response as:\n\n"
-            "🚨 **FINAL VERDICT: [Brief assessment of the research landscape]**\n\n"
-            "🎯 **TOPICS TO EXPLORE TODAY:**\n"
-            "- [Specific research direction 1]\n"
-            "- [Specific research direction 2]\n"
-            "- [Specific research direction 3]\n\n"
-            "⚡ **STRATEGIC INSIGHT:** [One key takeaway about the field]\n\n"
-            "Make it exciting, actionable, and emphasize the urgency of these opportunities!"
-        )
+        user_prompt = _build_user_prompt(claim, contradicted_papers, citation_cascades)
 
-        # Extract just the titles for simpler analysis
-        paper_titles = []
-        if contradicted_papers and isinstance(contradicted_papers, list):
-            for paper in contradicted_papers:
-                if isinstance(paper, dict) and "title" in paper:
-                    paper_titles.append(paper["title"])
-        
-        titles_text = "\n".join([f"- {title}" for title in paper_titles]) if paper_titles else "No contradictory papers found"
-
-        user_prompt = (
-            f"Research claim: {claim[:200]}...\n\n"
-            f"Contradictory papers found:\n{titles_text}\n\n"
-            f"Citation cascades:\n{citation_context}\n\n"
-            f"Provide a strategic research briefing with actionable next steps."
-        )
+        cache = get_cache()
+        cache_key = make_key("sonar", SYSTEM_PROMPT, 0.1, user_prompt)
+        cached = await cache.get("synthesis", cache_key)
+        if cached is not None:
+            return cached
 
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
+            stage="synthesis",
             model="sonar",  # Use same model as other agents
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -95,16 +158,132 @@ def generate_synthesis(claim, contradicted_papers, citation_cascades):
         
         # Remove everything between <think> and </think> tags
         cleaned_output = re.sub(r'<think>.*?</think>', '', output, flags=re.DOTALL | re.IGNORECASE)
-        
-        # If the output still starts with thinking indicators, extract just the advice part
-        if "based on" in cleaned_output.lower():
-            # Find the start of the actual advice
-            advice_start = cleaned_output.lower().find("based on")
-            if advice_start > 0:
-                cleaned_output = cleaned_output[advice_start:]
-        
-        return cleaned_output.strip()
-        
+        cleaned_output = _trim_preamble(cleaned_output)
+
+        if cleaned_output:
+            cache.set("synthesis", cache_key, cleaned_output)
+        return cleaned_output
+
+    except UpstreamError:
+        raise
     except Exception as e:
-        print(f"Error in generate_synthesis: {str(e)}")
-        return "Unable to generate research strategy. Please try again."
+        logger.error("Error in generate_synthesis: %s", e)
+        return FAILURE_MESSAGE
+
+
+async def stream_synthesis_async(claim, contradicted_papers, citation_cascades):
+    """
+    Stream the research briefing as cleaned text chunks while the model generates it.
+
+    ``<think>`` blocks are stripped as tokens arrive. Because text is emitted as soon
+    as it is known, the "based on" preamble trim of the non-streaming path is only
+    applied to the copy stored in the cache.
+    """
+    # Input validation
+    if not claim or not claim.strip():
+        yield NO_CLAIM_MESSAGE
+        return
+
+    user_prompt = _build_user_prompt(claim, contradicted_papers, citation_cascades)
+    cache = get_cache()
+    cache_key = make_key("sonar", SYSTEM_PROMPT, 0.1, user_prompt)
+    cached = await cache.get("synthesis", cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    stripper = ThinkTagStripper()
+    emitted = []
+    usage = None
+    try:
+        stream = await create_chat_completion(
+            stage="synthesis",
+            model="sonar",  # Use same model as other agents
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.1,
+            stream=True,
+        )
+
+        async for chunk in stream:
+            # Usage is cumulative, so only the last chunk's counts are recorded
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            text = stripper.feed(delta)
+            if not emitted:
+                # Don't open the briefing with the whitespace left behind by a think block
+                text = text.lstrip()
+            if text:
+                emitted.append(text)
+                yield text
+
+        tail = stripper.flush()
+        if tail:
+            emitted.append(tail)
+            yield tail
+
+    except UpstreamError:
+        if not emitted:
+            raise
+        logger.error("Error in stream_synthesis: upstream failed mid-stream")
+        return
+    except Exception as e:
+        logger.error("Error in stream_synthesis: %s", e)
+        if not emitted:
+            yield FAILURE_MESSAGE
+        return
+    finally:
+        record_token_usage("synthesis", usage)
+
+    full_output = _trim_preamble("".join(emitted))
+    if full_output:
+        cache.set("synthesis", cache_key, full_output)
+
+
+def template_synthesis(claim, contradicted_papers, citation_cascades):
+    """
+    Build the briefing locally, in the same layout the model uses, from the papers
+    and cascades alone. Used when there is no time left for a model call.
+    """
+    papers = [paper for paper in contradicted_papers or [] if isinstance(paper, dict) and paper.get("title")]
+    cascades = citation_cascades or {}
+    # Most-cited contradictions first: they are the ones shaping the field
+    ranked = sorted(papers, key=lambda paper: len(cascades.get(paper["title"]) or []), reverse=True)
+
+    if not papers:
+        verdict = "No direct contradictions surfaced for this claim"
+    elif len(papers) == 1:
+        verdict = "One published study challenges this claim"
+    else:
+        verdict = f"{len(papers)} published studies challenge this claim"
+
+    topics = [f"- Reconcile the claim with \"{paper['title']}\"" for paper in ranked[:3]]
+    if len(topics) < 3:
+        topics.append("- Replicate the key result under the conditions where it is most likely to fail")
+    if len(topics) < 3:
+        topics.append("- Map which assumptions the supporting and opposing work disagree on")
+
+    cited = sum(len(citing or []) for citing in cascades.values())
+    if cited:
+        insight = f"The contradicting work has already been built on by {cited} citing papers, so the disagreement is live."
+    elif papers:
+        insight = "The contradicting work has little citation follow-up yet, leaving room to settle the question first."
+    else:
+        insight = "An absence of published contradictions is itself worth verifying with a targeted literature search."
+
+    return (
+        f"🚨 **FINAL VERDICT: {verdict}**\n\n"
+        f"🎯 **TOPICS TO EXPLORE TODAY:**\n" + "\n".join(topics[:3]) + "\n\n"
+        f"⚡ **STRATEGIC INSIGHT:** {insight}"
+    )
+
+
+def generate_synthesis(claim, contradicted_papers, citation_cascades):
+    """Blocking wrapper around generate_synthesis_async for synchronous callers."""
+    return run_sync(generate_synthesis_async(claim, contradicted_papers, citation_cascades))
@@ -0,0 +1,104 @@
+# agents/singleflight.py
+import asyncio
+import copy
+import threading
+import weakref
+
+from agents.telemetry import register_stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work; callers that arrive while it is
+    still running await the same task and receive a copy of its result. Work is
+    tracked per event loop because asyncio tasks cannot be awaited across loops.
+    A caller that is cancelled stops waiting without cancelling the others; once
+    the last one has gone, the shared task is cancelled too.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._inflight = weakref.WeakKeyDictionary()  # loop -> {key: [task, waiters]}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key, coro_factory):
+        """Return the result of ``coro_factory()``, sharing one run among concurrent callers of ``key``."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            inflight = self._inflight.setdefault(loop, {})
+            flight = inflight.get(key)
+            leader = flight is None
+            if leader:
+                task = loop.create_task(coro_factory())
+                flight = inflight[key] = [task, 0]
+                task.add_done_callback(lambda _, key=key, flight=flight: self._finished(inflight, key, flight))
+                self.executions += 1
+            else:
+                self.coalesced += 1
+            task = flight[0]
+            flight[1] += 1
+
+        try:
+            # shield() keeps one impatient caller's cancellation from cancelling everyone else
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight[1] -= 1
+                abandoned = flight[1] == 0 and not task.done()
+                if abandoned:
+                    # Nobody is waiting any more: stop spending upstream quota on it
+                    self._forget(inflight, key, flight)
+                    self.abandoned += 1
+            if abandoned:
+                task.cancel()
+            raise
+        with self._lock:
+            flight[1] -= 1
+        return result if leader else copy.deepcopy(result)
+
+    def _finished(self, inflight, key, flight):
+        with self._lock:
+            self._forget(inflight, key, flight)
+
+    @staticmethod
+    def _forget(inflight, key, flight):
+        # A cancelled flight may already have been replaced by a fresh one for the same key
+        if inflight.get(key) is flight:
+            del inflight[key]
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(len(tasks) for tasks in self._inflight.values())
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "abandoned": self.abandoned,
+                "in_flight": in_flight,
+            }
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name):
+    """Return the named process-wide SingleFlight group, creating it on first use."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def singleflight_stats():
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
+
+
+register_stats("singleflight", singleflight_stats)
@@ -0,0 +1,70 @@
+# agents/sqlite_worker.py
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteWorker:
+    """
+    A SQLite connection owned by one thread, which runs a store's statements in the
+    order they were submitted.
+
+    Writes are queued without waiting and committed together once the queue drains;
+    reads are awaited, and see every write queued before them. Coroutines on the
+    event loop therefore never block on the disk. Every statement function is
+    called as ``fn(db, *args)``.
+    """
+
+    def __init__(self, path, name):
+        self.name = name
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        # Opened on the worker thread, so SQLite itself refuses use from any other
+        self.db = self._executor.submit(self._connect, path).result()
+
+    @staticmethod
+    def _connect(path):
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def call(self, fn, *args):
+        """Run ``fn`` on the worker and wait for its result; for setup and synchronous callers."""
+        return self._executor.submit(fn, self.db, *args).result()
+
+    async def run(self, fn, *args):
+        """Run ``fn`` on the worker without blocking the event loop."""
+        return await asyncio.wrap_future(self._executor.submit(fn, self.db, *args))
+
+    def submit(self, fn, *args):
+        """Queue a write and return at once; a failed write is logged, not raised."""
+        with self._lock:
+            self._pending_writes += 1
+        self._executor.submit(self._write, fn, args)
+
+    def _write(self, fn, args):
+        try:
+            fn(self.db, *args)
+        except Exception as e:
+            logger.warning("⚠️ %s write failed: %s", self.name, e)
+        with self._lock:
+            self._pending_writes -= 1
+            drained = self._pending_writes == 0
+        # One commit per burst of writes rather than one per write
+        if drained:
+            try:
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.warning("⚠️ %s commit failed: %s", self.name, e)
+
+    def flush(self):
+        """Block until every queued write has run and been committed."""
+        self.call(lambda db: None)
@@ -0,0 +1,184 @@
+# agents/structured_output.py
+import json
+import re
+import threading
+
+from agents.config import STRUCTURED_OUTPUT_ENABLED
+from agents.telemetry import PARSE_RESULTS
+
+CONTRADICTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "papers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "excerpt": {"type": "string"}},
+                "required": ["title", "excerpt"],
+            },
+        }
+    },
+    "required": ["papers"],
+}
+
+CITATIONS_SCHEMA = {
+    "type": "object",
+    "properties": {"citing_papers": {"type": "array", "items": {"type": "string"}}},
+    "required": ["citing_papers"],
+}
+
+BATCH_CITATIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "works": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "number": {"type": "integer"},
+                    "citing_papers": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["number", "citing_papers"],
+            },
+        }
+    },
+    "required": ["works"],
+}
+
+
+def response_format(schema):
+    """``response_format`` argument requesting ``schema``, or None when structured output is disabled."""
+    if not STRUCTURED_OUTPUT_ENABLED:
+        return None
+    return {"type": "json_schema", "json_schema": {"schema": schema}}
+
+
+def completion_options(schema):
+    """Extra keyword arguments for chat.completions.create."""
+    fmt = response_format(schema)
+    return {"response_format": fmt} if fmt else {}
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for the array stored under ``key`` in a JSON response.
+
+    ``feed`` returns each array element as soon as its closing brace or quote has
+    arrived, so a streamed answer can be consumed item by item. Text before the
+    array (a code fence, a stray preamble) is skipped, and a response cut off
+    mid-array still yields every element that was complete.
+    """
+
+    def __init__(self, key):
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ""
+        self._pos = None  # scan position once the array has been found
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+        self.done = False
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if self.done:
+            return []
+        if self._pos is None:
+            match = self._start_re.search(self._buffer)
+            if match is None:
+                return []
+            self._pos = match.end()
+        return self._scan()
+
+    def _scan(self):
+        items = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        self._emit(buffer[self._item_start:i + 1], items)
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 0:
+                    self._item_start = i
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the array itself
+                    self.done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._item_start:i + 1], items)
+            i += 1
+        self._pos = i
+        return items
+
+    def _emit(self, text, items):
+        self._item_start = None
+        try:
+            items.append(json.loads(text))
+        except ValueError:
+            pass
+
+    @property
+    def found(self):
+        """True once the array has been located in the response."""
+        return self._pos is not None
+
+
+def parse_json_array(content, key):
+    """
+    Return the elements of the array under ``key`` in ``content``, tolerating fences
+    and truncation, or None when the response contains no such array.
+    """
+    parser = JSONArrayStreamParser(key)
+    items = parser.feed(content or "")
+    return items if parser.found else None
+
+
+class _ParseStats:
+    """Per-stage counts of how responses were parsed; "failed" means the upstream call was wasted."""
+
+    OUTCOMES = ("json", "text_fallback", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, stage, outcome):
+        with self._lock:
+            counts = self._counts.setdefault(stage, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._counts.items()}
+        for counts in stages.values():
+            total = sum(counts.values())
+            counts["failure_rate"] = round(counts["failed"] / total, 3) if total else 0.0
+        return stages
+
+
+_parse_stats = _ParseStats()
+
+
+def record_parse(stage, outcome):
+    _parse_stats.record(stage, outcome)
+    PARSE_RESULTS.inc(stage=stage, outcome=outcome)
+
+
+def parse_stats():
+    """Report how many responses per stage parsed as JSON, needed the text fallback, or failed."""
+    return _parse_stats.snapshot()
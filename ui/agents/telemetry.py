@@ -0,0 +1,329 @@
+# agents/telemetry.py
+import bisect
+import collections
+import contextvars
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from agents.config import LOG_LEVEL, TRACE_SAMPLE_RATE, TRACE_BUFFER_SIZE
+
+METRICS_PREFIX = "cascade"
+# Seconds; upstream calls run from tens of milliseconds to tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+_CLIENT_LOGGERS = ("httpx", "httpx2", "httpcore", "openai")
+
+
+def configure_logging(level=None):
+    """Send the agents' log records to stderr at LOG_LEVEL; a no-op if logging is already set up."""
+    level = level or LOG_LEVEL
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if logging.getLevelName(level) != logging.DEBUG:
+        # HTTP client libraries log every upstream request at INFO
+        for name in _CLIENT_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects, with a fixed set of label names."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Duration of each analysis stage", ("stage",))
+UPSTREAM_CALLS = Counter(
+    "upstream_calls_total", "Perplexity API attempts by calling stage and outcome", ("stage", "outcome")
+)
+UPSTREAM_SECONDS = Histogram("upstream_call_duration_seconds", "Latency of Perplexity API attempts", ("stage",))
+UPSTREAM_TOKENS = Counter(
+    "upstream_tokens_total", "Tokens billed by the Perplexity API, from each response's usage", ("stage", "kind")
+)
+PARSE_RESULTS = Counter(
+    "parse_results_total", "Model responses by how they parsed (json, text_fallback, failed)", ("stage", "outcome")
+)
+HTTP_REQUESTS = Counter("http_requests_total", "Backend requests by route and status", ("endpoint", "method", "status"))
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Backend time to response headers, by route", ("endpoint", "method")
+)
+
+_metrics = [STAGE_SECONDS, UPSTREAM_CALLS, UPSTREAM_SECONDS, UPSTREAM_TOKENS, PARSE_RESULTS, HTTP_REQUESTS, HTTP_SECONDS]
+_stats_sources = {}
+_stats_lock = threading.Lock()
+
+
+def register_stats(name, stats_fn):
+    """
+    Publish a component's existing ``stats()`` dict on /metrics: every numeric
+    (or boolean) leaf becomes a gauge named ``cascade_<name>_<path>``.
+    """
+    with _stats_lock:
+        _stats_sources[name] = stats_fn
+
+
+def _flatten(prefix, value):
+    if isinstance(value, bool):
+        yield prefix, int(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(f"{prefix}_{_NAME_RE.sub('_', str(key))}", item)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def observe_request(endpoint, method, status, seconds):
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    HTTP_SECONDS.observe(seconds, endpoint=endpoint, method=method)
+
+
+def record_token_usage(stage, usage):
+    """Count prompt/completion tokens from a response's (or final stream chunk's) ``usage``."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None) or 0
+        if tokens:
+            UPSTREAM_TOKENS.inc(tokens, stage=stage, kind=kind.split("_")[0])
+
+
+def render_metrics():
+    """Every metric and registered stats source, in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    with _stats_lock:
+        sources = sorted(_stats_sources.items())
+    for name, stats_fn in sources:
+        try:
+            stats = stats_fn()
+        except Exception:
+            logger.exception("Could not collect %s stats", name)
+            continue
+        for metric_name, value in _flatten(f"{METRICS_PREFIX}_{name}", stats):
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.append(f"{metric_name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Spans recorded while one request was handled, with offsets from the request's start."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_span_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def add_span(self, name, started, ended, parent=None, attributes=None, span_id=None):
+        with self._lock:
+            span_id = span_id if span_id is not None else next(self._ids)
+            self.spans.append({
+                "id": span_id,
+                "parent": parent,
+                "name": name,
+                "start_ms": round((started - self.started) * 1000, 2),
+                "duration_ms": round((ended - started) * 1000, 2),
+                "attributes": attributes or {},
+            })
+            return span_id
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": spans,
+        }
+
+
+# The trace of the request being handled, and the innermost open span; tasks inherit both
+_current_trace = contextvars.ContextVar("cascade_trace", default=None)
+_current_span = contextvars.ContextVar("cascade_span", default=None)
+_finished = collections.OrderedDict()
+_finished_lock = threading.Lock()
+
+
+def start_trace(name, force=False):
+    """Begin tracing the current request if forced or sampled; returns the Trace or None."""
+    if not force and (TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE):
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(trace):
+    """Close ``trace`` and keep it for GET /traces; returns its dict, or None without a trace."""
+    if trace is None:
+        return None
+    trace.duration_ms = round((time.perf_counter() - trace.started) * 1000, 2)
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    data = trace.to_dict()
+    with _finished_lock:
+        _finished[trace.id] = trace
+        while len(_finished) > TRACE_BUFFER_SIZE:
+            _finished.popitem(last=False)
+    logger.debug("Trace %s (%s): %s", trace.id, trace.name, data)
+    return data
+
+
+def get_trace(trace_id):
+    with _finished_lock:
+        trace = _finished.get(trace_id)
+    return trace.to_dict() if trace is not None else None
+
+
+def recent_traces(limit=20):
+    """Summaries of the most recently finished traces, newest first."""
+    with _finished_lock:
+        traces = list(_finished.values())[-limit:]
+    return [
+        {"id": trace.id, "name": trace.name, "started_at": trace.started_at,
+         "duration_ms": trace.duration_ms, "spans": len(trace.spans)}
+        for trace in reversed(traces)
+    ]
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record the enclosed block as a span of the current trace, if one is active.
+    Yields the attribute dict so the block can add to it.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+    parent = _current_span.get()
+    # Reserve the id up front so nested spans can point at it
+    span_id = trace.new_span_id()
+    _current_span.set(span_id)
+    started = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        # Set rather than reset: async generators may close in another task's context
+        _current_span.set(parent)
+        trace.add_span(name, started, time.perf_counter(), parent, attributes, span_id)
+
+
+def record_span(name, started, ended=None, **attributes):
+    """Add an already measured interval (perf_counter times) to the current trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, started, ended if ended is not None else time.perf_counter(),
+                       _current_span.get(), attributes)
+
+
+def record_timings(timings, started):
+    """
+    Observe the pipeline's stage timings (milliseconds) and add them to the trace.
+    Detection and citations count from ``started``; synthesis is the stretch before the total.
+    """
+    timings = timings or {}
+    for stage, duration_ms in timings.items():
+        observe_stage(stage, duration_ms / 1000)
+        if stage == "total":
+            continue
+        begin = started
+        if stage == "synthesis" and "total" in timings:
+            begin = started + (timings["total"] - duration_ms) / 1000
+        record_span(f"stage.{stage}", begin, begin + duration_ms / 1000)
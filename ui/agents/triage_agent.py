@@ -1,9 +1,138 @@
 # agents/triage_agent.py
+import heapq
+import logging
+import re
 
-def triage_contradictions(severity_scores):
+from agents.config import TRIAGE_TOP_K, TRIAGE_MIN_SCORE
+from agents.paper_titles import TitleIndex
+
+logger = logging.getLogger(__name__)
+
+# Weights of the local signals; they sum to 1 so scores stay in [0, 1]
+RELEVANCE_WEIGHT = 0.6
+TITLE_WEIGHT = 0.25
+EXCERPT_WEIGHT = 0.15
+# An excerpt this many words long counts as fully substantive
+EXCERPT_FULL_WORDS = 20
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "the and for that this with from are was were has have had not but its their there these those "
+    "than then into onto over under about between which while when where what who whom how why can "
+    "could should would may might will shall does did been being also such more most less very only "
+    "other some any all each both many much our your his her they them we you it".split()
+)
+_GENERIC_TITLES = frozenset(["untitled", "paper", "study", "article", "abstract", "unknown", "n a", "none", "title"])
+
+
+def _content_words(text):
+    return {word for word in _WORD_RE.findall((text or "").lower()) if len(word) > 2 and word not in _STOPWORDS}
+
+
+def title_quality(title):
+    """Score in [0, 1] for how much ``title`` looks like a real, specific paper title."""
+    title = (title or "").strip()
+    words = title.split()
+    lowered = title.lower()
+    if not words or not re.search(r"[a-zA-Z]", title) or lowered.strip(" .") in _GENERIC_TITLES:
+        return 0.0
+    if "http://" in lowered or "https://" in lowered or lowered.startswith("www."):
+        return 0.1
+    if len(words) < 3:
+        score = 0.4
+    elif len(words) > 40:
+        # Usually a sentence or a whole excerpt that ended up in the title field
+        score = 0.5
+    else:
+        score = 1.0
+    if title.isupper():
+        score *= 0.8
+    return score
+
+
+def score_contradiction(claim_words, paper):
+    """
+    Cheap relevance score in [0, 1] for one contradicting paper, from local signals only:
+    how much of the claim its title and excerpt mention, title quality, and excerpt substance.
+    """
+    title = paper.get("title", "")
+    excerpt = paper.get("excerpt", "")
+    if claim_words:
+        relevance = len(claim_words & _content_words(f"{title} {excerpt}")) / len(claim_words)
+    else:
+        relevance = 0.5
+    substance = min(1.0, len(excerpt.split()) / EXCERPT_FULL_WORDS)
+    return round(
+        RELEVANCE_WEIGHT * relevance + TITLE_WEIGHT * title_quality(title) + EXCERPT_WEIGHT * substance, 3
+    )
+
+
+class TriageSelector:
+    """
+    Keeps the ``top_k`` best-scoring contradictions as they arrive.
+
+    A min-heap holds the current selection, so each offer is O(log k): a paper
+    below ``min_score``, or a near-duplicate of one already seen, is rejected; once
+    the heap is full, a better paper evicts the weakest selected one. Ties go to the
+    paper that arrived first.
     """
-    Sorts contradicted papers by severity (highest to lowest).
-    Returns a sorted list of tuples: (paper_title, severity_score)
+
+    def __init__(self, claim, top_k=None, min_score=None):
+        self.top_k = TRIAGE_TOP_K if top_k is None else top_k
+        self.min_score = TRIAGE_MIN_SCORE if min_score is None else min_score
+        self.scores = {}  # title -> score, for every distinct title offered
+        self.eligible = 0  # papers that cleared min_score and were not duplicates
+        self._claim_words = _content_words(claim)
+        self._heap = []  # (score, -arrival, title)
+        self._seen = TitleIndex()
+        self._arrivals = 0
+
+    def offer(self, paper):
+        """
+        Score ``paper`` and return ``(selected, evicted_title)``: whether it joins the
+        selection, and which previously selected title it pushed out, if any.
+        """
+        title = paper.get("title", "").strip()
+        if not title or not self._seen.add(title)[1]:
+            return False, None
+        score = score_contradiction(self._claim_words, paper)
+        self.scores[title] = score
+        if score < self.min_score:
+            return False, None
+        self.eligible += 1
+        self._arrivals += 1
+        entry = (score, -self._arrivals, title)
+        if self.top_k <= 0 or len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, entry)
+            return True, None
+        if entry > self._heap[0]:
+            evicted = heapq.heapreplace(self._heap, entry)
+            return True, evicted[2]
+        return False, None
+
+    def selected(self):
+        """Selected titles, best first."""
+        return [title for _, _, title in sorted(self._heap, reverse=True)]
+
+
+def triage_contradictions(claim, contradicted_papers, top_k=None, min_score=None):
+    """
+    Pick which contradicted papers deserve a citation search.
+
+    Returns ``(selected_papers, scores)``: the ``top_k`` papers scoring at least
+    ``min_score`` (in their original order), and the score of every distinct title.
     """
-    sorted_triage = sorted(severity_scores.items(), key=lambda x: x[1], reverse=True)
-    return sorted_triage
+    selector = TriageSelector(claim, top_k, min_score)
+    for paper in contradicted_papers or []:
+        selector.offer(paper)
+    chosen = set(selector.selected())
+    selected = []
+    for paper in contradicted_papers or []:
+        title = paper.get("title", "").strip()
+        if title in chosen:
+            chosen.discard(title)
+            selected.append(paper)
+    logger.info(
+        "🩺 Triage: %d of %d contradictions selected for citation search", len(selected), len(contradicted_papers or [])
+    )
+    return selected, selector.scores
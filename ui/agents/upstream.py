@@ -0,0 +1,337 @@
+# agents/upstream.py
+import asyncio
+import collections
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from agents.config import (
+    BREAKER_COOLDOWN, BREAKER_FAILURE_THRESHOLD, PERPLEXITY_API_KEY, UPSTREAM_BACKOFF_BASE, UPSTREAM_BACKOFF_MAX,
+    UPSTREAM_BURST, UPSTREAM_CONCURRENCY_INITIAL, UPSTREAM_CONCURRENCY_MAX, UPSTREAM_CONCURRENCY_MIN,
+    UPSTREAM_MAX_RETRIES, UPSTREAM_RATE_LIMIT,
+)
+from agents.perplexity_client import get_async_client
+from agents.telemetry import UPSTREAM_CALLS, UPSTREAM_SECONDS, record_token_usage, register_stats, span
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """Raised when Perplexity could not answer, after retries, so callers don't mistake it for "no results"."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens are reserved up front, so a waiter never
+    loses its slot to a later caller, and waiting happens on the caller's own loop.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency window shared by every event loop in the process.
+
+    Each successful call grows the window by 1/limit (about +1 per window of calls);
+    a 429 halves it, but only once per round of calls sent under the current window,
+    so a burst of throttled responses counts as a single congestion signal.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._waiters = collections.deque()  # (loop, future)
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        # Caller holds the lock; slots are handed straight to waiters in FIFO order
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            if loop.is_closed():
+                continue
+            self.in_flight += 1
+            loop.call_soon_threadsafe(_grant, future)
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_throttle(self, started_at):
+        with self._lock:
+            self.throttles += 1
+            # Calls sent before the last decrease saw the old window; they are not new evidence
+            if started_at >= self._last_decrease:
+                self.limit = max(float(self.minimum), self.limit / 2)
+                self._last_decrease = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "successes": self.successes,
+                "throttles": self.throttles,
+            }
+
+
+def _grant(future):
+    # A waiter cancelled after being granted hands its slot back itself
+    if not future.done():
+        future.set_result(None)
+
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures, then lets a single probe through after the cooldown."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(
+                "Perplexity API is unavailable (circuit open); try again shortly",
+                retry_after=max(1.0, remaining),
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def abandon_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+_bucket = TokenBucket(UPSTREAM_RATE_LIMIT, UPSTREAM_BURST)
+_limiter = AdaptiveConcurrencyLimiter(UPSTREAM_CONCURRENCY_INITIAL, UPSTREAM_CONCURRENCY_MIN, UPSTREAM_CONCURRENCY_MAX)
+_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+_retries = 0
+_failures = 0
+_counter_lock = threading.Lock()
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms, or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+            return max(0.0, retry_at - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+
+async def create_chat_completion(stage="other", **kwargs):
+    """
+    Call ``chat.completions.create`` on the pooled client with pacing, adaptive
+    concurrency, retries and the circuit breaker applied.
+
+    Rate limits (429), timeouts, connection errors and 5xx responses are retried;
+    other API errors are not. Raises UpstreamError once the call cannot succeed.
+    For ``stream=True`` the concurrency slot covers opening the stream, not reading it.
+    ``stage`` labels the call's metrics and trace span.
+    """
+    if not PERPLEXITY_API_KEY:
+        UPSTREAM_CALLS.inc(stage=stage, outcome="rejected")
+        raise UpstreamError("PERPLEXITY_API_KEY is not set; add it to the project's .env file or the environment")
+    with span(f"upstream.{stage}", stream=bool(kwargs.get("stream"))) as attributes:
+        return await _create_with_retries(stage, attributes, kwargs)
+
+
+async def _create_with_retries(stage, attributes, kwargs):
+    global _retries, _failures
+    # Imported here, like the client itself, so importing the agents stays fast (see get_async_client)
+    import openai
+
+    retryable_errors = (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+    last_error = None
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        attributes["attempts"] = attempt + 1
+        try:
+            _breaker.before_call()
+        except CircuitOpenError:
+            UPSTREAM_CALLS.inc(stage=stage, outcome="circuit_open")
+            raise
+        await _bucket.acquire()
+        await _limiter.acquire()
+        retry_after = None
+        started_at = time.monotonic()
+        outcome = "cancelled"
+        try:
+            response = await get_async_client().chat.completions.create(**kwargs)
+        except openai.RateLimitError as e:
+            outcome = "rate_limited"
+            _limiter.on_throttle(started_at)
+            # The server is healthy, just busy; this is not a breaker failure
+            _breaker.record_success()
+            last_error, retry_after = e, _retry_after(e)
+        except retryable_errors as e:
+            outcome = "error"
+            _breaker.record_failure()
+            last_error, retry_after = e, _retry_after(e)
+        except openai.APIStatusError as e:
+            outcome = "rejected"
+            # A 4xx is our request's fault, not a sign the service is down
+            _breaker.record_success()
+            raise UpstreamError(f"Perplexity API error {e.status_code}: {e.message}") from e
+        except BaseException:
+            # Cancelled mid-call: let the next caller probe instead
+            _breaker.abandon_probe()
+            raise
+        else:
+            outcome = "ok"
+            _limiter.on_success()
+            _breaker.record_success()
+            # Streams report usage on their last chunk, which the caller reads
+            record_token_usage(stage, getattr(response, "usage", None))
+            return response
+        finally:
+            _limiter.release()
+            UPSTREAM_CALLS.inc(stage=stage, outcome=outcome)
+            UPSTREAM_SECONDS.observe(time.monotonic() - started_at, stage=stage)
+
+        if attempt == UPSTREAM_MAX_RETRIES:
+            break
+        delay = retry_after if retry_after is not None else _backoff(attempt)
+        with _counter_lock:
+            _retries += 1
+        logger.warning(
+            "⚠️ Perplexity call failed (%s); retry %d in %.1fs", type(last_error).__name__, attempt + 1, delay
+        )
+        await asyncio.sleep(min(delay, UPSTREAM_BACKOFF_MAX))
+
+    with _counter_lock:
+        _failures += 1
+    attributes["error"] = type(last_error).__name__
+    raise UpstreamError(
+        f"Perplexity API unavailable after {UPSTREAM_MAX_RETRIES + 1} attempts: {last_error}",
+        retry_after=_retry_after(last_error),
+    ) from last_error
+
+
+def upstream_stats():
+    """Report the limiter window, breaker state, and retry/failure counters."""
+    with _counter_lock:
+        retries, failures = _retries, _failures
+    return {
+        "rate_limit": UPSTREAM_RATE_LIMIT,
+        "burst": UPSTREAM_BURST,
+        "concurrency": _limiter.stats(),
+        "circuit": _breaker.stats(),
+        "retries": retries,
+        "failed_calls": failures,
+    }
+
+
+register_stats("upstream", upstream_stats)
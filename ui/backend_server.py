@@ -1,21 +1,48 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 import uvicorn
+import logging
 import sys
 import os
+import time
 from pathlib import Path
 
 # Add the ui directory to the Python path so we can import the agents
 sys.path.append(str(Path(__file__).parent))
 
-# Import the agent functions
-from agents.contradiction_detector import detect_contradictions
-from agents.citation_propagator import propagate_citations
-from agents.severity_assessor import generate_synthesis
-from PyPDF2 import PdfReader
-import io
+# Import the async agent functions so requests never block the event loop; agents.config loads the .env
+from agents.config import BACKEND_PORT, PERPLEXITY_API_KEY
+from agents.contradiction_detector import detect_contradictions_async
+from agents.citation_propagator import citation_stats, collect_paper_titles, expand_cascade_async, propagate_citations_async
+from agents.citation_graph import get_citation_graph
+from agents.triage_agent import triage_contradictions
+from agents.severity_assessor import generate_synthesis_async, stream_synthesis_async
+from agents.perplexity_client import aclose_client, pool_stats, warm_up
+from agents.upstream import UpstreamError, upstream_stats
+from agents.structured_output import parse_stats
+from agents.llm_cache import cache_stats
+from agents.claim_index import claim_index_stats
+from agents.singleflight import singleflight_stats
+from agents.pipeline import (
+    analyze_claim_async, analyze_claim_events, format_server_timing, format_sse, parse_deadline_ms,
+)
+from agents.job_queue import QueueFullError, get_job_queue, shutdown_job_queue, FINISHED_STATES, SUCCEEDED
+from agents.pdf_extractor import (
+    PDFLimitError, discard_upload, extract_pdf_text_cached, iter_pdf_pages_cached, spool_upload,
+)
+from agents.pdf_text_cache import get_pdf_text_cache, is_valid_digest
+from agents.telemetry import (
+    configure_logging, finish_trace, get_trace, observe_request, recent_traces, render_metrics, start_trace,
+)
+import json
+
+configure_logging()
+logger = logging.getLogger("backend_server")
 
 app = FastAPI(title="Cascade - AI Research Analysis API", version="1.0.0")
 
@@ -37,10 +64,27 @@ class ContradictionResponse(BaseModel):
 
 class CitationRequest(BaseModel):
     contradictions: List[Dict[str, str]]
+    batch_size: Optional[int] = None
+    # With a claim, only the contradictions the triage selects are searched
+    claim: Optional[str] = None
+    triage_top_k: Optional[int] = None
+    triage_min_score: Optional[float] = None
 
 class CitationResponse(BaseModel):
     citation_cascades: Dict[str, List[str]]
 
+class CitationGraphRequest(BaseModel):
+    contradictions: List[Dict[str, str]]
+    depth: Optional[int] = None
+    max_nodes: Optional[int] = None
+    batch_size: Optional[int] = None
+
+class CitationGraphResponse(BaseModel):
+    nodes: List[Dict]
+    edges: List[Dict[str, str]]
+    stored_expansions: int
+    searched_expansions: int
+
 class SynthesisRequest(BaseModel):
     claim: str
     contradictions: List[Dict[str, str]]
@@ -51,44 +95,187 @@ class SynthesisResponse(BaseModel):
 
 class TextExtractionResponse(BaseModel):
     text: str
+    sha256: Optional[str] = None
 
 class AnalyzeRequest(BaseModel):
     claim: str
+    # Time budget for the whole analysis; the X-Deadline-Ms header is used when this is absent.
+    # Checked by request_deadline_ms rather than here, so a bad value is a 400 as in the Flask backend
+    deadline_ms: Optional[Any] = None
+    max_citation_papers: Optional[int] = None
+    # Per-request overrides of TRIAGE_TOP_K / TRIAGE_MIN_SCORE
+    triage_top_k: Optional[int] = None
+    triage_min_score: Optional[float] = None
 
 class AnalyzeResponse(BaseModel):
     claim: str
     contradictions: List[Dict[str, str]]
     citation_cascades: Dict[str, List[str]]
     synthesis: str
+    # Which parts were cut short by the deadline or citation cap
+    partial: Optional[Dict[str, bool]] = None
+    # Triage score of every contradiction and the titles selected for citation search
+    triage: Optional[Dict[str, Any]] = None
+
+class JobRequest(BaseModel):
+    claim: str
+    priority: int = 0
+
+def upstream_unavailable(e: UpstreamError) -> HTTPException:
+    """503 for a Perplexity outage, so clients retry instead of trusting an empty result"""
+    retry_after = str(max(1, int(e.retry_after or 5)))
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": retry_after})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them (to response headers, for streams) per route"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        observe_request(getattr(route, "path", "unmatched"), request.method, status, time.perf_counter() - started)
 
 @app.get("/")
 async def root():
     return {"message": "Cascade - AI Research Analysis API is running"}
 
+@app.on_event("startup")
+async def warm_up_perplexity_client():
+    warm_up()
+
+@app.on_event("shutdown")
+async def close_perplexity_client():
+    shutdown_job_queue()
+    await aclose_client()
+
+@app.get("/pool_stats")
+async def pool_stats_endpoint():
+    """
+    Report Perplexity connection pool usage (open/idle connections, reuse ratio)
+    """
+    return pool_stats()
+
+@app.get("/upstream_stats")
+async def upstream_stats_endpoint():
+    """
+    Report the adaptive concurrency window, circuit breaker state, and retry counters
+    """
+    return upstream_stats()
+
+@app.get("/parse_stats")
+async def parse_stats_endpoint():
+    """
+    Report per stage how many responses parsed as JSON, needed the text fallback, or
+    could not be parsed at all (wasted upstream calls)
+    """
+    return parse_stats()
+
+@app.get("/cache_stats")
+async def cache_stats_endpoint():
+    """
+    Report LLM response cache hit/miss counters and tier sizes, how many
+    in-flight calls were coalesced, and the similar-claim index's hit rate and lookup latency
+    """
+    return dict(cache_stats(), singleflight=singleflight_stats(), claim_index=claim_index_stats())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus metrics: stage and upstream latency histograms, upstream calls and
+    tokens, parse outcomes, request counts, and every stats endpoint's counters
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces_endpoint(limit: int = 20):
+    """
+    List the most recently recorded traces (X-Trace: 1 or TRACE_SAMPLE_RATE)
+    """
+    return {"traces": recent_traces(limit)}
+
+@app.get("/traces/{trace_id}")
+async def trace_endpoint(trace_id: str):
+    """
+    Return one trace's spans, with offsets and durations in milliseconds
+    """
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
 @app.post("/extract_text", response_model=TextExtractionResponse)
 async def extract_text_from_pdf(file: UploadFile = File(...)):
     """
     Extract text from uploaded PDF file
     """
+    pdf_path = None
     try:
         if not file.filename or not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="File must be a PDF")
         
-        # Read the PDF file
-        pdf_content = await file.read()
-        pdf_reader = PdfReader(io.BytesIO(pdf_content))
-        
-        # Extract text from all pages
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
+        # Spool the upload to disk, then extract page ranges in the process pool
+        # (or reuse the text from an earlier upload of the same bytes)
+        pdf_path, digest = await run_in_threadpool(spool_upload, file.file)
+        text = await run_in_threadpool(extract_pdf_text_cached, pdf_path, digest)
         
-        return TextExtractionResponse(text=text.strip())
+        return TextExtractionResponse(text=text, sha256=digest)
     
+    except HTTPException:
+        raise
+    except PDFLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
+    finally:
+        if pdf_path:
+            os.unlink(pdf_path)
+
+@app.get("/extract_text/{sha256}", response_model=TextExtractionResponse)
+async def extract_text_by_hash(sha256: str):
+    """
+    Return previously extracted text for a PDF by the SHA-256 of its bytes,
+    so clients can skip the upload on a cache hit (404 on a miss)
+    """
+    sha256 = sha256.lower()
+    if not is_valid_digest(sha256):
+        raise HTTPException(status_code=400, detail="Expected a hex SHA-256 digest")
+    text = await run_in_threadpool(get_pdf_text_cache().get_text, sha256)
+    if text is None:
+        raise HTTPException(status_code=404, detail="No extracted text for this PDF")
+    return TextExtractionResponse(text=text, sha256=sha256)
+
+@app.post("/extract_text/stream")
+async def extract_text_stream(file: UploadFile = File(...)):
+    """
+    Extract text from an uploaded PDF, streaming one NDJSON line per page as it is extracted
+    """
+    if not file.filename or not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+
+    try:
+        pdf_path, digest = await run_in_threadpool(spool_upload, file.file)
+    except PDFLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    def page_lines():
+        try:
+            for page_number, page_text in iter_pdf_pages_cached(pdf_path, digest):
+                yield json.dumps({"page": page_number, "text": page_text}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error extracting text from PDF: {str(e)}"}) + "\n"
+        finally:
+            discard_upload(pdf_path)
+
+    # Sync iterators are driven from the threadpool, keeping the event loop free. The
+    # generator never runs if the client leaves before the body starts, so the
+    # background task deletes the upload too
+    return StreamingResponse(
+        page_lines(), media_type="application/x-ndjson", background=BackgroundTask(discard_upload, pdf_path)
+    )
 
 @app.post("/detect_contradictions", response_model=ContradictionResponse)
 async def detect_contradictions_endpoint(request: ContradictionRequest):
@@ -96,9 +283,11 @@ async def detect_contradictions_endpoint(request: ContradictionRequest):
     Detect contradictions for a given research claim
     """
     try:
-        contradictions = detect_contradictions(request.claim)
+        contradictions = await detect_contradictions_async(request.claim)
         return ContradictionResponse(contradictions=contradictions)
     
+    except UpstreamError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error detecting contradictions: {str(e)}")
 
@@ -108,58 +297,226 @@ async def propagate_citations_endpoint(request: CitationRequest):
     Propagate citations for contradicted papers
     """
     try:
-        citation_cascades = propagate_citations(request.contradictions)
+        contradictions = request.contradictions
+        if request.claim:
+            contradictions, _ = triage_contradictions(
+                request.claim, contradictions, request.triage_top_k, request.triage_min_score
+            )
+        citation_cascades = await propagate_citations_async(contradictions, batch_size=request.batch_size)
         return CitationResponse(citation_cascades=citation_cascades)
     
+    except UpstreamError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error propagating citations: {str(e)}")
 
+@app.post("/citation_graph", response_model=CitationGraphResponse)
+async def citation_graph_endpoint(request: CitationGraphRequest):
+    """
+    Expand a multi-hop citation cascade from the contradicted papers, reusing stored edges
+    """
+    try:
+        cascade = await expand_cascade_async(
+            collect_paper_titles(request.contradictions),
+            depth=request.depth,
+            max_nodes=request.max_nodes,
+            batch_size=request.batch_size,
+        )
+        return CitationGraphResponse(**cascade)
+
+    except UpstreamError as e:
+        raise upstream_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error expanding citation graph: {str(e)}")
+
+@app.get("/citation_stats")
+async def citation_stats_endpoint():
+    """
+    Compare per-paper and batched citation lookups: round trips, tokens, latency, fallbacks
+    """
+    return citation_stats()
+
+@app.get("/citation_graph/stats")
+async def citation_graph_stats_endpoint():
+    """
+    Report how many papers and citation edges the graph store holds
+    """
+    return await run_in_threadpool(get_citation_graph().stats)
+
 @app.post("/generate_synthesis", response_model=SynthesisResponse)
-async def generate_synthesis_endpoint(request: SynthesisRequest):
+async def generate_synthesis_endpoint(request: SynthesisRequest, stream: bool = False):
     """
-    Generate synthesis based on claim, contradictions, and citation cascades
+    Generate synthesis based on claim, contradictions, and citation cascades.
+    With ?stream=true the briefing is sent as a chunked text response while it is generated.
     """
+    if stream:
+        chunks = stream_synthesis_async(request.claim, request.contradictions, request.citationCascades)
+        # Wait for the first chunk before sending headers, so an outage is still a 503 rather than a cut-off 200
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except UpstreamError as e:
+            raise upstream_unavailable(e)
+
+        async def body():
+            if first:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+
+        return StreamingResponse(
+            body(),
+            media_type="text/plain; charset=utf-8",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     try:
-        synthesis = generate_synthesis(request.claim, request.contradictions, request.citationCascades)
+        synthesis = await generate_synthesis_async(request.claim, request.contradictions, request.citationCascades)
         return SynthesisResponse(synthesis=synthesis)
     
+    except UpstreamError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating synthesis: {str(e)}")
 
+def request_deadline_ms(request: AnalyzeRequest, x_deadline_ms: Optional[str]):
+    """Per-request time budget from the body's deadline_ms, else the X-Deadline-Ms header (400 if malformed)"""
+    try:
+        return parse_deadline_ms(request.deadline_ms if request.deadline_ms is not None else x_deadline_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_claim_endpoint(request: AnalyzeRequest):
+async def analyze_claim_endpoint(
+    request: AnalyzeRequest,
+    response: Response,
+    x_deadline_ms: Optional[str] = Header(None),
+    x_trace: Optional[str] = Header(None),
+):
     """
-    Unified endpoint that runs the full analysis pipeline
+    Unified endpoint that runs the full analysis pipeline; stage durations are
+    reported in the Server-Timing header. Send X-Trace: 1 to record its spans
+    (the X-Trace-Id response header names the trace at /traces/{id})
     """
+    deadline_ms = request_deadline_ms(request, x_deadline_ms)
+    trace = start_trace("analyze", force=x_trace == "1")
     try:
-        print(f"🔍 Backend: Starting analysis for claim: {request.claim[:100]}...")
-        
-        # Step 1: Detect contradictions
-        print("🔍 Backend: Step 1 - Detecting contradictions...")
-        contradictions = detect_contradictions(request.claim)
-        print(f"🔍 Backend: Found {len(contradictions)} contradictions")
-        
-        # Step 2: Propagate citations
-        print("🔍 Backend: Step 2 - Propagating citations...")
-        citation_cascades = propagate_citations(contradictions)
-        print(f"🔍 Backend: Found citations for {len(citation_cascades)} papers")
-        
-        # Step 3: Generate synthesis
-        print("🔍 Backend: Step 3 - Generating synthesis...")
-        synthesis = generate_synthesis(request.claim, contradictions, citation_cascades)
-        print("🔍 Backend: Analysis complete!")
-        
-        return AnalyzeResponse(
-            claim=request.claim,
-            contradictions=contradictions,
-            citation_cascades=citation_cascades,
-            synthesis=synthesis
+        logger.info("🔍 Backend: Starting analysis for claim: %.100s", request.claim)
+
+        # Detect → propagate → synthesize; identical in-flight claims share one run
+        result = await analyze_claim_async(
+            request.claim,
+            deadline_ms=deadline_ms,
+            max_citation_papers=request.max_citation_papers,
+            top_k=request.triage_top_k,
+            min_score=request.triage_min_score,
         )
-    
+        timings = result.pop("timings", None)
+        logger.info(
+            "🔍 Backend: Analysis complete: %d contradictions, citations for %d papers (%s)",
+            len(result["contradictions"]), len(result["citation_cascades"]), format_server_timing(timings),
+        )
+
+        response.headers["Server-Timing"] = format_server_timing(timings)
+        if trace is not None:
+            response.headers["X-Trace-Id"] = trace.id
+        return AnalyzeResponse(**result)
+
+    except UpstreamError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
-        print(f"🔍 Backend: Error in analyze_claim_endpoint: {str(e)}")
+        logger.error("🔍 Backend: Error in analyze_claim_endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Error analyzing claim: {str(e)}")
+    finally:
+        finish_trace(trace)
+
+@app.post("/analyze/stream")
+async def analyze_claim_stream_endpoint(request: AnalyzeRequest, x_deadline_ms: Optional[str] = Header(None)):
+    """
+    Run the full analysis pipeline and stream each stage as a server-sent event
+    (contradictions, one citations event per paper, synthesis, done)
+    """
+    if not request.claim or not request.claim.strip():
+        raise HTTPException(status_code=400, detail="No claim provided")
+    deadline_ms = request_deadline_ms(request, x_deadline_ms)
+
+    async def event_stream():
+        try:
+            async for event, data in analyze_claim_events(
+                request.claim,
+                deadline_ms=deadline_ms,
+                max_citation_papers=request.max_citation_papers,
+                top_k=request.triage_top_k,
+                min_score=request.triage_min_score,
+            ):
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error("🔍 Backend: Error in analyze_claim_stream_endpoint: %s", e)
+            yield format_sse("error", {"detail": f"Error analyzing claim: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs", status_code=202)
+async def submit_job_endpoint(request: JobRequest):
+    """
+    Queue a full analysis in the background and return its job ID
+    """
+    if not request.claim or not request.claim.strip():
+        raise HTTPException(status_code=400, detail="No claim provided")
+    try:
+        return get_job_queue().submit(request.claim, request.priority)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+@app.get("/jobs/stats")
+async def job_stats_endpoint():
+    """
+    Report queue depth, worker usage, and wait/run time percentiles
+    """
+    return get_job_queue().stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str):
+    """
+    Poll the status of a background analysis
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/result", response_model=AnalyzeResponse)
+async def get_job_result_endpoint(job_id: str):
+    """
+    Fetch the result of a finished background analysis
+    """
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Job is still {job['status']}")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=410, detail=f"Job {job['status']}: {job['error'] or 'no result'}")
+    return job_queue.result(job_id)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job_endpoint(job_id: str):
+    """
+    Cancel a queued or running background analysis
+    """
+    job_queue = get_job_queue()
+    if not job_queue.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or already finished")
+    return job_queue.get(job_id)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8501)
+    if not PERPLEXITY_API_KEY:
+        logger.warning("⚠️ PERPLEXITY_API_KEY is not set; analyses will fail until it is added to your .env file")
+    uvicorn.run(app, host="0.0.0.0", port=BACKEND_PORT)
 
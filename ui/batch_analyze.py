@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Bulk analysis of a JSONL file of claims, without the HTTP backend.
+
+Each input line is a JSON object holding a claim (``{"id": "c1", "claim": "..."}``)
+or a bare JSON string. Claims run through detect → propagate → synthesize on
+``--workers`` concurrent workers, with Perplexity calls paced to ``--rate`` per
+second across all of them. Every result is appended to the output JSONL as soon as
+it finishes and progress is checkpointed beside it (``<output>.checkpoint``), so
+re-running the same command after an interruption skips the finished claims.
+
+The input is streamed and only a bounded window of claims is in flight, so memory
+use does not grow with the size of the input.
+
+    python ui/batch_analyze.py findings.jsonl -o results.jsonl --workers 8 --rate 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add the ui directory to the Python path so we can import the agents
+sys.path.append(str(Path(__file__).parent))
+
+
+class Checkpoint:
+    """
+    How far a run got: every input line below ``watermark`` is finished, as are the
+    lines in ``done_above`` (claims finish out of order, so a few complete before
+    the watermark reaches them). ``output_bytes`` is how much of the output file
+    those lines account for; anything written after it is discarded on resume.
+    """
+
+    def __init__(self, path, input_path, watermark=1, done_above=(), output_bytes=0, complete=False):
+        self.path = Path(path)
+        self.input_path = str(input_path)
+        self.watermark = watermark
+        self.done_above = set(done_above)
+        self.output_bytes = output_bytes
+        self.complete = complete
+
+    @classmethod
+    def load(cls, path, input_path):
+        data = json.loads(Path(path).read_text())
+        return cls(
+            path,
+            data.get("input", input_path),
+            data.get("watermark", 1),
+            data.get("done_above", ()),
+            data.get("output_bytes", 0),
+            data.get("complete", False),
+        )
+
+    def is_done(self, line_number):
+        return line_number < self.watermark or line_number in self.done_above
+
+    def mark_done(self, line_number, output_bytes):
+        self.done_above.add(line_number)
+        while self.watermark in self.done_above:
+            self.done_above.discard(self.watermark)
+            self.watermark += 1
+        self.output_bytes = output_bytes
+
+    def save(self):
+        # Write-then-rename, so a crash mid-save leaves the previous checkpoint intact
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(json.dumps({
+            "input": self.input_path,
+            "watermark": self.watermark,
+            "done_above": sorted(self.done_above),
+            "output_bytes": self.output_bytes,
+            "complete": self.complete,
+        }))
+        os.replace(temporary, self.path)
+
+
+def parse_claim(raw, field):
+    """Return ``(claim, record_id)`` from one input line; raises ValueError for unusable lines."""
+    item = json.loads(raw)
+    if isinstance(item, str):
+        return item.strip(), None
+    if not isinstance(item, dict):
+        raise ValueError("line is neither a JSON object nor a string")
+    claim = item.get(field)
+    if not isinstance(claim, str) or not claim.strip():
+        raise ValueError(f"no '{field}' string")
+    return claim.strip(), item.get("id")
+
+
+def open_output(output_path, checkpoint_path, input_path, restart):
+    """Return ``(checkpoint, output_file)``, resuming from the checkpoint when there is one."""
+    if restart or not checkpoint_path.exists():
+        if output_path.exists() and not restart:
+            raise SystemExit(f"{output_path} exists but has no checkpoint; pass --restart to overwrite it")
+        checkpoint = Checkpoint(checkpoint_path, input_path)
+        checkpoint.save()
+        return checkpoint, open(output_path, "wb")
+
+    checkpoint = Checkpoint.load(checkpoint_path, input_path)
+    if checkpoint.input_path != str(input_path):
+        print(f"⚠️ Checkpoint was written for {checkpoint.input_path}; resuming anyway")
+    # Results written after the last checkpoint are dropped and their claims run again
+    with open(output_path, "ab") as output:
+        output.truncate(checkpoint.output_bytes)
+    print(f"♻️ Resuming: lines before {checkpoint.watermark} and {len(checkpoint.done_above)} more are done")
+    return checkpoint, open(output_path, "ab")
+
+
+async def run_batch(args, checkpoint, output):
+    from agents.perplexity_client import aclose_client
+    from agents.pipeline import analyze_claim_async
+    from agents.upstream import UpstreamError
+
+    queue = asyncio.Queue(maxsize=args.workers * 2)
+    # Claims may finish at most this far ahead of the oldest unfinished one
+    window = max(args.workers * 4, args.window)
+    progressed = asyncio.Condition()
+    counts = {"succeeded": 0, "failed": 0}
+    started = time.monotonic()
+
+    async def finish(line_number, record):
+        if record is not None:
+            output.write((json.dumps(record) + "\n").encode("utf-8"))
+            output.flush()
+            counts["failed" if "error" in record else "succeeded"] += 1
+        checkpoint.mark_done(line_number, output.tell())
+        checkpoint.save()
+        async with progressed:
+            progressed.notify_all()
+
+    async def analyze(line_number, raw):
+        try:
+            claim, record_id = parse_claim(raw, args.field)
+        except ValueError as e:
+            return {"line": line_number, "error": f"Unusable input line: {str(e)}"}
+        record = {"line": line_number, "id": record_id, "claim": claim}
+
+        for attempt in range(1, args.max_attempts + 1):
+            try:
+                result = await analyze_claim_async(claim, deadline_ms=args.deadline_ms)
+                return dict(record, **result)
+            except UpstreamError as e:
+                if attempt == args.max_attempts:
+                    return dict(record, error=str(e))
+                # The API (or its circuit breaker) needs time; don't burn through the input meanwhile
+                delay = e.retry_after or 5 * attempt
+                print(f"⚠️ Line {line_number}: {str(e)}; retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                return dict(record, error=f"Analysis failed: {str(e)}")
+
+    async def produce():
+        with open(args.input, encoding="utf-8") as lines:
+            for line_number, raw in enumerate(lines, 1):
+                if checkpoint.is_done(line_number):
+                    continue
+                async with progressed:
+                    await progressed.wait_for(lambda: line_number < checkpoint.watermark + window)
+                if not raw.strip():
+                    await finish(line_number, None)
+                    continue
+                await queue.put((line_number, raw))
+        for _ in range(args.workers):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            line_number, raw = item
+            await finish(line_number, await analyze(line_number, raw))
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.progress_interval)
+            done = counts["succeeded"] + counts["failed"]
+            print(f"📊 {done} claims ({counts['failed']} failed) in {time.monotonic() - started:.0f}s, "
+                  f"{done / (time.monotonic() - started):.2f}/s; next unfinished line {checkpoint.watermark}")
+
+    reporter = asyncio.ensure_future(report())
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(args.workers)))
+    finally:
+        reporter.cancel()
+        await aclose_client()
+    return counts, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every claim in a JSONL file, resumably")
+    parser.add_argument("input", type=Path, help="JSONL file: one object (or string) per claim")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="JSONL file results are appended to")
+    parser.add_argument("--field", default="claim", help="key holding the claim in each input object")
+    parser.add_argument("--workers", type=int, default=4, help="claims analyzed concurrently")
+    parser.add_argument("--rate", type=float, help="Perplexity requests per second across all workers "
+                        "(default PERPLEXITY_RATE_LIMIT)")
+    parser.add_argument("--burst", type=int, help="Perplexity requests that may be sent back to back "
+                        "(default PERPLEXITY_BURST)")
+    parser.add_argument("--deadline-ms", type=int, help="time budget per claim, as for /analyze")
+    parser.add_argument("--max-attempts", type=int, default=3, help="tries per claim while Perplexity is unavailable")
+    parser.add_argument("--window", type=int, default=0, help="max lines finished ahead of the oldest unfinished one")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and overwrite the output")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "WARNING"))
+    args = parser.parse_args()
+
+    # Pacing is configured when agents.upstream is imported, so set it first; a flag
+    # overrides .env, and anything left unset keeps its value from .env or the environment
+    if args.rate is not None:
+        os.environ["PERPLEXITY_RATE_LIMIT"] = str(args.rate)
+    if args.burst is not None:
+        os.environ["PERPLEXITY_BURST"] = str(args.burst)
+    from agents.telemetry import configure_logging
+    configure_logging(args.log_level.upper())
+
+    checkpoint_path = args.output.with_name(args.output.name + ".checkpoint")
+    checkpoint, output = open_output(args.output, checkpoint_path, args.input, args.restart)
+    if checkpoint.complete:
+        print(f"✅ {args.input} was already fully analyzed into {args.output} (pass --restart to redo it)")
+        return 0
+
+    print(f"🚀 Analyzing {args.input} with {args.workers} workers → {args.output}")
+    try:
+        with output:
+            counts, elapsed = asyncio.run(run_batch(args, checkpoint, output))
+    except KeyboardInterrupt:
+        print(f"\n🛑 Interrupted; run the same command again to resume from line {checkpoint.watermark}")
+        return 130
+
+    checkpoint.complete = True
+    checkpoint.save()
+    print(f"✅ {counts['succeeded']} claims analyzed, {counts['failed']} failed, in {elapsed:.1f}s")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the agents package.
+
+Imports each agents module in a fresh interpreter, without PERPLEXITY_API_KEY and
+without the project's .env, and checks two things: the median import time stays
+within the budget, and none of the heavy dependencies (the OpenAI SDK, httpx,
+PyPDF2) is imported until a request actually needs it. Exits with status 1 when
+either check fails, so worker processes and CLI tools keep starting fast.
+
+    python bench/import_budget.py
+    python bench/import_budget.py --budget-ms 100 --runs 9
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+UI_DIR = Path(__file__).resolve().parent.parent
+MODULES = (
+    "agents.config",
+    "agents.telemetry",
+    "agents.perplexity_client",
+    "agents.upstream",
+    "agents.contradiction_detector",
+    "agents.citation_propagator",
+    "agents.severity_assessor",
+    "agents.pipeline",
+    "agents.job_queue",
+    "agents.pdf_extractor",
+)
+# Loaded on first use only; any of them at import time costs hundreds of milliseconds
+HEAVY_MODULES = ("openai", "httpx", "PyPDF2")
+DEFAULT_BUDGET_MS = 150.0
+
+_PROBE = """
+import importlib, json, sys, time
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed, "heavy": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def probe_environment():
+    """The current environment minus the API key, with .env loading pointed at an empty file."""
+    env = dict(os.environ)
+    env.pop("PERPLEXITY_API_KEY", None)
+    env["CASCADE_ENV_FILE"] = os.devnull
+    return env
+
+
+def measure(module, runs, env):
+    """Import ``module`` in ``runs`` fresh interpreters; returns times (ms) and heavy modules seen."""
+    times, heavy = [], set()
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE, module, *HEAVY_MODULES],
+            cwd=UI_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()
+            return None, {"error": error[-1] if error else f"exit status {completed.returncode}"}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result["ms"])
+        heavy.update(result["heavy"])
+    return times, {"heavy": sorted(heavy)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the agents package's import time and lazy dependencies")
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="allowed median import time")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    env = probe_environment()
+    results = {}
+    for module in args.modules:
+        times, details = measure(module, args.runs, env)
+        result = dict(details)
+        if times is None:
+            result["status"] = "error"
+        else:
+            result["median_ms"] = round(statistics.median(times), 1)
+            result["max_ms"] = round(max(times), 1)
+            if details["heavy"]:
+                result["status"] = "eager"
+            elif result["median_ms"] > args.budget_ms:
+                result["status"] = "over budget"
+            else:
+                result["status"] = "ok"
+        results[module] = result
+
+    failed = [module for module, result in results.items() if result["status"] != "ok"]
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "modules": results, "failed": failed}, indent=2))
+    else:
+        print(f"{'module':<32}{'median ms':>12}{'max ms':>12}  status")
+        for module, result in results.items():
+            if result["status"] == "error":
+                print(f"{module:<32}{'-':>12}{'-':>12}  ❌ {result['error']}")
+                continue
+            status = result["status"]
+            if result["heavy"]:
+                status += f" (imports {', '.join(result['heavy'])})"
+            print(f"{module:<32}{result['median_ms']:>12.1f}{result['max_ms']:>12.1f}  {status}")
+
+    if failed:
+        print(f"❌ Over the {args.budget_ms:.0f} ms budget or importing heavy dependencies: {', '.join(failed)}")
+        return 1
+    print(f"✅ Every module imports within {args.budget_ms:.0f} ms, without a key and without heavy dependencies")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
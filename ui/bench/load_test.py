@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Load generator for the analysis backends.
+
+Drives /analyze, /analyze/stream, /extract_text and the per-stage endpoints with a
+weighted request mix, either closed-loop (``--concurrency`` clients sending back to
+back) or open-loop (Poisson arrivals at ``--rate`` per second, at most
+``--concurrency`` in flight). Reports throughput, p50/p95/p99 latency, error rates
+and the Server-Timing stage breakdown as JSON.
+
+    # spawn backend_server.py against the local Perplexity stand-in
+    python bench/load_test.py --backend fastapi --concurrency 16 --duration 30 --output fastapi.json
+    # the Flask backend, same load, compared with the previous run
+    python bench/load_test.py --backend flask --concurrency 16 --duration 30 --compare fastapi.json
+    # an already running server
+    python bench/load_test.py --url http://127.0.0.1:8501 --rate 5 --mix analyze=3,extract_text=1
+
+The per-stage endpoints (/detect_contradictions, /propagate_citations,
+/generate_synthesis) exist only on backend_server.py.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.mock_perplexity import add_mock_arguments, contradiction_papers, mock_options, start_mock_server  # noqa: E402
+from bench.run_benchmarks import make_sample_pdf  # noqa: E402
+
+UI_DIR = Path(__file__).resolve().parent.parent
+BACKENDS = {"fastapi": "backend_server.py", "flask": "simple_backend.py"}
+OPERATIONS = (
+    "analyze", "analyze_stream", "extract_text", "detect_contradictions", "propagate_citations", "generate_synthesis",
+)
+DEFAULT_CLAIMS = [
+    "Daily coffee consumption improves long-term memory in healthy adults",
+    "Intermittent fasting reduces insulin resistance in obese patients",
+    "Vitamin D supplementation prevents bone fractures in elderly women",
+    "Social media use causes depression in teenagers",
+    "Regular aerobic exercise lowers resting blood pressure by 5 mmHg",
+    "Mindfulness training improves working memory capacity in students",
+]
+
+
+def parse_mix(spec):
+    """``analyze=8,extract_text=2`` -> {operation: weight}."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name} (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))], 1)
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "mean": round(sum(samples) / len(samples), 1),
+        "max": round(samples[-1], 1),
+    }
+
+
+def parse_server_timing(header):
+    """``detection;dur=12.5, total;dur=80`` -> {"detection": 12.5, "total": 80.0}."""
+    timings = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if param.startswith("dur="):
+                try:
+                    timings[name] = float(param[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+class Inputs:
+    """Claims and PDFs to send; with ``unique`` every request gets an input no cache has seen."""
+
+    def __init__(self, claims, pdfs, unique, seed):
+        self.claims = claims
+        self.pdfs = pdfs
+        self.unique = unique
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def claim(self):
+        self.counter += 1
+        claim = self.rng.choice(self.claims)
+        return f"{claim} (load test {self.counter})" if self.unique else claim
+
+    def pdf(self):
+        self.counter += 1
+        name, data = self.rng.choice(self.pdfs)
+        if self.unique:
+            # Bytes after %%EOF are ignored by readers but change the content hash
+            data = data + b"\n%% load test %d\n" % self.counter
+        return name, data
+
+
+def build_request(operation, inputs):
+    """Return ``(path, httpx request kwargs)`` for one operation."""
+    if operation in ("analyze", "analyze_stream", "detect_contradictions"):
+        path = {"analyze": "/analyze", "analyze_stream": "/analyze/stream"}.get(operation, "/detect_contradictions")
+        return path, {"json": {"claim": inputs.claim()}}
+    if operation == "extract_text":
+        name, data = inputs.pdf()
+        return "/extract_text", {"files": {"file": (name, data, "application/pdf")}}
+    claim = inputs.claim()
+    papers = contradiction_papers(claim, 3)[:3]
+    if operation == "propagate_citations":
+        return "/propagate_citations", {"json": {"contradictions": papers}}
+    cascades = {paper["title"]: [f"Citing work {n}" for n in range(3)] for paper in papers}
+    return "/generate_synthesis", {"json": {"claim": claim, "contradictions": papers, "citationCascades": cascades}}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = collections.defaultdict(list)  # operation -> latency ms of successful requests
+        self.first_byte = collections.defaultdict(list)
+        self.stages = collections.defaultdict(lambda: collections.defaultdict(list))
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.errors = collections.defaultdict(collections.Counter)
+
+    def record(self, operation, status, latency_ms, timings=None, first_byte_ms=None, error=None):
+        self.statuses[operation][str(status)] += 1
+        if error is not None or not 200 <= status < 300:
+            self.errors[operation][error or f"HTTP {status}"] += 1
+            return
+        self.samples[operation].append(latency_ms)
+        if first_byte_ms is not None:
+            self.first_byte[operation].append(first_byte_ms)
+        for stage, duration in (timings or {}).items():
+            self.stages[operation][stage].append(duration)
+
+    def report(self, elapsed):
+        operations = {}
+        all_samples = []
+        total = failed = 0
+        for operation in sorted(self.statuses):
+            count = sum(self.statuses[operation].values())
+            errors = sum(self.errors[operation].values())
+            total += count
+            failed += errors
+            all_samples.extend(self.samples[operation])
+            operations[operation] = {
+                "requests": count,
+                "errors": errors,
+                "error_rate": round(errors / count, 4) if count else 0.0,
+                "throughput_rps": round((count - errors) / elapsed, 2) if elapsed else 0.0,
+                "latency_ms": latency_summary(self.samples[operation]),
+                "status_codes": dict(self.statuses[operation]),
+                "error_kinds": dict(self.errors[operation]),
+            }
+            if self.first_byte[operation]:
+                operations[operation]["first_byte_ms"] = latency_summary(self.first_byte[operation])
+            if self.stages[operation]:
+                operations[operation]["stages_ms"] = {
+                    stage: latency_summary(durations) for stage, durations in self.stages[operation].items()
+                }
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "errors": failed,
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            "throughput_rps": round((total - failed) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": latency_summary(all_samples),
+            "operations": operations,
+        }
+
+
+async def send(client, operation, inputs, recorder, scheduled_at):
+    """Issue one request; latency counts from ``scheduled_at`` so queueing delay is not hidden."""
+    path, kwargs = build_request(operation, inputs)
+    status, timings, first_byte_ms, error = 0, None, None, None
+    try:
+        if operation == "analyze_stream":
+            async with client.stream("POST", path, **kwargs) as response:
+                status = response.status_code
+                async for chunk in response.aiter_bytes():
+                    if first_byte_ms is None:
+                        first_byte_ms = (time.perf_counter() - scheduled_at) * 1000
+                    if b"event: error" in chunk:
+                        error = "stream error event"
+        else:
+            response = await client.post(path, **kwargs)
+            status = response.status_code
+            timings = parse_server_timing(response.headers.get("server-timing"))
+    except httpx.TimeoutException:
+        error = "timeout"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    recorder.record(operation, status, (time.perf_counter() - scheduled_at) * 1000, timings, first_byte_ms, error)
+
+
+async def run_load(base_url, args, inputs, recorder):
+    mix = parse_mix(args.mix)
+    operations, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        budget = {"left": args.requests if args.requests else float("inf")}
+
+        def next_operation():
+            if budget["left"] <= 0 or time.perf_counter() >= stop_at:
+                return None
+            budget["left"] -= 1
+            return rng.choices(operations, weights)[0]
+
+        if args.rate:
+            # Open loop: arrivals keep coming whether or not earlier requests finished
+            semaphore = asyncio.Semaphore(args.concurrency)
+            tasks = []
+            next_at = started
+
+            async def arrival(operation, scheduled_at):
+                async with semaphore:
+                    await send(client, operation, inputs, recorder, scheduled_at)
+
+            while True:
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                operation = next_operation()
+                if operation is None:
+                    break
+                tasks.append(asyncio.ensure_future(arrival(operation, next_at)))
+                next_at += rng.expovariate(args.rate)
+            await asyncio.gather(*tasks)
+        else:
+            async def worker():
+                while True:
+                    operation = next_operation()
+                    if operation is None:
+                        return
+                    await send(client, operation, inputs, recorder, time.perf_counter())
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_backend(name, mock_url, keep_caches, workdir):
+    """Start a backend on a free port pointed at the stand-in; returns ``(process, base_url, log_path)``."""
+    port = _free_port()
+    env = dict(os.environ, PERPLEXITY_BASE_URL=mock_url, BACKEND_PORT=str(port))
+    env.setdefault("PERPLEXITY_API_KEY", "load-test")
+    # The debug reloader and debugger are not what production serves
+    env.setdefault("FLASK_DEBUG", "0")
+    if not keep_caches:
+        env.update({
+            "LLM_CACHE_ENABLED": "0",
+            "CLAIM_INDEX_ENABLED": "0",
+            "CITATION_GRAPH_PATH": ":memory:",
+            "PDF_TEXT_CACHE_DIR": str(Path(workdir) / "pdf_text"),
+            "JOB_STORE_PATH": str(Path(workdir) / "jobs.sqlite3"),
+        })
+    log_path = Path(workdir) / f"{name}.log"
+    process = subprocess.Popen(
+        [sys.executable, BACKENDS[name]],
+        cwd=UI_DIR,
+        env=env,
+        stdout=open(log_path, "w"),
+        stderr=subprocess.STDOUT,
+        # Its own process group, so the Flask reloader's child goes down with it
+        start_new_session=True,
+    )
+    return process, f"http://127.0.0.1:{port}", log_path
+
+
+def wait_until_ready(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code < 500:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def stop_backend(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def load_pdfs(args, workdir):
+    if args.pdf:
+        return [(Path(path).name, Path(path).read_bytes()) for path in args.pdf]
+    pdfs = []
+    for pages in args.pdf_pages:
+        path = Path(workdir) / f"sample_{pages}.pdf"
+        make_sample_pdf(path, pages=pages)
+        pdfs.append((path.name, path.read_bytes()))
+    return pdfs
+
+
+def print_report(report, previous=None):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s: "
+          f"{report['throughput_rps']} ok/s, error rate {report['error_rate']:.2%}")
+    header = f"{'operation':<22}{'reqs':>7}{'ok/s':>8}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header + ("   p95 vs previous" if previous else ""))
+    for operation, stats in report["operations"].items():
+        latency = stats["latency_ms"]
+        line = (
+            f"{operation:<22}{stats['requests']:>7}{stats['throughput_rps']:>8}{stats['error_rate'] * 100:>7.1f}"
+            + "".join(f"{latency[key] if latency[key] is not None else '-':>9}" for key in ("p50", "p95", "p99"))
+        )
+        before = ((previous or {}).get("operations") or {}).get(operation)
+        if before and before["latency_ms"]["p95"] and latency["p95"]:
+            line += f"   {(latency['p95'] - before['latency_ms']['p95']) / before['latency_ms']['p95']:+.1%}"
+        print(line)
+        for stage, summary in (stats.get("stages_ms") or {}).items():
+            print(f"  {stage:<20}{'':>22}" + "".join(f"{summary[key]:>9}" for key in ("p50", "p95", "p99")))
+    if previous:
+        print(f"throughput vs previous: {report['throughput_rps']} ok/s (was {previous.get('throughput_rps')})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the analysis backends")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running backend")
+    target.add_argument("--backend", choices=sorted(BACKENDS), help="spawn this backend against the stand-in")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients (closed loop) or max in flight (open loop)")
+    parser.add_argument("--rate", type=float, help="open-loop arrival rate in requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to generate load for")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--mix", default="analyze=8,extract_text=2", help="weighted operations, e.g. analyze=3,extract_text=1")
+    parser.add_argument("--claims", type=Path, help="file with one claim per line")
+    parser.add_argument("--pdf", action="append", help="PDF to upload (repeatable); default: generated samples")
+    parser.add_argument("--pdf-pages", type=lambda v: [int(p) for p in v.split(",")], default=[5, 40])
+    parser.add_argument("--unique-inputs", action="store_true", help="never repeat a claim or PDF, so caches never hit")
+    parser.add_argument("--keep-caches", action="store_true", help="leave the spawned backend's caches enabled")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--compare", type=Path, help="earlier JSON report to compare with")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    claims = DEFAULT_CLAIMS
+    if args.claims:
+        claims = [line.strip() for line in args.claims.read_text().splitlines() if line.strip()]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = Inputs(claims, load_pdfs(args, workdir), args.unique_inputs, args.seed)
+        mock, process = None, None
+        base_url = args.url
+        try:
+            if args.backend:
+                mock, mock_url = start_mock_server(**mock_options(args))
+                process, base_url, log_path = spawn_backend(args.backend, mock_url, args.keep_caches, workdir)
+                print(f"🚀 Starting {BACKENDS[args.backend]} on {base_url} (Perplexity stand-in at {mock_url})")
+                if not wait_until_ready(base_url, process):
+                    print(f"❌ Backend did not come up:\n{log_path.read_text()[-2000:]}")
+                    return 1
+            print(f"🔥 {'Open' if args.rate else 'Closed'}-loop load on {base_url}: mix {args.mix}, "
+                  f"concurrency {args.concurrency}" + (f", {args.rate}/s" if args.rate else ""))
+            recorder = Recorder()
+            elapsed = asyncio.run(run_load(base_url.rstrip("/"), args, inputs, recorder))
+        finally:
+            if process is not None:
+                stop_backend(process)
+            if mock is not None:
+                mock.shutdown()
+
+    report = recorder.report(elapsed)
+    report["config"] = {
+        "target": args.backend or args.url,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "duration": args.duration,
+        "requests": args.requests,
+        "mix": parse_mix(args.mix),
+        "unique_inputs": args.unique_inputs,
+        "keep_caches": args.keep_caches,
+        "mock": mock_options(args) if args.backend else None,
+    }
+    if mock is not None:
+        report["upstream_calls"] = mock.config.stats()
+
+    previous = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(report, previous)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"💾 Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Perplexity chat-completions API.
+
+Answers the agents' prompts with canned responses in the formats they parse
+(``PAPER n:`` / ``Title:`` / ``Excerpt:`` blocks, ``**"Title"**`` lists, JSON when a
+``response_format`` is sent), with configurable latency, error and 429 rates.
+Point the agents at it with PERPLEXITY_BASE_URL=http://127.0.0.1:<port>.
+
+    python bench/mock_perplexity.py --port 9911 --latency lognormal:300,0.4 --rate-limit-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = [
+    "Randomized Trial", "Meta-Analysis", "Cohort Study", "Replication Study",
+    "Systematic Review", "Longitudinal Analysis", "Cross-Sectional Survey", "Preregistered Experiment",
+]
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler (seconds) from ``fixed:MS``, ``uniform:LO,HI`` or
+    ``lognormal:MEDIAN,SIGMA`` (all times in milliseconds).
+    """
+    kind, _, args = (spec or "fixed:0").partition(":")
+    values = [float(value) for value in args.split(",") if value.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockConfig:
+    """Behaviour of the stand-in server; every rate is a probability per request."""
+
+    def __init__(self, latency="fixed:20", error_rate=0.0, rate_limit_rate=0.0, retry_after_ms=100,
+                 papers=4, citing=5, chunk_size=16, chunk_delay_ms=2, seed=0):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.papers = papers
+        self.citing = citing
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0, "streamed": 0}
+
+    def draw(self):
+        """Latency and fault for one request, drawn under the lock so runs are reproducible."""
+        with self.lock:
+            self.counts["requests"] += 1
+            latency = self.sample_latency(self.rng)
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return latency, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency, 500
+        return latency, None
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def _seed(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _titles(text, count, prefix):
+    rng = random.Random(_seed(text))
+    return [f"{prefix} {rng.choice(TOPICS)} of Effect {rng.randint(100, 999)}" for _ in range(count)]
+
+
+def contradiction_papers(claim, count):
+    papers = [
+        {"title": title, "excerpt": f"Contrary to the claim, this study found no support for: {claim[:80]}"}
+        for title in _titles(claim, count, "Contradicting")
+    ]
+    if len(papers) >= 3:
+        # A near-duplicate spelling, as real search results often contain
+        papers.append({"title": papers[0]["title"].upper() + ".", "excerpt": papers[0]["excerpt"]})
+    return papers
+
+
+def build_content(config, user, structured):
+    """Canned answer for one request, in the format the calling agent asks for."""
+    if user.startswith("Find papers citing each"):
+        works = re.findall(r"^PAPER (\d+): (.+)$", user, re.MULTILINE)
+        answers = [(int(number), _titles(title, config.citing, "Citing")) for number, title in works]
+        if structured:
+            return json.dumps({"works": [{"number": number, "citing_papers": titles} for number, titles in answers]})
+        return "\n\n".join(
+            f"PAPER {number}:\n" + "\n".join(f'- **"{title}"**' for title in titles) for number, titles in answers
+        )
+    if user.startswith("Find papers citing"):
+        titles = _titles(user, config.citing, "Citing")
+        if structured:
+            return json.dumps({"citing_papers": titles})
+        return "\n".join(f'{number}. **"{title}"**' for number, title in enumerate(titles, 1))
+    if user.startswith("Research claim") or user.startswith("Key claims"):
+        return (
+            "🚨 **FINAL VERDICT: The claim is contested by several recent studies**\n\n"
+            "🎯 **TOPICS TO INVESTIGATE:**\n1. Effect size heterogeneity\n2. Replication status\n\n"
+            "⚡ **STRATEGIC INSIGHT:** Prioritise the highly cited contradicting trials."
+        )
+    papers = contradiction_papers(user, config.papers)
+    if structured:
+        return json.dumps({"papers": papers})
+    return "\n\n".join(
+        f"PAPER {number}:\nTitle: {paper['title']}\nExcerpt: {paper['excerpt']}"
+        for number, paper in enumerate(papers, 1)
+    )
+
+
+def make_handler(config):
+    class MockPerplexityHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send_json(200, dict(config.stats(), latency=config.latency_spec))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            latency, fault = config.draw()
+            time.sleep(latency)
+            if fault == 429:
+                config.count("rate_limited")
+                self._send_json(
+                    429,
+                    {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                    {"retry-after-ms": str(config.retry_after_ms)},
+                )
+                return
+            if fault == 500:
+                config.count("errors")
+                self._send_json(500, {"error": {"message": "mock upstream error", "type": "server_error"}})
+                return
+
+            messages = body.get("messages") or []
+            user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+            content = build_content(config, user, bool(body.get("response_format")))
+            if body.get("stream"):
+                config.count("streamed")
+                self._stream(content)
+                return
+            prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+            completion_tokens = len(content) // 4
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        def _stream(self, content):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = [content[i:i + config.chunk_size] for i in range(0, len(content), config.chunk_size)]
+            for piece in pieces:
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "sonar",
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(config.chunk_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return MockPerplexityHandler
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """Serve on a background thread; returns ``(server, base_url)``. Stop it with ``server.shutdown()``."""
+    config = MockConfig(**options)
+    server = MockServer((host, port), make_handler(config))
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_mock_arguments(parser):
+    """Command-line options shared by everything that starts the stand-in server."""
+    parser.add_argument("--latency", default="fixed:20", help="fixed:MS, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--retry-after-ms", type=int, default=100, help="retry-after-ms sent with each 429")
+    parser.add_argument("--papers", type=int, default=4, help="contradicting papers per detection answer")
+    parser.add_argument("--citing", type=int, default=5, help="citing papers per cited work")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def mock_options(args):
+    return {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after_ms": args.retry_after_ms,
+        "papers": args.papers,
+        "citing": args.citing,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9911)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), make_handler(MockConfig(**mock_options(args))))
+    print(f"🧪 Mock Perplexity API on http://{args.host}:{args.port} (latency {args.latency})")
+    print(f"   export PERPLEXITY_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Mock server stopped")
+
+
+if __name__ == "__main__":
+    main()
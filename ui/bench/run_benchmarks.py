@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Per-stage benchmarks against the local Perplexity stand-in.
+
+Times detection, citation propagation, synthesis, response parsing/deduplication
+and PDF extraction separately, and compares each stage's median with the stored
+baseline. Exits with status 1 when any stage regressed beyond the tolerance.
+
+    python bench/run_benchmarks.py                    # compare with bench/baseline.json
+    python bench/run_benchmarks.py --update-baseline  # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.mock_perplexity import add_mock_arguments, contradiction_papers, mock_options, start_mock_server  # noqa: E402
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+STAGES = (
+    "detect_contradictions", "detect_long_text", "propagate_citations", "generate_synthesis", "parse_dedupe",
+    "pdf_extraction",
+)
+# Differences below this many milliseconds are noise, whatever the percentage
+MIN_REGRESSION_MS = 1.0
+
+CLAIM = "Daily coffee consumption improves long-term memory in healthy adults"
+SENTENCES = [
+    "We measured recall in a randomized cohort over twelve months.",
+    "Participants with higher intake showed no significant improvement.",
+    "The effect disappeared after adjusting for sleep duration and age.",
+    "Previous studies reported a twenty percent increase in recall scores.",
+]
+# Extracted text with no sentence breaks, so no claims can be mined from it
+UNMINABLE_TEXT = " ".join(["caffeine intake and memory recall in older adults over twelve months"] * 40)
+# A long text that takes longer than this never reached the single fallback search
+LONG_TEXT_TIMEOUT = 10.0
+
+
+def configure_environment(base_url):
+    """Point the agents at the stand-in and switch off every cache, so each call does the full work."""
+    os.environ["PERPLEXITY_BASE_URL"] = base_url
+    os.environ.setdefault("PERPLEXITY_API_KEY", "bench")
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ["CLAIM_INDEX_ENABLED"] = "0"
+    os.environ["CITATION_GRAPH_PATH"] = ":memory:"
+    # Pacing would measure the token bucket rather than the agents
+    os.environ["PERPLEXITY_RATE_LIMIT"] = "0"
+
+
+def make_sample_pdf(path, pages=40, lines_per_page=30):
+    """Write a plain text-only PDF of ``pages`` pages; long enough to use the extraction process pool."""
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for page in range(pages):
+        lines = [f"{page + 1}.{line + 1} {SENTENCES[(page + line) % len(SENTENCES)]}" for line in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 14 TL 50 760 Td " + " ".join(f"({line}) '" for line in lines) + " ET").encode("latin-1")
+        content_id, page_id = 4 + 2 * page, 5 + 2 * page
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref_at = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for object_id in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_at)
+    Path(path).write_bytes(bytes(out))
+
+
+def build_stages(workdir):
+    """Return ``{stage: (setup_iterations, callable(iteration))}``; imported late so the environment applies."""
+    from agents.citation_propagator import _parse_batch_response, _parse_citing_papers, propagate_citations
+    from agents.contradiction_detector import _parse_contradictions, detect_contradictions, detect_contradictions_async
+    from agents.paper_titles import dedupe_papers
+    from agents.pdf_extractor import extract_pdf_text
+    from agents.perplexity_client import submit_coroutine
+    from agents.severity_assessor import generate_synthesis
+
+    papers = contradiction_papers(CLAIM, 4)[:4]
+    cascades = {paper["title"]: [f"Citing work {n}" for n in range(5)] for paper in papers}
+    detection_text = "\n\n".join(
+        f"PAPER {n}:\nTitle: {paper['title']}\nExcerpt: {paper['excerpt']}" for n, paper in enumerate(papers * 5, 1)
+    )
+    detection_json = json.dumps({"papers": papers * 5})
+    citing_text = "\n".join(f'{n}. **"Citing Study Number {n} On Memory"**' for n in range(1, 21))
+    batch_text = "\n\n".join(
+        f"PAPER {n}:\n" + "\n".join(f'- **"Citing Work {n}.{m}"**' for m in range(5)) for n in range(1, 9)
+    )
+    many_papers = [
+        {"title": f"{prefix} Study of Memory and Caffeine {n % 150}", "excerpt": "x"}
+        for n in range(300) for prefix in ("A", "The")
+    ]
+    pdf_path = Path(workdir) / "sample.pdf"
+    make_sample_pdf(pdf_path)
+
+    def parse_dedupe(iteration):
+        _parse_contradictions(detection_text)
+        _parse_contradictions(detection_json)
+        _parse_citing_papers(citing_text, papers[0]["title"])
+        _parse_batch_response(batch_text, [f"Work {n}" for n in range(1, 9)])
+        dedupe_papers(many_papers)
+
+    def detect_long_text(iteration):
+        # Nothing to mine: detection must fall back to one search over a prefix, not loop
+        future = submit_coroutine(detect_contradictions_async(f"{UNMINABLE_TEXT} run {iteration}"))
+        try:
+            return future.result(timeout=LONG_TEXT_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise RuntimeError(f"Detection on unminable long text took over {LONG_TEXT_TIMEOUT:.0f}s") from None
+
+    return {
+        # Each iteration sends a new claim so in-flight coalescing never short-circuits a call
+        "detect_contradictions": lambda i: detect_contradictions(f"{CLAIM} (run {i})"),
+        "detect_long_text": detect_long_text,
+        "propagate_citations": lambda i: propagate_citations(
+            [dict(paper, title=f"{paper['title']} {i}") for paper in papers]
+        ),
+        "generate_synthesis": lambda i: generate_synthesis(f"{CLAIM} (run {i})", papers, cascades),
+        "parse_dedupe": parse_dedupe,
+        "pdf_extraction": lambda i: extract_pdf_text(str(pdf_path)),
+    }
+
+
+def time_stage(run, iterations, warmup=1):
+    for i in range(warmup):
+        run(-1 - i)
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        run(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "iterations": iterations,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Attach the baseline median and a status (ok / regressed / improved / new) to each stage's result."""
+    regressed = []
+    for stage, result in results.items():
+        previous = (baseline.get("stages") or {}).get(stage)
+        if not previous:
+            result["status"] = "new"
+            continue
+        before, now = previous["median_ms"], result["median_ms"]
+        result["baseline_ms"] = before
+        result["change"] = round((now - before) / before, 3) if before else 0.0
+        if now > before * (1 + tolerance) and now - before > MIN_REGRESSION_MS:
+            result["status"] = "regressed"
+            regressed.append(stage)
+        elif now < before * (1 - tolerance) and before - now > MIN_REGRESSION_MS:
+            result["status"] = "improved"
+        else:
+            result["status"] = "ok"
+    return regressed
+
+
+def print_report(results):
+    print(f"\n{'stage':<24}{'median ms':>12}{'p95 ms':>12}{'baseline':>12}{'change':>10}  status")
+    for stage, result in results.items():
+        baseline = f"{result['baseline_ms']:.1f}" if "baseline_ms" in result else "-"
+        change = f"{result['change'] * 100:+.1f}%" if "change" in result else "-"
+        print(
+            f"{stage:<24}{result['median_ms']:>12.1f}{result['p95_ms']:>12.1f}{baseline:>12}{change:>10}  "
+            f"{result['status']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks against the local Perplexity stand-in")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown of a stage's median")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(**mock_options(args))
+    configure_environment(base_url)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            stages = build_stages(workdir)
+            results = {}
+            for stage in args.stages:
+                print(f"⏱️ Benchmarking {stage} ({args.iterations} iterations)...")
+                results[stage] = time_stage(stages[stage], args.iterations)
+    finally:
+        server.shutdown()
+
+    config = {"latency": args.latency, "papers": args.papers, "citing": args.citing}
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if baseline.get("config") and baseline["config"] != config:
+        print(f"⚠️ Baseline was recorded with {baseline['config']}; comparisons may not be meaningful")
+    regressed = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps({"config": config, "stages": results, "regressed": regressed}, indent=2))
+    else:
+        print_report(results)
+
+    if args.update_baseline:
+        stored = dict(baseline.get("stages") or {})
+        stored.update({stage: {"median_ms": r["median_ms"], "p95_ms": r["p95_ms"]} for stage, r in results.items()})
+        args.baseline.write_text(json.dumps({
+            "config": config,
+            "python": platform.python_version(),
+            "stages": stored,
+        }, indent=2) + "\n")
+        print(f"💾 Baseline written to {args.baseline}")
+        return 0
+    if regressed:
+        print(f"❌ Regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+        return 1
+    print("✅ No stage regressed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,131 +4,362 @@ Simple backend server for Research Integrity Network
 Directly calls the agents without complex FastAPI setup
 """
 
+import logging
 import os
 import sys
+import time
 from pathlib import Path
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from PyPDF2 import PdfReader
-import io
-from dotenv import load_dotenv
-
-# Load environment variables from the project root
-project_root = Path(__file__).parent.parent
-env_path = project_root / ".env"
-load_dotenv(env_path, override=True)
 
 # Add the ui directory to the Python path so we can import the agents
 sys.path.append(str(Path(__file__).parent))
 
-# Import the agent functions
-from agents.contradiction_detector import detect_contradictions
-from agents.citation_propagator import propagate_citations
-from agents.severity_assessor import generate_synthesis
+# Import the agent functions; agents.config loads the project's .env
+from agents.config import BACKEND_PORT, FLASK_DEBUG, PERPLEXITY_API_KEY
+from agents.perplexity_client import iter_sync, pool_stats, run_sync, warm_up
+from agents.upstream import UpstreamError, upstream_stats
+from agents.structured_output import parse_stats
+from agents.llm_cache import cache_stats
+from agents.claim_index import claim_index_stats
+from agents.singleflight import singleflight_stats
+from agents.citation_propagator import citation_stats, collect_paper_titles, expand_cascade_async
+from agents.citation_graph import get_citation_graph
+from agents.pipeline import (
+    analyze_claim as run_analysis_pipeline, analyze_claim_events, format_server_timing, format_sse, parse_deadline_ms,
+)
+from agents.job_queue import QueueFullError, get_job_queue, FINISHED_STATES, SUCCEEDED
+from agents.pdf_extractor import (
+    PDFLimitError, discard_upload, extract_pdf_text_cached, iter_pdf_pages_cached, spool_upload,
+)
+from agents.pdf_text_cache import get_pdf_text_cache, is_valid_digest
+from agents.telemetry import (
+    configure_logging, finish_trace, get_trace, observe_request, recent_traces, render_metrics, start_trace,
+)
+
+configure_logging()
+logger = logging.getLogger("simple_backend")
 
 app = Flask(__name__)
 CORS(app)  # Allow all origins for simplicity
 
-def extract_text_from_pdf(pdf_content):
-    """Extract text from PDF content"""
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count requests and time them (to response headers, for streams) per route"""
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        observe_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+def extract_text_from_pdf(pdf_path, digest):
+    """Extract text from a spooled PDF file, reusing cached text for previously seen bytes"""
     try:
-        pdf_reader = PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return text.strip()
+        return extract_pdf_text_cached(pdf_path, digest)
+    except PDFLimitError:
+        raise
     except Exception as e:
-        print(f"Error extracting text from PDF: {str(e)}")
+        logger.error("Error extracting text from PDF: %s", e)
         return ""
 
 @app.route('/')
 def root():
     return {"message": "Research Integrity Network API is running"}
 
+@app.route('/pool_stats')
+def pool_stats_endpoint():
+    """Report Perplexity connection pool usage"""
+    return jsonify(pool_stats())
+
+@app.route('/upstream_stats')
+def upstream_stats_endpoint():
+    """Report the adaptive concurrency window, circuit breaker state, and retry counters"""
+    return jsonify(upstream_stats())
+
+def upstream_unavailable(e):
+    """503 for a Perplexity outage, so clients retry instead of trusting an empty result"""
+    retry_after = str(max(1, int(e.retry_after or 5)))
+    return jsonify({"error": f"Analysis failed: {str(e)}"}), 503, {"Retry-After": retry_after}
+
+@app.route('/parse_stats')
+def parse_stats_endpoint():
+    """Report per stage how many responses parsed as JSON, needed the text fallback, or failed to parse"""
+    return jsonify(parse_stats())
+
+@app.route('/cache_stats')
+def cache_stats_endpoint():
+    """Report LLM response cache and similar-claim index hit rates"""
+    return jsonify(dict(cache_stats(), singleflight=singleflight_stats(), claim_index=claim_index_stats()))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: stage/upstream latency histograms, calls, tokens, parse outcomes, cache counters"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/traces')
+def traces_endpoint():
+    """List the most recently recorded traces (X-Trace: 1 or TRACE_SAMPLE_RATE)"""
+    return jsonify({"traces": recent_traces(int(request.args.get('limit', 20)))})
+
+@app.route('/traces/<trace_id>')
+def trace_endpoint(trace_id):
+    """Return one trace's spans, with offsets and durations in milliseconds"""
+    trace = get_trace(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace)
+
+def request_deadline_ms(data):
+    """
+    Per-request time budget from the body's deadline_ms, else the X-Deadline-Ms header:
+    (deadline_ms, None), or (None, error response) for a malformed value
+    """
+    value = (data or {}).get('deadline_ms')
+    if value is None:
+        value = request.headers.get('X-Deadline-Ms')
+    try:
+        return parse_deadline_ms(value), None
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
 @app.route('/analyze', methods=['POST'])
 def analyze_claim():
-    """Main endpoint that runs the full analysis pipeline"""
+    """Main endpoint that runs the full analysis pipeline; send X-Trace: 1 to record its spans"""
+    trace = start_trace("analyze", force=request.headers.get('X-Trace') == "1")
     try:
         data = request.get_json()
         claim = data.get('claim', '').strip()
         
         if not claim:
             return jsonify({"error": "No claim provided"}), 400
+        deadline_ms, error = request_deadline_ms(data)
+        if error:
+            return error
         
-        print(f"🔍 Analyzing claim: {claim[:100]}...")
-        
-        # Check if API key is loaded
-        import os
-        api_key = os.getenv("PERPLEXITY_API_KEY")
-        print(f"🔑 API Key loaded: {'Yes' if api_key and api_key != 'your_perplexity_api_key_here' else 'No'}")
-        if api_key:
-            print(f"🔑 API Key starts with: {api_key[:10]}...")
-        
-        # Step 1: Detect contradictions
-        print("📊 Step 1: Detecting contradictions...")
-        contradictions = detect_contradictions(claim)
-        print(f"Found {len(contradictions)} contradictory papers")
-        if contradictions:
-            for i, paper in enumerate(contradictions):
-                print(f"  Paper {i+1}: {paper.get('title', 'No title')[:50]}...")
-        
-        # Step 2: Propagate citations
-        citation_cascades = {}
-        if contradictions:
-            print("📚 Step 2: Propagating citations...")
-            citation_cascades = propagate_citations(contradictions)
-            print(f"Found citation cascades for {len(citation_cascades)} papers")
-        
-        # Step 3: Generate synthesis
-        print("💡 Step 3: Generating synthesis...")
-        synthesis = generate_synthesis(claim, contradictions, citation_cascades)
-        
-        # Return all results
-        result = {
-            "claim": claim,
-            "contradictions": contradictions,
-            "citation_cascades": citation_cascades,
-            "synthesis": synthesis
-        }
-        
-        print("✅ Analysis complete!")
-        return jsonify(result)
+        logger.info("🔍 Analyzing claim: %.100s", claim)
         
+        # Detect → propagate → synthesize; identical in-flight claims share one run
+        result = run_analysis_pipeline(
+            claim,
+            deadline_ms,
+            data.get('max_citation_papers'),
+            data.get('triage_top_k'),
+            data.get('triage_min_score'),
+        )
+        timings = result.pop("timings", None)
+        logger.info(
+            "✅ Analysis complete: %d contradictory papers, citation cascades for %d papers (%s)",
+            len(result["contradictions"]), len(result["citation_cascades"]), format_server_timing(timings),
+        )
+        logger.debug("Contradictions: %s", result["contradictions"])
+        headers = {"Server-Timing": format_server_timing(timings)}
+        if trace is not None:
+            headers["X-Trace-Id"] = trace.id
+        return jsonify(result), 200, headers
+
+    except UpstreamError as e:
+        logger.error("❌ Perplexity unavailable: %s", e)
+        return upstream_unavailable(e)
     except Exception as e:
-        print(f"❌ Error in analysis: {str(e)}")
+        logger.error("❌ Error in analysis: %s", e)
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+    finally:
+        finish_trace(trace)
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_claim_stream():
+    """Run the full analysis pipeline, streaming each stage as a server-sent event"""
+    data = request.get_json()
+    claim = (data or {}).get('claim', '').strip()
+
+    if not claim:
+        return jsonify({"error": "No claim provided"}), 400
+
+    deadline_ms, error = request_deadline_ms(data)
+    if error:
+        return error
+    max_citation_papers = data.get('max_citation_papers')
+    triage_top_k = data.get('triage_top_k')
+    triage_min_score = data.get('triage_min_score')
+
+    def event_stream():
+        try:
+            events = analyze_claim_events(claim, deadline_ms, max_citation_papers, triage_top_k, triage_min_score)
+            for event, payload in iter_sync(events):
+                yield format_sse(event, payload)
+        except Exception as e:
+            logger.error("❌ Error in streaming analysis: %s", e)
+            yield format_sse("error", {"detail": f"Analysis failed: {str(e)}"})
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/citation_graph', methods=['POST'])
+def citation_graph():
+    """Expand a multi-hop citation cascade from the contradicted papers, reusing stored edges"""
+    data = request.get_json() or {}
+    try:
+        cascade = run_sync(expand_cascade_async(
+            collect_paper_titles(data.get('contradictions', [])),
+            depth=data.get('depth'),
+            max_nodes=data.get('max_nodes'),
+            batch_size=data.get('batch_size'),
+        ))
+        return jsonify(cascade)
+    except UpstreamError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        logger.error("❌ Error expanding citation graph: %s", e)
+        return jsonify({"error": f"Citation graph expansion failed: {str(e)}"}), 500
+
+@app.route('/citation_stats')
+def citation_stats_endpoint():
+    """Compare per-paper and batched citation lookups: round trips, tokens, latency, fallbacks"""
+    return jsonify(citation_stats())
+
+@app.route('/citation_graph/stats')
+def citation_graph_stats():
+    """Report how many papers and citation edges the graph store holds"""
+    return jsonify(get_citation_graph().stats())
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a full analysis in the background and return its job ID"""
+    data = request.get_json() or {}
+    claim = data.get('claim', '').strip()
+
+    if not claim:
+        return jsonify({"error": "No claim provided"}), 400
+
+    try:
+        return jsonify(get_job_queue().submit(claim, int(data.get('priority', 0)))), 202
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Report queue depth, worker usage, and wait/run time percentiles"""
+    return jsonify(get_job_queue().stats())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll the status of a background analysis"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def get_job_result(job_id):
+    """Fetch the result of a finished background analysis"""
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] not in FINISHED_STATES:
+        return jsonify({"error": f"Job is still {job['status']}"}), 409
+    if job["status"] != SUCCEEDED:
+        return jsonify({"error": f"Job {job['status']}: {job['error'] or 'no result'}"}), 410
+    return jsonify(job_queue.result(job_id))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running background analysis"""
+    job_queue = get_job_queue()
+    if not job_queue.cancel(job_id):
+        return jsonify({"error": "Job not found or already finished"}), 404
+    return jsonify(job_queue.get(job_id))
+
+def _validate_pdf_upload():
+    """Return (file, None) for a valid PDF upload, or (None, error response)"""
+    if 'file' not in request.files:
+        return None, (jsonify({"error": "No file provided"}), 400)
+    
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({"error": "No file selected"}), 400)
+    
+    if not file.filename.lower().endswith('.pdf'):
+        return None, (jsonify({"error": "File must be a PDF"}), 400)
+
+    return file, None
 
 @app.route('/extract_text', methods=['POST'])
 def extract_text():
     """Extract text from uploaded PDF"""
+    pdf_path = None
     try:
-        if 'file' not in request.files:
-            return jsonify({"error": "No file provided"}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-        
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({"error": "File must be a PDF"}), 400
+        file, error = _validate_pdf_upload()
+        if error:
+            return error
         
-        # Read the PDF file
-        pdf_content = file.read()
-        text = extract_text_from_pdf(pdf_content)
+        # Spool the upload to disk instead of holding it in memory
+        pdf_path, digest = spool_upload(file.stream)
+        text = extract_text_from_pdf(pdf_path, digest)
         
-        return jsonify({"text": text})
+        return jsonify({"text": text, "sha256": digest})
         
+    except PDFLimitError as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
-        print(f"Error extracting text: {str(e)}")
+        logger.error("Error extracting text: %s", e)
         return jsonify({"error": f"Error extracting text: {str(e)}"}), 500
+    finally:
+        if pdf_path:
+            os.unlink(pdf_path)
+
+@app.route('/extract_text/<sha256>', methods=['GET'])
+def extract_text_by_hash(sha256):
+    """Return previously extracted text for a PDF by the SHA-256 of its bytes (404 on a miss)"""
+    sha256 = sha256.lower()
+    if not is_valid_digest(sha256):
+        return jsonify({"error": "Expected a hex SHA-256 digest"}), 400
+    text = get_pdf_text_cache().get_text(sha256)
+    if text is None:
+        return jsonify({"error": "No extracted text for this PDF"}), 404
+    return jsonify({"text": text, "sha256": sha256})
+
+@app.route('/extract_text/stream', methods=['POST'])
+def extract_text_stream():
+    """Extract text from uploaded PDF, streaming one NDJSON line per page"""
+    file, error = _validate_pdf_upload()
+    if error:
+        return error
+
+    try:
+        pdf_path, digest = spool_upload(file.stream)
+    except PDFLimitError as e:
+        return jsonify({"error": str(e)}), 413
+
+    def page_lines():
+        try:
+            for page_number, page_text in iter_pdf_pages_cached(pdf_path, digest):
+                yield json.dumps({"page": page_number, "text": page_text}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error extracting text: {str(e)}"}) + "\n"
+        finally:
+            discard_upload(pdf_path)
+
+    response = Response(page_lines(), mimetype="application/x-ndjson")
+    # Runs when the server closes the response, even if the client left before the body started
+    response.call_on_close(lambda: discard_upload(pdf_path))
+    return response
 
 if __name__ == "__main__":
     print("🚀 Starting Research Integrity Network Backend...")
-    print("📍 Backend will be available at: http://localhost:8501")
+    print(f"📍 Backend will be available at: http://localhost:{BACKEND_PORT}")
     print("📍 Frontend should be running at: http://localhost:3000")
-    print("📝 Make sure you have set up your .env file with PERPLEXITY_API_KEY")
+    if not PERPLEXITY_API_KEY:
+        print("⚠️ PERPLEXITY_API_KEY is not set; analyses will fail until it is added to your .env file")
     print("=" * 60)
     
-    app.run(host="0.0.0.0", port=8501, debug=True)
+    warm_up()
+    app.run(host="0.0.0.0", port=BACKEND_PORT, debug=FLASK_DEBUG)
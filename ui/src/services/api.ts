@@ -5,6 +5,17 @@ const API_BASE_URL = 'http://localhost:8501';
 export const api = {
   async extractTextFromPDF(file: File): Promise<string> {
     try {
+      // Ask for previously extracted text by content hash before uploading the whole file
+      const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+      const sha256 = Array.from(new Uint8Array(digest))
+        .map((byte) => byte.toString(16).padStart(2, '0'))
+        .join('');
+      const cached = await fetch(`${API_BASE_URL}/extract_text/${sha256}`);
+      if (cached.ok) {
+        const data = await cached.json();
+        return data.text;
+      }
+
       const formData = new FormData();
       formData.append('file', file);
       
@@ -101,42 +112,105 @@ export const api = {
     onPartialResult: (result: Partial<AnalysisResult>) => void
   ): Promise<AnalysisResult> {
     try {
-      // Step 1: Agent 1 - Detect contradictions
-      setCurrentStep('analyzing-start');
-      await new Promise(resolve => setTimeout(resolve, 500));
-      
+      // One streaming request; the backend emits each stage as soon as it finishes
       setCurrentStep('deep-search');
-      const contradictions = await this.detectContradictions(claim);
-      
-      setCurrentStep('validating-sources');
-      await new Promise(resolve => setTimeout(resolve, 800));
-      
-      // Show partial results after Step 1
-      onPartialResult({ claim, contradictions, citationCascades: {}, synthesis: '' });
-      
-      // Step 2: Agent 2 - Propagate citations
-      setCurrentStep('citation-mapping');
-      const citations = await this.propagateCitations(contradictions);
-      
-      setCurrentStep('impact-analysis');
-      await new Promise(resolve => setTimeout(resolve, 600));
-      
-      // Show partial results after Step 2
-      onPartialResult({ claim, contradictions, citationCascades: citations, synthesis: '' });
-      
-      // Step 3: Agent 3 - Generate synthesis
-      setCurrentStep('synthesis-prep');
-      await new Promise(resolve => setTimeout(resolve, 400));
-      
-      setCurrentStep('generating-strategy');
-      const synthesis = await this.generateSynthesis(contradictions, citations, claim);
-      
-      return {
-        claim,
-        contradictions,
-        citationCascades: citations,
-        synthesis
+      const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({ claim }),
+      });
+
+      if (!response.ok || !response.body) {
+        throw new Error(`Failed to analyze claim: ${response.status}`);
+      }
+
+      let contradictions: Paper[] = [];
+      // Titles the server chose to search citations for; triage and deadlines make this a subset
+      let selected: string[] | null = null;
+      const citationCascades: CitationCascade = {};
+      let synthesis = '';
+      let result = null as AnalysisResult | null;
+
+      const citationsDone = () => selected !== null && selected.every((title) => title in citationCascades);
+
+      const handleEvent = (event: string, data: any) => {
+        switch (event) {
+          case 'contradiction':
+            // Papers arrive one by one while detection is still running
+            contradictions = [...contradictions, data];
+            onPartialResult({ claim, contradictions, citationCascades: { ...citationCascades }, synthesis: '' });
+            setCurrentStep('citation-mapping');
+            break;
+          case 'contradictions':
+            contradictions = data.contradictions || [];
+            onPartialResult({ claim, contradictions, citationCascades: { ...citationCascades }, synthesis: '' });
+            break;
+          case 'triage':
+            selected = data.selected || [];
+            if (citationsDone()) {
+              setCurrentStep('generating-strategy');
+            }
+            break;
+          case 'citations':
+            citationCascades[data.title] = data.citing_papers || [];
+            onPartialResult({ claim, contradictions, citationCascades: { ...citationCascades }, synthesis: '' });
+            if (citationsDone()) {
+              setCurrentStep('generating-strategy');
+            }
+            break;
+          case 'synthesis_delta':
+            // Also reached when a deadline cut the citation lookups short
+            setCurrentStep('generating-strategy');
+            synthesis += data.text || '';
+            onPartialResult({ claim, contradictions, citationCascades: { ...citationCascades }, synthesis });
+            break;
+          case 'done':
+            result = {
+              claim,
+              contradictions: data.contradictions || contradictions,
+              citationCascades: data.citation_cascades || citationCascades,
+              synthesis: data.synthesis || 'Unable to generate synthesis. Please try again.',
+            };
+            break;
+          case 'error':
+            throw new Error(data.detail || 'Analysis failed');
+        }
       };
+
+      // Parse the server-sent event stream as it arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
+
+          let event = 'message';
+          const dataLines: string[] = [];
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+          }
+          if (dataLines.length > 0) {
+            handleEvent(event, JSON.parse(dataLines.join('\n')));
+          }
+        }
+      }
+
+      if (!result) {
+        throw new Error('Analysis stream ended before completion');
+      }
+      return result;
     } catch (error) {
       console.error('Error analyzing claim:', error);
       throw error;